@@ -32,6 +32,7 @@ if TYPE_CHECKING:
 
 RecordDict = Mapping[str, Any]
 RecordID = Union[int, str]
+BlockKey = Union[str, int]
 RecordIDDType = Union[Type[int], Tuple[Type[str], Literal[256]]]
 RecordIDPair = Union[Tuple[int, int], Tuple[str, str]]
 RecordInt = Tuple[int, RecordDict]
@@ -72,6 +73,9 @@ LookupResultsStr = Iterable[Tuple[str, Tuple[Tuple[str, float], ...]]]
 LookupResults = Union[LookupResultsInt, LookupResultsStr]
 JoinConstraint = Literal["one-to-one", "many-to-one", "many-to-many"]
 Comparator = Callable[[Any, Any], Union[Union[int, float], Sequence[Union[int, float]]]]
+# Takes two equally long columns of field values and computes a
+# (n_samples,) or (n_samples X n_features) array of distances
+BatchComparator = Callable[[Sequence[Any], Sequence[Any]], numpy.typing.NDArray[Any]]
 Scores = Union[numpy.memmap, numpy.ndarray]
 Labels = List[Literal[0, 1]]
 LabelsLike = Iterable[Literal[0, 1]]
@@ -94,6 +98,8 @@ VariableDefinition = TypedDict(
         "categories": List[str],
         "interaction variables": List[str],
         "has missing": bool,
+        "cache size": int,
+        "neighborhood": bool,
         "name": str,
     },
     total=False,
@@ -111,26 +117,35 @@ FeaturizerFunction = Callable[
 ]
 
 
-class Classifier(Protocol):
+class Scorer(Protocol):
     """Takes an array of pairwise distances and computes the likelihood they are a pair."""
 
-    def fit(self, X: numpy.typing.NDArray[numpy.float_], y: LabelsLike) -> None:
-        ...
-
     def predict_proba(
         self, X: numpy.typing.NDArray[numpy.float_]
     ) -> numpy.typing.NDArray[numpy.float_]:
         ...
 
 
-class ClosableJoinable(Protocol):
-    def close(self) -> None:
+class Classifier(Scorer, Protocol):
+    """A scorer that can be fit to labelled pairwise distances."""
+
+    def fit(self, X: numpy.typing.NDArray[numpy.float_], y: LabelsLike) -> None:
+        ...
+
+
+class ScoringJob(Protocol):
+    """A job that the workers of a scoring pool run on chunks of pairs."""
+
+    def start(
+        self, featurizer: FeaturizerFunction, classifier: Scorer, worker_id: int
+    ) -> None:
         ...
 
-    def join(self) -> None:
+    def __call__(self, __chunk: Any) -> Any:
         ...
 
+    def finish(self) -> None:
+        ...
 
-MapLike = Callable[[Callable[[Any], Any], Iterable], Iterable]
 
 PathLike = Union[str, os.PathLike]
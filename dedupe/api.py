@@ -6,12 +6,12 @@ Dedupe class
 """
 from __future__ import annotations
 
+import bisect
 import itertools
 import logging
 import multiprocessing
 import os
 import pickle
-import sqlite3
 import tempfile
 import warnings
 from typing import TYPE_CHECKING, cast, overload
@@ -20,23 +20,30 @@ import numpy
 import sklearn.linear_model
 import sklearn.model_selection
 
+import dedupe.backends as backends
 import dedupe.blocking as blocking
+import dedupe.blocking_stats as blocking_stats
 import dedupe.clustering as clustering
 import dedupe.core as core
 import dedupe.datamodel as datamodel
 import dedupe.labeler as labeler
 import dedupe.predicates
 import dedupe.serializer as serializer
+import dedupe.sharding as sharding
 from dedupe._typing import Literal
 
 if TYPE_CHECKING:
     from typing import (
+        Any,
         BinaryIO,
+        Callable,
         Collection,
         Generator,
         Iterable,
+        Iterator,
         MutableMapping,
         TextIO,
+        TypeVar,
         Union,
     )
 
@@ -44,6 +51,7 @@ if TYPE_CHECKING:
 
     from dedupe._typing import (
         ArrayLinks,
+        BlockKey,
         Blocks,
         BlocksInt,
         BlocksStr,
@@ -54,35 +62,86 @@ if TYPE_CHECKING:
         Data,
         DataInt,
         DataStr,
+        FeaturizerFunction,
         JoinConstraint,
         LabelsLike,
         Links,
         LookupResultsInt,
         LookupResultsStr,
-        PathLike,
+        Record,
         RecordDict,
     )
     from dedupe._typing import RecordDictPair as TrainingExample
     from dedupe._typing import RecordDictPairs as TrainingExamples
     from dedupe._typing import (
         RecordID,
+        RecordIDPair,
         RecordPairs,
+        Scorer,
         Scores,
         TrainingData,
         TupleLinks,
         VariableDefinition,
     )
 
+    _M = TypeVar("_M", bound="Matching")
+    Records = Union[Data, core.RecordStore]
+
 logger = logging.getLogger(__name__)
 
+# the most records that are sent to every scoring process along with
+# the pairs to score, instead of being written to a store on disk
+MAX_IN_MEMORY_RECORDS = 10000
+
 
 class Matching(object):
     """
     Base Class for Record Matching Classes
+
+    Pairs of records are sent to the scoring processes in chunks,
+    whose size adapts to how long the processes take to score them.
+    The :class:`dedupe.core.ChunkSizer` doing this is available as
+    the `chunk_sizer` attribute, to inspect the chosen chunk sizes or
+    to replace it with one with different bounds.
+
+    If the `cascade` attribute is set to True, and the classifier is a
+    logistic regression, then methods that score pairs with a
+    threshold, like :meth:`join`, first bound the scores the pairs
+    could get from the cheap variables alone, and only compare the
+    expensive variables, like strings, for pairs that could score
+    above the threshold. The results are the same.
+
+    When the classifier is a logistic regression, variables whose
+    weights are zero, and that no weighted interaction or missing-data
+    indicator depends on, are not compared at all when scoring. Weights
+    whose absolute value is at most the `negligible_weight` attribute
+    are treated as zero. It is 0 by default, and the default logistic
+    regression, with an L2 penalty, practically never gives a weight of
+    exactly zero, so no variable is skipped unless `negligible_weight`
+    is set. Treating a weight as zero changes the log odds of a pair by
+    the weight times the distance of that feature, so scores change by
+    at most a quarter of that.
+
+    If the `hash_block_keys` attribute is set to True, records are
+    fingerprinted into 64 bit integer block keys instead of strings,
+    see :class:`dedupe.blocking.Fingerprinter`, which makes them
+    cheaper to store and join. A gazetteer must be indexed and
+    searched with the same setting.
+
+    If the `max_block_size` attribute is set, blocks of more records
+    than that, counting the records of both datasets when linking, are
+    skipped when pairing up records, so that a very common block key
+    can't make a huge number of pairs. The skipped blocks are listed by
+    :attr:`oversized_blocks`. Pairs of records that also share a
+    smaller block are still made.
     """
 
     def __init__(
-        self, num_cores: int | None, in_memory: bool = False, **kwargs
+        self,
+        num_cores: int | None,
+        in_memory: bool = False,
+        blocking_backend: backends.BlockingBackend | None = None,
+        **kwargs,
     ) -> None:
         if num_cores is None:
             self.num_cores = multiprocessing.cpu_count()
@@ -94,6 +153,180 @@ class Matching(object):
         self.data_model: datamodel.DataModel
         self.classifier: Classifier
         self.predicates: Collection[dedupe.predicates.Predicate]
+        self._compiled_classifier: tuple[
+            Classifier, bytes, float, Scorer, FeaturizerFunction
+        ] | None = None
+        self._pool: core.ScoringPool | None = None
+        self.chunk_sizer = core.ChunkSizer()
+        self.cascade = False
+        self.negligible_weight = 0.0
+        self.hash_block_keys = False
+        self.max_block_size: int | None = None
+
+        if blocking_backend is None:
+            blocking_backend = backends.SQLiteBackend(in_memory)
+        self.blocking_backend = blocking_backend
+
+    def close(self) -> None:
+        """
+        Stop the scoring processes of the matcher. The matcher can
+        still be used afterwards, and will start new processes when
+        it needs them.
+
+        Examples:
+            >>> with dedupe.StaticGazetteer(settings_file) as matcher:
+            >>>     for record in messy_records:
+            >>>         matcher.search(record)
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self: _M) -> _M:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _cascade(self) -> datamodel.Cascade | None:
+        """
+        When `cascade` is on and the classifier is linear, we can skip
+        the expensive comparators for pairs that can't score above
+        the threshold of a call.
+        """
+        scorer = self._scorer
+        if not self.cascade or not isinstance(scorer, core.LinearScorer):
+            return None
+
+        return datamodel.Cascade(self.data_model, scorer.coef, float(scorer.intercept))
+
+    def _scoring_pool(self) -> core.ScoringPool | None:
+        """
+        The long-lived pool of scoring processes, which is started on
+        first use, so that the data model and classifier are only sent
+        to the processes once. The pool is restarted if the data model
+        or classifier change. There is no pool when scoring in a
+        single process.
+        """
+        if self.num_cores < 2:
+            return None
+
+        featurizer = self._featurizer
+        scorer = self._scorer
+
+        pool = self._pool
+        if (
+            pool is None
+            or pool.closed
+            or pool.featurizer != featurizer
+            or pool.classifier is not scorer
+        ):
+            self.close()
+            pool = self._pool = core.ScoringPool(featurizer, scorer, self.num_cores)
+
+        return pool
+
+    @property
+    def _scorer(self) -> Scorer:
+        """
+        A fast, compiled version of the classifier for scoring, see
+        :func:`dedupe.core.compile_classifier`. The classifier itself
+        stays available for inspection.
+        """
+        return self._compiled()[3]
+
+    @property
+    def _featurizer(self) -> FeaturizerFunction:
+        """
+        The distances the compiled classifier needs, which skips the
+        variables it gives no weight to, see
+        :class:`dedupe.datamodel.FeaturePlan`
+        """
+        return self._compiled()[4]
+
+    def _compiled(
+        self,
+    ) -> tuple[Classifier, bytes, float, Scorer, FeaturizerFunction]:
+        # the classifier can be refit in place, outside of train(), so
+        # its weights are checked as well as its identity
+        if (
+            self._compiled_classifier is None
+            or self._compiled_classifier[0] is not self.classifier
+            or self._compiled_classifier[1] != _weights(self.classifier)
+            or self._compiled_classifier[2] != self.negligible_weight
+        ):
+            self._compile_classifier()
+
+        assert self._compiled_classifier is not None
+        return self._compiled_classifier
+
+    def _compile_classifier(self) -> None:
+        scorer = core.compile_classifier(self.classifier)
+        featurizer: FeaturizerFunction = self.data_model.distances
+
+        if isinstance(scorer, core.LinearScorer):
+            negligible = numpy.abs(scorer.coef) <= self.negligible_weight
+            if negligible.any():
+                coef = numpy.where(negligible, 0, scorer.coef)
+                scorer = core.LinearScorer(coef, float(scorer.intercept))
+
+                plan = datamodel.FeaturePlan(self.data_model, coef)
+                if plan.skipped_variables:
+                    logger.info(
+                        "Skipping variables with no weight: %s",
+                        plan.skipped_variables,
+                    )
+                    featurizer = plan
+
+        self._compiled_classifier = (
+            self.classifier,
+            _weights(self.classifier),
+            self.negligible_weight,
+            scorer,
+            featurizer,
+        )
+
+    def _block_keys(
+        self, records: Iterable[Record], target: bool = False, reset: bool = False
+    ) -> Iterator[tuple[BlockKey, RecordID]]:
+        """
+        The fingerprints of records, see :class:`dedupe.blocking.Fingerprinter`,
+        computed with `num_cores` processes. If `reset` is True, the indices of the fingerprinter are reset
+        once all the records are fingerprinted.
+        """
+        yield from self.fingerprinter(
+            records,
+            target=target,
+            hashed=self.hash_block_keys,
+            num_cores=self.num_cores,
+        )
+        if reset:
+            self.fingerprinter.reset_indices()
+
+    @property
+    def oversized_blocks(self) -> list[backends.OversizedBlock]:
+        """
+        The blocks that the last pairing of records skipped for having
+        more than `max_block_size` records, see
+        :attr:`dedupe.backends.BlockingBackend.oversized_blocks`
+        """
+        return self.blocking_backend.oversized_blocks
+
+    def _log_oversized_blocks(
+        self, backend: backends.BlockingBackend | None = None
+    ) -> None:
+        if backend is None:
+            backend = self.blocking_backend
+        oversized = backend.oversized_blocks
+        if oversized:
+            logger.warning(
+                "Skipped %d blocks with more than %d records, "
+                "which would have made %d pairs. The largest was %r",
+                len(oversized),
+                self.max_block_size,
+                sum(block.n_pairs for block in oversized),
+                oversized[0],
+            )
 
     @property
     def fingerprinter(self) -> blocking.Fingerprinter:
@@ -112,7 +345,18 @@ class IntegralMatching(Matching):
     pairs before deciding on any matches
     """
 
-    def score(self, pairs: RecordPairs) -> Scores:
+    def _default_pairs(self, cls: type) -> bool:
+        """
+        Whether neither :func:`pairs`, as defined by `cls`, nor
+        :func:`score` is overridden, so that records can be paired up
+        and scored by their codes instead of through these methods
+        """
+        return (
+            type(self).pairs is cls.pairs  # type: ignore[attr-defined]
+            and type(self).score is IntegralMatching.score
+        )
+
+    def score(self, pairs: RecordPairs, threshold: float = 0.0) -> Scores:
         """
         Scores pairs of records. Returns pairs of tuples of records id and
         associated probabilities that the pair of records are match
@@ -120,10 +364,34 @@ class IntegralMatching(Matching):
         Args:
             pairs: Iterator of pairs of records
 
+            threshold: Number between 0 and 1. Only pairs with a
+                       score above the threshold will be
+                       returned. Pairs at or below the threshold
+                       are dropped as soon as they are scored,
+                       which can greatly reduce the size of the
+                       returned scores if most blocked pairs are
+                       unlikely matches.
+
         """
+        return self._score(pairs, threshold=threshold)
+
+    def _score(
+        self,
+        pairs: RecordPairs,
+        record_stores: core.RecordStores | None = None,
+        threshold: float = 0.0,
+    ) -> Scores:
         try:
             matches = core.scoreDuplicates(
-                pairs, self.data_model.distances, self.classifier, self.num_cores
+                pairs,
+                self._featurizer,
+                self._scorer,
+                self.num_cores,
+                record_stores,
+                threshold,
+                self._scoring_pool(),
+                self.chunk_sizer,
+                self._cascade(),
             )
         except RuntimeError:
             raise RuntimeError(
@@ -136,6 +404,69 @@ class IntegralMatching(Matching):
 
         return matches
 
+    def _score_pair_ids(
+        self,
+        pair_ids: Iterable[RecordIDPair],
+        data_1: Records,
+        data_2: Records,
+        threshold: float = 0.0,
+    ) -> tuple[Scores, list[RecordID], list[RecordID]]:
+        """
+        Scores pairs of record ids from data_1 and data_2.
+
+        The records are put in record stores, and only the codes of
+        the records in each pair are sent to the scoring threads or
+        processes. When scoring with more than one process, the
+        stores are exported once to read-only files that the scoring
+        processes open.
+
+        The returned scores hold pairs of codes instead of record
+        ids, so that clustering works on small integers, even if the
+        record ids are long strings. The codes are given in the order
+        of the records in the data, and when both sides of the pairs
+        come from the same dataset, the smaller code of a pair comes
+        first. Also returns the record ids of each dataset, in code
+        order, to translate the codes back.
+
+        Only a dataset of more than `MAX_IN_MEMORY_RECORDS` records is
+        written to a store on disk for the scoring processes, see
+        :func:`_record_store`.
+
+        A dataset that is already a :class:`dedupe.core.RecordStore`
+        is used as it is, and its records are fingerprinted by code,
+        see :func:`_fingerprint_source`, so its side of the pairs are
+        codes already.
+        """
+        store_1 = _record_store(data_1, self.num_cores)
+        store_2 = store_1 if data_2 is data_1 else _record_store(data_2, self.num_cores)
+
+        try:
+            codes_1 = None if store_1 is data_1 else store_1.codes()
+            if store_2 is store_1:
+                codes_2 = codes_1
+            else:
+                codes_2 = None if store_2 is data_2 else store_2.codes()
+            code_pairs: Iterable[tuple[Any, Any]] = (
+                (
+                    a if codes_1 is None else codes_1[a],
+                    b if codes_2 is None else codes_2[b],
+                )
+                for a, b in pair_ids
+            )
+            if store_2 is store_1 and codes_1 is not None:
+                # clustering expects the smaller code of a pair first
+                code_pairs = ((a, b) if a < b else (b, a) for a, b in code_pairs)
+            scores = self._score(
+                code_pairs, (store_1, store_2), threshold  # type: ignore
+            )
+            return scores, store_1.ids, store_2.ids
+        finally:
+            for data, store in ((data_1, store_1), (data_2, store_2)):
+                if store is data:
+                    store.release()
+                else:
+                    store.close()
+
 
 class DedupeMatching(IntegralMatching):
     """
@@ -158,6 +489,12 @@ class DedupeMatching(IntegralMatching):
     ) -> ClustersStr:  # pragma: no cover
         ...
 
+    @overload
+    def partition(
+        self, data: core.RecordStore, threshold: float = 0.5
+    ) -> Clusters:  # pragma: no cover
+        ...
+
     def partition(self, data, threshold=0.5):  # pragma: no cover
         """
         Identifies records that all refer to the same entity, returns
@@ -176,7 +513,8 @@ class DedupeMatching(IntegralMatching):
         Args:
             data: Dictionary of records, where the keys are record_ids
                   and the values are dictionaries with the keys being
-                  field names
+                  field names, or a :class:`dedupe.core.RecordStore`
+                  of the records, for data that doesn't fit in memory
 
             threshold: Number between 0 and 1.  We
                        will only consider put together records into
@@ -196,10 +534,18 @@ class DedupeMatching(IntegralMatching):
                 ((10, 11), (0.899, 0.899)),
             ]
         """
-        pairs = self.pairs(data)
-        pair_scores = self.score(pairs)
-        clusters = self.cluster(pair_scores, threshold)
-        clusters = self._add_singletons(data.keys(), clusters)
+        if self._default_pairs(DedupeMatching):
+            pair_scores, ids, _ = self._score_pair_ids(self._pair_ids(data), data, data)
+            code_clusters = self.cluster(pair_scores, threshold)
+            clusters = (
+                (tuple(ids[code] for code in codes), scores)  # type: ignore[index]
+                for codes, scores in code_clusters
+            )
+        else:
+            pairs = self.pairs(data)
+            pair_scores = self.score(pairs)
+            clusters = self.cluster(pair_scores, threshold)  # type: ignore[assignment]
+        clusters = self._add_singletons(data.keys(), clusters)  # type: ignore
         clusters_eval = list(clusters)
         _cleanup_scores(pair_scores)
         return clusters_eval
@@ -225,7 +571,7 @@ class DedupeMatching(IntegralMatching):
         for singleton in singletons:
             yield (singleton,), (1.0,)
 
-    def pairs(self, data: Data) -> RecordPairs:
+    def pairs(self, data: Records) -> RecordPairs:
         """
         Yield pairs of records that share common fingerprints.
 
@@ -237,7 +583,8 @@ class DedupeMatching(IntegralMatching):
         Args:
             data: Dictionary of records, where the keys are record_ids
                   and the values are dictionaries with the keys being
-                  field names
+                  field names, or a :class:`dedupe.core.RecordStore`
+                  of the records
 
         Examples:
             >>> pairs = matcher.pairs(data)
@@ -254,55 +601,213 @@ class DedupeMatching(IntegralMatching):
             ]
         """
 
+        record = _record_lookup(data)
+        for a_record_id, b_record_id in self._pair_ids(data):
+            yield record(a_record_id), record(b_record_id)
+
+    def _pair_ids(self, data: Records) -> Iterator[RecordIDPair]:
+        """
+        Yield pairs of the ids of records that share common
+        fingerprints. Each pair will occur at most once. The records
+        of a :class:`dedupe.core.RecordStore` are paired up by code.
+        """
+
         self.fingerprinter.index_all(data)
 
-        id_type = core.sqlite_id_type(data)
+        records, record_ids = _fingerprint_source(data)
+        yield from self.blocking_backend.pairs(
+            self._block_keys(records, reset=True),
+            record_ids,
+            max_block_size=self.max_block_size,
+        )
+        self._log_oversized_blocks()
 
-        # Blocking and pair generation are typically the first memory
-        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            if self.in_memory:
-                con = sqlite3.connect(":memory:")
-            else:
-                con = sqlite3.connect(temp_dir + "/blocks.db")
+    def blocking_stats(
+        self,
+        data: Data,
+        sample_size: int | None = None,
+        n_largest: int = 10,
+        seed: int | None = None,
+    ) -> blocking_stats.BlockingStats:
+        """
+        Statistics of the blocks that the fingerprinter makes of the
+        records, without pairing them up, to see how many pairs
+        :func:`pairs` would make before scoring them, and which
+        predicates and blocks make the most.
 
-            # Set journal mode to WAL.
-            con.execute("pragma journal_mode=off")
-            con.execute(
-                f"CREATE TABLE blocking_map (block_key text, record_id {id_type})"
-            )
-            con.executemany(
-                "INSERT INTO blocking_map values (?, ?)",
-                self.fingerprinter(data.items()),
-            )
+        If `sample_size` is given, only a random sample of that many
+        records is fingerprinted, and the number of distinct pairs
+        found is scaled up to all the records in `estimated_pairs`.
+        Index predicates are still indexed on all the records.
 
-            self.fingerprinter.reset_indices()
+        Args:
+            data: Dictionary of records, where the keys are record_ids
+                  and the values are dictionaries with the keys being
+                  field names
+            sample_size: The number of records to sample, or None to
+                         fingerprint all of them
+            n_largest: The number of largest blocks to list
+            seed: A seed for sampling records and pairs
 
-            con.execute(
-                """CREATE UNIQUE INDEX record_id_block_key_idx
-                           ON blocking_map (record_id, block_key)"""
+        Examples:
+            >>> stats = matcher.blocking_stats(data, sample_size=10000)
+            >>> stats.estimated_pairs
+            1523311
+            >>> stats.largest_blocks[0]
+            BlockStats(block_key='chicago:3', n_records=912, n_pairs=415416)
+        """
+        rng = numpy.random.default_rng(seed)
+        records = _sample_records(data, sample_size, rng)
+        n_all, n = len(data), len(records)
+
+        self.fingerprinter.index_all(data)
+        try:
+            return blocking_stats.blocking_stats(
+                list(self.fingerprinter.predicates),
+                records,
+                scale=n_all * (n_all - 1) / (n * (n - 1)) if n > 1 else 1.0,
+                n_largest=n_largest,
+                seed=rng.integers(2**32),
             )
-            con.execute(
-                """CREATE INDEX block_key_idx
-                           ON blocking_map (block_key)"""
+        finally:
+            self.fingerprinter.reset_indices()
+
+    def shard(self, data: Records, directory: str, n_shards: int) -> None:
+        """
+        Split pairing up and scoring the records into `n_shards` shards,
+        see :mod:`dedupe.sharding`, that separate processes, or
+        machines sharing `directory`, can score with
+        :func:`score_shard`. Once every shard is scored,
+        :func:`merge_shards` merges their scores for :func:`cluster`.
+
+        The records are written to a :class:`dedupe.core.RecordStore`
+        in `directory`, and their fingerprints to the shards. The
+        directory must be empty, and is left for the caller to remove
+        once the job is done.
+
+        Args:
+            data: Dictionary of records, where the keys are record_ids
+                  and the values are dictionaries with the keys being
+                  field names, or a :class:`dedupe.core.RecordStore`
+                  of the records
+            directory: A directory that every process can reach
+            n_shards: The number of shards
+
+        Examples:
+            >>> matcher.shard(data, "/shared/job", 4)
+            >>> # on each of 4 machines, with its own shard
+            >>> matcher.score_shard("/shared/job", shard)
+            >>> # and once they are all done
+            >>> scores = matcher.merge_shards("/shared/job")
+            >>> clusters = matcher.cluster(scores, threshold=0.5)
+        """
+        # the shards and scores of an earlier job would be merged
+        # with those of this one
+        if os.listdir(directory):
+            raise ValueError("The directory of a job must be empty: %s" % directory)
+
+        self.fingerprinter.index_all(data)
+
+        store = core.RecordStore(
+            data.items(), directory=directory  # type: ignore[arg-type]
+        )
+        store.release()
+
+        # the records are fingerprinted by their codes in the store
+        sharding.write_shards(
+            self._block_keys(enumerate(data.values()), reset=True),  # type: ignore[arg-type]
+            directory,
+            n_shards,
+        )
+
+        with open(os.path.join(directory, "ids"), "wb") as f:
+            pickle.dump(store.ids, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # the pickled store doesn't hold the record ids, which only
+        # merging the scores needs
+        with open(os.path.join(directory, "job"), "wb") as f:
+            pickle.dump((n_shards, store), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def score_shard(self, directory: str, shard: int, threshold: float = 0.0) -> None:
+        """
+        Pair up and score the records of one of the shards that
+        :func:`shard` wrote to `directory`, into a score file of the
+        shard
+
+        Args:
+            directory: The directory of the job
+            shard: The number of the shard, from 0 to `n_shards` - 1
+            threshold: Number between 0 and 1. Only pairs with a score
+                       above the threshold are kept.
+        """
+        n_shards, store = _load_shard_job(directory)
+        assert 0 <= shard < n_shards
+
+        oversized: dict[BlockKey, tuple[int, int]] = {}
+        code_pairs = (
+            pair
+            for codes_a, codes_b in sharding.shard_pairs(
+                directory,
+                shard,
+                max_block_size=self.max_block_size,
+                oversized=oversized,
             )
-            con.execute("""ANALYZE""")
-            pairs = con.execute(
-                """SELECT DISTINCT a.record_id, b.record_id
-                                   FROM blocking_map a
-                                   INNER JOIN blocking_map b
-                                   USING (block_key)
-                                   WHERE a.record_id < b.record_id"""
+            for pair in zip(codes_a.tolist(), codes_b.tolist())
+        )
+
+        try:
+            scores = self._score(code_pairs, (store, store), threshold)  # type: ignore[arg-type]
+        except core.BlockingError:
+            # the blocks of this shard paired up no records
+            scores = numpy.empty(0, dtype=_shard_scores_dtype(store))
+        finally:
+            store.release()
+
+        # write the scores under another name first, so that a merge
+        # never reads the scores of a shard that is not done
+        path = sharding.scores_path(directory, shard)
+        scores.tofile(path + ".part")
+        os.replace(path + ".part", path)
+        _cleanup_scores(scores)
+
+        if oversized:
+            logger.warning(
+                "Skipped %d blocks of shard %d with more than %d records",
+                len(oversized),
+                shard,
+                self.max_block_size,
             )
 
-            for a_record_id, b_record_id in pairs:
-                yield (
-                    (a_record_id, data[a_record_id]),
-                    (b_record_id, data[b_record_id]),
-                )
+    def merge_shards(self, directory: str) -> Scores:
+        """
+        Merge the score files of all the shards that :func:`shard`
+        wrote to `directory`, keeping once the pairs that more than one
+        shard scored. Returns the scores of the pairs of record ids,
+        with the smaller id first, like :func:`score`.
+
+        Args:
+            directory: The directory of the job
+        """
+        n_shards, store = _load_shard_job(directory)
+        with open(os.path.join(directory, "ids"), "rb") as f:
+            ids = pickle.load(f)
+
+        scores = sharding.merge_scores(
+            [sharding.scores_path(directory, shard) for shard in range(n_shards)],
+            _shard_scores_dtype(store),
+            os.path.join(directory, "merged"),
+            len(store),
+        )
+        if not len(scores):
+            return scores
+
+        decoded = core.decode_scores(scores, ids, ids)
+        _cleanup_scores(scores)
+        # the records are coded in the order of the data, not of their ids
+        pairs = decoded["pairs"]
+        swap = pairs[:, 0] > pairs[:, 1]
+        pairs[swap] = pairs[swap][:, ::-1]
 
-            pairs.close()
-            con.close()
+        return decoded
 
     def cluster(self, scores: Scores, threshold: float = 0.5) -> Clusters:
         r"""From the similarity scores of pairs of records, decide which groups
@@ -377,7 +882,7 @@ class RecordLinkMatching(IntegralMatching):
     Use RecordLinkMatching when you have two datasets that you want to merge
     """
 
-    def pairs(self, data_1: Data, data_2: Data) -> RecordPairs:
+    def pairs(self, data_1: Records, data_2: Records) -> RecordPairs:
         """
         Yield pairs of records that share common fingerprints.
 
@@ -390,7 +895,8 @@ class RecordLinkMatching(IntegralMatching):
         Args:
             data_1: Dictionary of records from first dataset, where the
                     keys are record_ids and the values are dictionaries
-                    with the keys being field names
+                    with the keys being field names, or a
+                    :class:`dedupe.core.RecordStore` of the records
             data_2: Dictionary of records from second dataset, same
                     form as data_1
 
@@ -409,70 +915,86 @@ class RecordLinkMatching(IntegralMatching):
             ]
         """
 
-        self.fingerprinter.index_all(data_2)
-
-        id_type_a = core.sqlite_id_type(data_1)
-        id_type_b = core.sqlite_id_type(data_2)
+        record_1 = _record_lookup(data_1)
+        record_2 = _record_lookup(data_2)
+        for a_record_id, b_record_id in self._pair_ids(data_1, data_2):
+            yield record_1(a_record_id), record_2(b_record_id)
 
-        # Blocking and pair generation are typically the first memory
-        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            if self.in_memory:
-                con = sqlite3.connect(":memory:")
-            else:
-                con = sqlite3.connect(temp_dir + "/blocks.db")
+    def _pair_ids(self, data_1: Records, data_2: Records) -> Iterator[RecordIDPair]:
+        """
+        Yield pairs of the ids of records from data_1 and data_2 that
+        share common fingerprints. Each pair will occur at most once.
+        The records of a :class:`dedupe.core.RecordStore` are paired up
+        by code.
+        """
 
-            con.execute("pragma journal_mode=off")
+        self.fingerprinter.index_all(data_2)
 
-            con.executescript(
-                f"""CREATE TABLE blocking_map_a
-                                 (block_key text, record_id {id_type_a});
+        records_1, record_ids_1 = _fingerprint_source(data_1)
+        records_2, record_ids_2 = _fingerprint_source(data_2)
+        yield from self.blocking_backend.link_pairs(
+            self._block_keys(records_1),
+            record_ids_1,
+            self._block_keys(records_2, target=True, reset=True),
+            record_ids_2,
+            max_block_size=self.max_block_size,
+        )
+        self._log_oversized_blocks()
 
-                                 CREATE TABLE blocking_map_b
-                                 (block_key text, record_id {id_type_b});"""
-            )
+    def blocking_stats(
+        self,
+        data_1: Data,
+        data_2: Data,
+        sample_size: int | None = None,
+        n_largest: int = 10,
+        seed: int | None = None,
+    ) -> blocking_stats.BlockingStats:
+        """
+        Statistics of the blocks that the fingerprinter makes of the
+        records, counting only the pairs of a record from each
+        dataset, without pairing them up, to see how many pairs
+        :func:`pairs` would make before scoring them, and which
+        predicates and blocks make the most.
+
+        If `sample_size` is given, only a random sample of that many
+        records of each dataset is fingerprinted, and the number of
+        distinct pairs found is scaled up to all the records in
+        `estimated_pairs`. Index predicates are still indexed on all
+        the records of data_2.
 
-            con.executemany(
-                "INSERT INTO blocking_map_a values (?, ?)",
-                self.fingerprinter(data_1.items()),
-            )
+        Args:
+            data_1: Dictionary of records from first dataset, where the
+                    keys are record_ids and the values are dictionaries
+                    with the keys being field names
+            data_2: Dictionary of records from second dataset, same
+                    form as data_1
+            sample_size: The number of records to sample from each
+                         dataset, or None to fingerprint all of them
+            n_largest: The number of largest blocks to list
+            seed: A seed for sampling records and pairs
+        """
+        rng = numpy.random.default_rng(seed)
+        records_1 = _sample_records(data_1, sample_size, rng)
+        records_2 = _sample_records(data_2, sample_size, rng)
+        n_pairs = len(records_1) * len(records_2)
 
-            con.executemany(
-                "INSERT INTO blocking_map_b values (?, ?)",
-                self.fingerprinter(data_2.items(), target=True),
+        self.fingerprinter.index_all(data_2)
+        try:
+            return blocking_stats.blocking_stats(
+                list(self.fingerprinter.predicates),
+                records_1,
+                records_2,
+                scale=len(data_1) * len(data_2) / n_pairs if n_pairs else 1.0,
+                n_largest=n_largest,
+                seed=rng.integers(2**32),
             )
-
+        finally:
             self.fingerprinter.reset_indices()
 
-            con.executescript(
-                """CREATE UNIQUE INDEX block_key_a_idx
-                                 ON blocking_map_a (record_id, block_key);
-
-                   CREATE UNIQUE INDEX block_key_b_idx
-                                 ON blocking_map_b (block_key, record_id);"""
-            )
-            con.execute("""ANALYZE""")
-
-            pairs = con.execute(
-                """SELECT DISTINCT a.record_id, b.record_id
-                                   FROM blocking_map_a a
-                                   INNER JOIN blocking_map_b b
-                                   USING (block_key)"""
-            )
-
-            for a_record_id, b_record_id in pairs:
-                yield (
-                    (a_record_id, data_1[a_record_id]),
-                    (b_record_id, data_2[b_record_id]),
-                )
-
-            pairs.close()
-            con.close()
-
     def join(
         self,
-        data_1: Data,
-        data_2: Data,
+        data_1: Records,
+        data_2: Records,
         threshold: float = 0.5,
         constraint: JoinConstraint = "one-to-one",
     ) -> Links:
@@ -491,7 +1013,9 @@ class RecordLinkMatching(IntegralMatching):
         Args:
             data_1: Dictionary of records from first dataset, where the
                     keys are record_ids and the values are dictionaries
-                    with the keys being field names
+                    with the keys being field names, or a
+                    :class:`dedupe.core.RecordStore` of the records,
+                    for data that doesn't fit in memory
 
             data_2: Dictionary of records from second dataset, same form
                     as data_1
@@ -545,18 +1069,42 @@ class RecordLinkMatching(IntegralMatching):
             "one-to-one, many-to-one, or many-to-many" % constraint
         )
 
-        pairs = self.pairs(data_1, data_2)
-        pair_scores = self.score(pairs)
+        if not self._default_pairs(RecordLinkMatching):
+            pairs = self.pairs(data_1, data_2)
+            pair_scores = self.score(pairs)
+
+            links: Links
+            if constraint == "one-to-one":
+                links = self.one_to_one(pair_scores, threshold)
+            elif constraint == "many-to-one":
+                links = self.many_to_one(pair_scores, threshold)
+            else:
+                links = pair_scores[pair_scores["score"] > threshold]
+
+            links_evaluated: Links = list(links)  # type: ignore[assignment]
+            _cleanup_scores(pair_scores)
+            return links_evaluated
+
+        pair_ids = self._pair_ids(data_1, data_2)
+        pair_scores, ids_1, ids_2 = self._score_pair_ids(
+            pair_ids, data_1, data_2, threshold
+        )
 
-        links: Links
         if constraint == "one-to-one":
-            links = self.one_to_one(pair_scores, threshold)
+            links = (  # type: ignore[assignment]
+                ((ids_1[a], ids_2[b]), score)  # type: ignore[index]
+                for (a, b), score in self.one_to_one(pair_scores, threshold)
+            )
         elif constraint == "many-to-one":
-            links = self.many_to_one(pair_scores, threshold)
+            matches = numpy.array(
+                list(self.many_to_one(pair_scores, threshold)), dtype=pair_scores.dtype
+            )
+            links = core.decode_scores(matches, ids_1, ids_2)
         else:
-            links = pair_scores[pair_scores["score"] > threshold]
+            matches = pair_scores[pair_scores["score"] > threshold]
+            links = core.decode_scores(matches, ids_1, ids_2)
 
-        links_evaluated: Links = list(links)  # type: ignore[assignment]
+        links_evaluated = list(links)  # type: ignore[assignment]
         _cleanup_scores(pair_scores)
         return links_evaluated
 
@@ -674,25 +1222,11 @@ class GazetteerMatching(Matching):
     ) -> None:
         super().__init__(num_cores, in_memory, **kwargs)
 
-        self.db: PathLike
-        if self.in_memory:
-            self.db = ":memory:"
-        else:
-            self.temp_dir = tempfile.TemporaryDirectory()
-            self.db = self.temp_dir.name + "/blocks.db"
-
         self.indexed_data: Union[
             MutableMapping[int, RecordDict], MutableMapping[str, RecordDict]
         ]
         self.indexed_data = {}  # type: ignore[assignment]
 
-    def _close(self) -> None:
-        if not self.in_memory:
-            self.temp_dir.cleanup()
-
-    def __del__(self) -> None:
-        self._close()
-
     @overload
     def index(self, data: DataInt) -> None:
         ...
@@ -716,36 +1250,10 @@ class GazetteerMatching(Matching):
 
         self.fingerprinter.index_all(data)
 
-        id_type = core.sqlite_id_type(data)
-
-        con = sqlite3.connect(self.db)
-
-        # Set journal mode to WAL.
-        con.execute("pragma journal_mode=wal")
-
-        con.execute(
-            f"""CREATE TABLE IF NOT EXISTS indexed_records
-                       (block_key text,
-                        record_id {id_type},
-                        UNIQUE(block_key, record_id))"""
-        )
-
-        con.executemany(
-            "REPLACE INTO indexed_records VALUES (?, ?)",
-            self.fingerprinter(data.items(), target=True),
+        self.blocking_backend.index(
+            self._block_keys(data.items(), target=True), data.keys()
         )
 
-        con.execute(
-            """CREATE UNIQUE INDEX IF NOT EXISTS
-                       indexed_records_block_key_idx
-                       ON indexed_records
-                       (block_key, record_id)"""
-        )
-        con.execute("""ANALYZE""")
-
-        con.commit()
-        con.close()
-
         self.indexed_data.update(data)
 
     @overload
@@ -772,15 +1280,7 @@ class GazetteerMatching(Matching):
                 {record[field] for record in data.values()}, field
             )
 
-        con = sqlite3.connect(self.db)
-        con.executemany(
-            """DELETE FROM indexed_records
-                           WHERE record_id = ?""",
-            ((k,) for k in data.keys()),
-        )
-
-        con.commit()
-        con.close()
+        self.blocking_backend.unindex(data.keys())
 
         for k in data:
             del self.indexed_data[k]
@@ -838,25 +1338,8 @@ class GazetteerMatching(Matching):
             ]
         """
 
-        id_type = core.sqlite_id_type(data)
-
-        con = sqlite3.connect(self.db, check_same_thread=False)
-
-        con.execute("BEGIN")
-
-        con.execute(
-            f"CREATE TEMPORARY TABLE blocking_map (block_key text, record_id {id_type})"
-        )
-        con.executemany(
-            "INSERT INTO blocking_map VALUES (?, ?)", self.fingerprinter(data.items())
-        )
-
-        pairs = con.execute(
-            """SELECT DISTINCT a.record_id, b.record_id
-                               FROM blocking_map a
-                               INNER JOIN indexed_records b
-                               USING (block_key)
-                               ORDER BY a.record_id"""
+        pairs: Iterator[Any] = self.blocking_backend.search(
+            self._block_keys(data.items()), data.keys()
         )
 
         pair_blocks: Union[
@@ -875,10 +1358,6 @@ class GazetteerMatching(Matching):
                 for a_record_id, b_record_id in pair_block
             ]
 
-        pairs.close()
-        con.execute("ROLLBACK")
-        con.close()
-
     def score(self, blocks: Blocks) -> Generator[Scores, None, None]:
         """
         Scores groups of pairs of records. Yields structured numpy arrays
@@ -890,7 +1369,12 @@ class GazetteerMatching(Matching):
         """
 
         matches = core.scoreGazette(
-            blocks, self.data_model.distances, self.classifier, self.num_cores
+            blocks,
+            self._featurizer,
+            self._scorer,
+            self.num_cores,
+            self._scoring_pool(),
+            self.chunk_sizer,
         )
 
         return matches
@@ -1048,6 +1532,7 @@ class StaticMatching(Matching):
         settings_file: BinaryIO,
         num_cores: int | None = None,
         in_memory: bool = False,
+        blocking_backend: backends.BlockingBackend | None = None,
         **kwargs,
     ) -> None:  # pragma: no cover
         """
@@ -1066,6 +1551,11 @@ class StaticMatching(Matching):
                        rather than writing to disk. May be faster if
                        sufficient memory is available.
 
+            blocking_backend: The :class:`dedupe.backends.BlockingBackend`
+                              that pairs up records sharing block
+                              keys. Defaults to a
+                              :class:`dedupe.backends.SQLiteBackend`.
+
         .. warning::
 
             If using multiprocessing on Windows or Mac OS X, then
@@ -1073,12 +1563,15 @@ class StaticMatching(Matching):
             `if __name__ == '__main__'` in your main module, see
             https://docs.python.org/3/library/multiprocessing.html#the-spawn-and-forkserver-start-methods
         """
-        super().__init__(num_cores, in_memory, **kwargs)
+        super().__init__(
+            num_cores, in_memory, blocking_backend=blocking_backend, **kwargs
+        )
 
         try:
             self.data_model = pickle.load(settings_file)
             self.classifier = pickle.load(settings_file)
             self.predicates = pickle.load(settings_file)
+            self._compile_classifier()
         except (KeyError, AttributeError):
             raise SettingsFileLoadingException(
                 "This settings file is not compatible with "
@@ -1124,6 +1617,7 @@ class ActiveMatching(Matching):
         variable_definition: Collection[VariableDefinition],
         num_cores: int | None = None,
         in_memory: bool = False,
+        blocking_backend: backends.BlockingBackend | None = None,
         **kwargs,
     ) -> None:
         """
@@ -1142,6 +1636,11 @@ class ActiveMatching(Matching):
                        rather than writing to disk. May be faster if
                        sufficient memory is available.
 
+            blocking_backend: The :class:`dedupe.backends.BlockingBackend`
+                              that pairs up records sharing block
+                              keys. Defaults to a
+                              :class:`dedupe.backends.SQLiteBackend`.
+
         .. warning::
 
             If using multiprocessing on Windows or Mac OS X, then
@@ -1150,7 +1649,9 @@ class ActiveMatching(Matching):
             https://docs.python.org/3/library/multiprocessing.html#the-spawn-and-forkserver-start-methods
 
         """
-        super().__init__(num_cores, in_memory, **kwargs)
+        super().__init__(
+            num_cores, in_memory, blocking_backend=blocking_backend, **kwargs
+        )
 
         self.data_model = datamodel.DataModel(variable_definition)
         self.training_pairs = {"distinct": [], "match": []}
@@ -1211,6 +1712,7 @@ class ActiveMatching(Matching):
 
         examples, y = flatten_training(self.training_pairs)
         self.classifier.fit(self.data_model.distances(examples), y)
+        self._compile_classifier()
 
         self.predicates = self.active_learner.learn_predicates(recall, index_predicates)
         self._fingerprinter = blocking.Fingerprinter(self.predicates)
@@ -1372,8 +1874,223 @@ class StaticDedupe(StaticMatching, DedupeMatching):
     Class for deduplication using saved settings. If you have already
     trained a :class:`Dedupe` object and saved the settings, you can
     load the saved settings with StaticDedupe.
+
+    StaticDedupe can also cluster records incrementally, as they
+    arrive in batches, with :meth:`add_records`, which only
+    fingerprints and scores the new records, and keeps the clusters
+    of earlier records that the new ones don't touch. The state this
+    needs can be saved with :meth:`write_state` and loaded with
+    :meth:`read_state`.
     """
 
+    def __init__(self, *args, **kwargs) -> None:  # pragma: no cover
+        super().__init__(*args, **kwargs)
+
+        # the ids of the records added with add_records, by code, and
+        # the index of their block keys. The records themselves are
+        # kept on disk, in a store for each batch of added records,
+        # along with the code of its first record
+        self._added_ids: list[RecordID] = []
+        self._added_codes: dict[RecordID, int] = {}
+        self._added_stores: list[core.RecordStore] = []
+        self._added_starts: list[int] = []
+        self._added_dir: tempfile.TemporaryDirectory[str] | None = None
+        self._added_index = backends.SortedArrayBackend(in_memory=True)
+        self._incremental_clusters: clustering.IncrementalClusters | None = None
+
+    def add_records(self, data: Data, threshold: float = 0.5) -> Clusters:
+        """
+        Add new records to the records clustered so far, and cluster
+        them. Only the pairs of a new record and another record, new
+        or not, that share fingerprints are scored, and only the
+        clusters that these pairs connect to are clustered again, so
+        the work grows with the new records instead of with all of
+        them.
+
+        Every scored pair is kept, so the clusters are the same as
+        those of :func:`partition` on all the records, except that
+        index predicates, like TF-IDF canopies, don't fingerprint the
+        earlier records again with the new records in their index,
+        and that pairs scored before a block grew to more than
+        `max_block_size` records are kept.
+
+        Only the ids of the added records are kept in memory, the
+        records are written to temporary files.
+
+        Returns the clusters that changed, like :func:`partition`,
+        along with the records in no cluster whose clusters could have
+        changed, which includes all the new records.
+
+        Args:
+            data: Dictionary of the new records, where the keys are
+                  record_ids, that must differ from those of the
+                  records added before, and the values are
+                  dictionaries with the keys being field names
+
+            threshold: Number between 0 and 1, see :func:`partition`.
+                       It must be the same every time records are
+                       added.
+
+        Examples:
+            >>> matcher.add_records(history)
+            >>> with open("state", "wb") as f:
+            >>>     matcher.write_state(f)
+            >>> # the next night
+            >>> with open("state", "rb") as f:
+            >>>     matcher.read_state(f, history)
+            >>> changed = matcher.add_records(new_records)
+        """
+        clusters = self._incremental_clusters
+        if clusters is None:
+            clusters = self._incremental_clusters = clustering.IncrementalClusters(
+                threshold
+            )
+        elif threshold != clusters.threshold:
+            raise ValueError(
+                "The records were clustered with a threshold of %s, "
+                "not %s" % (clusters.threshold, threshold)
+            )
+
+        codes = self._added_codes
+        existing = [record_id for record_id in data if record_id in codes]
+        if existing:
+            raise ValueError(
+                "Records with these ids were already added: %s" % existing[:10]
+            )
+
+        n_old = len(self._added_ids)
+        self._add_store(data.items())
+        for record_id in data:
+            codes[record_id] = len(self._added_ids)
+            self._added_ids.append(record_id)
+
+        self.fingerprinter.index_all(data)
+        block_keys = list(self._block_keys(data.items()))
+
+        # the new records are indexed first, so that searching the
+        # index pairs them up with each other too, and blocks are
+        # capped by all the records they hold, like in partition
+        self._added_index.index(block_keys, data.keys())
+        pair_ids = self._added_index.search(
+            block_keys, data.keys(), max_block_size=self.max_block_size
+        )
+        code_pairs = ((codes[a], codes[b]) for a, b in pair_ids if codes[b] < codes[a])
+
+        ids = self._added_ids
+
+        def record(code: int) -> tuple[int, RecordDict]:
+            if code >= n_old:
+                return code, data[ids[code]]  # type: ignore[index]
+            return code, self._added_record(code)
+
+        record_pairs = ((record(a), record(b)) for a, b in code_pairs)
+        try:
+            scores = self.score(record_pairs)  # type: ignore[arg-type]
+        except core.BlockingError:
+            scores = numpy.empty(0, dtype=clusters.edges.dtype)
+        self._log_oversized_blocks(self._added_index)
+        for store in self._added_stores:
+            store.release()
+
+        changed = clusters.update(len(ids), scores)
+        _cleanup_scores(scores)
+
+        return [
+            (tuple(ids[code] for code in cluster_codes), cluster_scores)
+            for cluster_codes, cluster_scores in changed
+        ]  # type: ignore[return-value]
+
+    def _add_store(self, records: Iterable[Record]) -> None:
+        """Write the records of a batch to a new store on disk"""
+        if self._added_dir is None:
+            self._added_dir = tempfile.TemporaryDirectory()
+        self._added_starts.append(len(self._added_ids))
+        self._added_stores.append(
+            core.RecordStore(records, directory=self._added_dir.name)
+        )
+
+    def _added_record(self, code: int) -> RecordDict:
+        """Read an added record from the store of its batch"""
+        i = bisect.bisect_right(self._added_starts, code) - 1
+        return self._added_stores[i][code - self._added_starts[i]]
+
+    def clusters(self) -> Clusters:
+        """
+        All the clusters of the records added with :func:`add_records`,
+        along with the records in no cluster, like :func:`partition`
+        """
+        if self._incremental_clusters is None:
+            return
+        ids = self._added_ids
+        for cluster_codes, cluster_scores in self._incremental_clusters.all_clusters():
+            yield tuple(ids[code] for code in cluster_codes), cluster_scores  # type: ignore[misc]
+
+    def write_state(self, state_file: BinaryIO) -> None:
+        """
+        Write the ids of the records added with :func:`add_records`,
+        the index of their block keys, their scored pairs, and their
+        clusters, to a file object, to be read back by
+        :func:`read_state`. The records themselves are not written.
+
+        Args:
+            state_file: File object to write the state to.
+        """
+        pickle.dump(
+            (
+                self._added_ids,
+                self._added_index,
+                self._incremental_clusters,
+            ),
+            state_file,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    def read_state(self, state_file: BinaryIO, data: Records) -> None:
+        """
+        Read the state written by :func:`write_state`, to keep adding
+        records with :func:`add_records`. The index predicates of the
+        fingerprinter are indexed again with the records.
+
+        Args:
+            state_file: File object to read the state from.
+            data: The records added before the state was written,
+                  as a dictionary of records, where the keys are
+                  record_ids, or a :class:`dedupe.core.RecordStore`.
+                  Other records are ignored.
+        """
+        ids, added_index, incremental_clusters = pickle.load(state_file)
+
+        lookup = _record_lookup(data)
+        if isinstance(data, core.RecordStore):
+            data_codes = data.codes()
+            missing = [record_id for record_id in ids if record_id not in data_codes]
+            keys: Iterable[Any] = (data_codes[record_id] for record_id in ids)
+        else:
+            missing = [record_id for record_id in ids if record_id not in data]
+            keys = ids
+        if missing:
+            raise ValueError(
+                "The records with these ids were added, but are not "
+                "in the data: %s" % missing[:10]
+            )
+
+        for store in self._added_stores:
+            store.close()
+        self._added_stores = []
+        self._added_starts = []
+        self._added_ids = []
+        self._add_store(lookup(key) for key in keys)
+
+        self._added_ids = ids
+        self._added_codes = {record_id: code for code, record_id in enumerate(ids)}
+        self._added_index = added_index
+        self._incremental_clusters = incremental_clusters
+
+        (store,) = self._added_stores
+        self.fingerprinter.reset_indices()
+        self.fingerprinter.index_all(store)
+        store.release()
+
 
 class Dedupe(ActiveMatching, DedupeMatching):
     """
@@ -1570,6 +2287,70 @@ def flatten_training(
     return examples, numpy.array(y)
 
 
+def _fingerprint_source(
+    data: Records,
+) -> tuple[Iterable[Record], Collection[RecordID]]:
+    """
+    The records to fingerprint, and the ids of all of them. The records
+    of a store are streamed from disk, with their codes for ids, so
+    that no dictionary from record ids to codes is needed.
+    """
+    if isinstance(data, core.RecordStore):
+        return enumerate(data.values()), range(len(data))
+    return data.items(), data.keys()
+
+
+def _weights(classifier: Classifier) -> bytes:
+    """
+    The fitted coefficients and intercept of a classifier, or of the
+    best estimator of a search, as bytes that change when it is refit.
+    """
+    estimator = getattr(classifier, "best_estimator_", classifier)
+    return b"".join(
+        numpy.asarray(getattr(estimator, attr, ())).tobytes()
+        for attr in ("coef_", "intercept_")
+    )
+
+
+def _record_lookup(data: Records) -> Callable[[Any], Any]:
+    """Look up a record with its id by what :func:`_fingerprint_source` gave"""
+    if isinstance(data, core.RecordStore):
+        return lambda code: (data.ids[code], data[code])
+    return lambda record_id: (record_id, data[record_id])
+
+
+def _record_store(data: Records, num_cores: int) -> core.RecordStore:
+    """
+    The records to score, in a store. Records are only written to disk
+    for scoring processes, and only if there are too many of them to
+    just send to every process, otherwise the store refers to the
+    records of the data, in the order of the data.
+    """
+    if isinstance(data, core.RecordStore):
+        return data
+    in_memory = num_cores < 2 or len(data) <= MAX_IN_MEMORY_RECORDS
+    return core.RecordStore(data.items(), in_memory)
+
+
+def _load_shard_job(directory: str) -> tuple[int, core.RecordStore]:
+    with open(os.path.join(directory, "job"), "rb") as f:
+        n_shards, store = pickle.load(f)
+    return n_shards, store
+
+
+def _shard_scores_dtype(store: core.RecordStore) -> numpy.dtype:
+    return numpy.dtype([("pairs", store.code_type(), 2), ("score", "f4")])
+
+
+def _sample_records(
+    data: Data, sample_size: int | None, rng: numpy.random.Generator
+) -> list[RecordDict]:
+    records = list(data.values())
+    if sample_size is None or sample_size >= len(records):
+        return records
+    return [records[i] for i in rng.choice(len(records), sample_size, replace=False)]
+
+
 def _cleanup_scores(arr: Scores) -> None:
     try:
         mmap_file = arr.filename  # type: ignore
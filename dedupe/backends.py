@@ -0,0 +1,636 @@
+"""
+Backends that find the pairs of records sharing block keys.
+
+The matchers fingerprint records into rows of (block key, record id)
+and hand them to a :class:`BlockingBackend`, which pairs up the records
+that share a block key. The backend of a matcher can be chosen with
+the `blocking_backend` argument of its constructor.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import tempfile
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy
+
+import dedupe.core as core
+import dedupe.sorted_blocking as sorted_blocking
+
+if TYPE_CHECKING:
+    from typing import Any, Collection, Iterable, Iterator, Optional
+
+    import numpy.typing
+
+    from dedupe._typing import BlockKey, RecordID, RecordIDPair
+
+    BlockKeys = Iterable[tuple[BlockKey, RecordID]]
+
+
+class OversizedBlock(NamedTuple):
+    """
+    A block that was skipped for having too many records, along with
+    the number of pairs it would have made, some of which other blocks
+    may still make
+    """
+
+    block_key: BlockKey
+    n_records: int
+    n_pairs: int
+
+
+class BlockingBackend(ABC):
+    """
+    Base class for blocking backends.
+
+    The `record_ids` passed along with rows of block keys are the ids
+    of all the records the rows can refer to. Backends must yield each
+    pair of record ids at most once.
+
+    When pairing up records, blocks of more than `max_block_size`
+    records, counting the records of both datasets when linking, are
+    skipped. They are listed in :attr:`oversized_blocks`, as soon as
+    the first pair is yielded.
+    """
+
+    def __init__(self) -> None:
+        self._oversized: dict[BlockKey, tuple[int, int]] = {}
+
+    @abstractmethod
+    def pairs(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        """
+        Yield the pairs of records of one dataset that share a block
+        key, with the smaller record id first
+        """
+
+    @abstractmethod
+    def link_pairs(
+        self,
+        block_keys_1: BlockKeys,
+        record_ids_1: Collection[RecordID],
+        block_keys_2: BlockKeys,
+        record_ids_2: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        """
+        Yield the pairs of a record of the first dataset and a record of
+        the second that share a block key
+        """
+
+    @property
+    def oversized_blocks(self) -> list[OversizedBlock]:
+        """
+        The blocks skipped by the last call to :meth:`pairs` or
+        :meth:`link_pairs`, the ones that would have made the most
+        pairs first
+        """
+        blocks = [OversizedBlock(key, *sizes) for key, sizes in self._oversized.items()]
+        blocks.sort(key=lambda block: block.n_pairs, reverse=True)
+        return blocks
+
+    @abstractmethod
+    def index(self, block_keys: BlockKeys, record_ids: Collection[RecordID]) -> None:
+        """Add the block keys of records to the index searched by :meth:`search`"""
+
+    @abstractmethod
+    def unindex(self, record_ids: Collection[RecordID]) -> None:
+        """Remove records from the index"""
+
+    @abstractmethod
+    def search(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        """
+        Yield the pairs of a record and an indexed record that share a
+        block key, ordered by the id of the first record. Blocks of
+        more than `max_block_size` indexed records are skipped, and
+        listed in :attr:`oversized_blocks` with their number of indexed
+        records and the number of pairs they would have made.
+        """
+
+    def close(self) -> None:
+        """Free the resources held by the backend, like its index"""
+
+
+class SQLiteBackend(BlockingBackend):
+    """
+    Joins tables of block keys with SQLite. The tables are written to
+    temporary files, unless `in_memory` is True.
+
+    The block key columns are declared without a type, so that block
+    keys are stored as they come, either strings or hashed integers.
+
+    Records that share more than one block key are joined once per
+    shared key, and the duplicate pairs are dropped with a `DISTINCT`,
+    so no pair comes out before the whole join is done. If
+    `stream_pairs` is True, a pair is instead only selected from the
+    first block key its records share. Pairs then stream out as the
+    join produces them, without a temporary table of all the pairs, but
+    checking for an earlier shared block key makes the join slower.
+    """
+
+    def __init__(self, in_memory: bool = False, stream_pairs: bool = False):
+        super().__init__()
+        self.in_memory = in_memory
+        self.stream_pairs = stream_pairs
+
+        self._con: Optional[sqlite3.Connection] = None
+        # holds the database of the index, once there is one
+        self._temp_dir: Optional[tempfile.TemporaryDirectory[str]] = None
+
+    def _connect(self, temp_dir: str) -> sqlite3.Connection:
+        if self.in_memory:
+            return sqlite3.connect(":memory:")
+        else:
+            return sqlite3.connect(temp_dir + "/blocks.db")
+
+    def pairs(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        id_type = core.sqlite_id_type(record_ids)
+        self._oversized = {}
+
+        # Blocking and pair generation are typically the first memory
+        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
+        with tempfile.TemporaryDirectory() as temp_dir:
+            con = self._connect(temp_dir)
+
+            # Set journal mode to WAL.
+            con.execute("pragma journal_mode=off")
+            con.execute(f"CREATE TABLE blocking_map (block_key, record_id {id_type})")
+            con.executemany("INSERT INTO blocking_map values (?, ?)", block_keys)
+
+            con.execute(
+                """CREATE UNIQUE INDEX record_id_block_key_idx
+                           ON blocking_map (record_id, block_key)"""
+            )
+            con.execute(
+                """CREATE INDEX block_key_idx
+                           ON blocking_map (block_key)"""
+            )
+            con.execute("""ANALYZE""")
+
+            if max_block_size is not None:
+                oversized = con.execute(
+                    """SELECT block_key, COUNT(*) FROM blocking_map
+                       GROUP BY block_key HAVING COUNT(*) > ?""",
+                    (max_block_size,),
+                ).fetchall()
+                self._skip(con, ["blocking_map"], oversized)
+                self._oversized = {
+                    block_key: (size, size * (size - 1) // 2)
+                    for block_key, size in oversized
+                }
+
+            if self.stream_pairs:
+                pairs = con.execute(
+                    """SELECT a.record_id, b.record_id
+                                       FROM blocking_map a
+                                       INNER JOIN blocking_map b
+                                       USING (block_key)
+                                       WHERE a.record_id < b.record_id
+                                       AND """
+                    + self._first_shared("blocking_map", "blocking_map")
+                )
+            else:
+                pairs = con.execute(
+                    """SELECT DISTINCT a.record_id, b.record_id
+                                       FROM blocking_map a
+                                       INNER JOIN blocking_map b
+                                       USING (block_key)
+                                       WHERE a.record_id < b.record_id"""
+                )
+
+            yield from pairs
+
+            pairs.close()
+            con.close()
+
+    def link_pairs(
+        self,
+        block_keys_1: BlockKeys,
+        record_ids_1: Collection[RecordID],
+        block_keys_2: BlockKeys,
+        record_ids_2: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        id_type_a = core.sqlite_id_type(record_ids_1)
+        id_type_b = core.sqlite_id_type(record_ids_2)
+        self._oversized = {}
+
+        # Blocking and pair generation are typically the first memory
+        # bottlenecks, so we'll use sqlite3 to avoid doing them in memory
+        with tempfile.TemporaryDirectory() as temp_dir:
+            con = self._connect(temp_dir)
+
+            con.execute("pragma journal_mode=off")
+
+            con.executescript(
+                f"""CREATE TABLE blocking_map_a
+                                 (block_key, record_id {id_type_a});
+
+                                 CREATE TABLE blocking_map_b
+                                 (block_key, record_id {id_type_b});"""
+            )
+
+            con.executemany("INSERT INTO blocking_map_a values (?, ?)", block_keys_1)
+
+            con.executemany("INSERT INTO blocking_map_b values (?, ?)", block_keys_2)
+
+            con.executescript(
+                """CREATE UNIQUE INDEX block_key_a_idx
+                                 ON blocking_map_a (record_id, block_key);
+
+                   CREATE UNIQUE INDEX block_key_b_idx
+                                 ON blocking_map_b (block_key, record_id);"""
+            )
+            con.execute("""ANALYZE""")
+
+            if max_block_size is not None:
+                oversized = con.execute(
+                    """SELECT block_key, SUM(n_a), SUM(n_b)
+                       FROM (SELECT block_key, COUNT(*) AS n_a, 0 AS n_b
+                             FROM blocking_map_a GROUP BY block_key
+                             UNION ALL
+                             SELECT block_key, 0 AS n_a, COUNT(*) AS n_b
+                             FROM blocking_map_b GROUP BY block_key)
+                       GROUP BY block_key
+                       HAVING SUM(n_a) > 0 AND SUM(n_b) > 0
+                       AND SUM(n_a) + SUM(n_b) > ?""",
+                    (max_block_size,),
+                ).fetchall()
+                self._skip(con, ["blocking_map_a", "blocking_map_b"], oversized)
+                self._oversized = {
+                    block_key: (n_a + n_b, n_a * n_b)
+                    for block_key, n_a, n_b in oversized
+                }
+
+            if self.stream_pairs:
+                pairs = con.execute(
+                    """SELECT a.record_id, b.record_id
+                                       FROM blocking_map_a a
+                                       INNER JOIN blocking_map_b b
+                                       USING (block_key)
+                                       WHERE """
+                    + self._first_shared("blocking_map_a", "blocking_map_b")
+                )
+            else:
+                pairs = con.execute(
+                    """SELECT DISTINCT a.record_id, b.record_id
+                                       FROM blocking_map_a a
+                                       INNER JOIN blocking_map_b b
+                                       USING (block_key)"""
+                )
+
+            yield from pairs
+
+            pairs.close()
+            con.close()
+
+    @staticmethod
+    def _first_shared(table_a: str, table_b: str) -> str:
+        """
+        A condition that a pair of rows a and b, of `table_a` and
+        `table_b`, is joined on the first block key their records share,
+        so no pair is selected twice
+        """
+        return f"""NOT EXISTS
+                   (SELECT 1 FROM {table_a} c
+                    INNER JOIN {table_b} d
+                    USING (block_key)
+                    WHERE c.record_id = a.record_id
+                    AND d.record_id = b.record_id
+                    AND c.block_key < a.block_key)"""
+
+    @staticmethod
+    def _skip(
+        con: sqlite3.Connection, tables: list[str], oversized: list[tuple[Any, ...]]
+    ) -> None:
+        for table in tables:
+            con.executemany(
+                f"DELETE FROM {table} WHERE block_key = ?",
+                ((block_key,) for block_key, *_ in oversized),
+            )
+
+    def _index_connection(self) -> sqlite3.Connection:
+        # every connection to ':memory:' opens a new database, so an
+        # index in memory needs to keep its connection open
+        if not self.in_memory:
+            if self._temp_dir is None:
+                self._temp_dir = tempfile.TemporaryDirectory()
+            return sqlite3.connect(
+                self._temp_dir.name + "/blocks.db", check_same_thread=False
+            )
+
+        if self._con is None:
+            self._con = sqlite3.connect(":memory:", check_same_thread=False)
+        return self._con
+
+    def _release(self, con: sqlite3.Connection) -> None:
+        if con is not self._con:
+            con.close()
+
+    def index(self, block_keys: BlockKeys, record_ids: Collection[RecordID]) -> None:
+        id_type = core.sqlite_id_type(record_ids)
+
+        con = self._index_connection()
+
+        # Set journal mode to WAL.
+        con.execute("pragma journal_mode=wal")
+
+        con.execute(
+            f"""CREATE TABLE IF NOT EXISTS indexed_records
+                       (block_key,
+                        record_id {id_type},
+                        UNIQUE(block_key, record_id))"""
+        )
+
+        con.executemany("REPLACE INTO indexed_records VALUES (?, ?)", block_keys)
+
+        con.execute(
+            """CREATE UNIQUE INDEX IF NOT EXISTS
+                       indexed_records_block_key_idx
+                       ON indexed_records
+                       (block_key, record_id)"""
+        )
+        con.execute("""ANALYZE""")
+
+        con.commit()
+        self._release(con)
+
+    def unindex(self, record_ids: Collection[RecordID]) -> None:
+        con = self._index_connection()
+        con.executemany(
+            """DELETE FROM indexed_records
+                           WHERE record_id = ?""",
+            ((k,) for k in record_ids),
+        )
+
+        con.commit()
+        self._release(con)
+
+    def search(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        id_type = core.sqlite_id_type(record_ids)
+        self._oversized = {}
+
+        con = self._index_connection()
+
+        con.execute("BEGIN")
+
+        con.execute(
+            f"""CREATE TEMPORARY TABLE blocking_map
+                       (block_key,
+                        record_id {id_type},
+                        UNIQUE(record_id, block_key))"""
+        )
+        con.executemany("INSERT OR IGNORE INTO blocking_map VALUES (?, ?)", block_keys)
+
+        if max_block_size is not None:
+            oversized = con.execute(
+                """SELECT block_key, n_indexed, COUNT(*) * n_indexed
+                   FROM (SELECT block_key,
+                                (SELECT COUNT(*) FROM indexed_records b
+                                 WHERE b.block_key = a.block_key) AS n_indexed
+                         FROM blocking_map a)
+                   WHERE n_indexed > ?
+                   GROUP BY block_key""",
+                (max_block_size,),
+            ).fetchall()
+            self._skip(con, ["blocking_map"], oversized)
+            self._oversized = {
+                block_key: (n_indexed, n_pairs)
+                for block_key, n_indexed, n_pairs in oversized
+            }
+
+        if self.stream_pairs:
+            pairs = con.execute(
+                """SELECT a.record_id, b.record_id
+                                   FROM blocking_map a
+                                   INNER JOIN indexed_records b
+                                   USING (block_key)
+                                   WHERE """
+                + self._first_shared("blocking_map", "indexed_records")
+                + """ ORDER BY a.record_id"""
+            )
+        else:
+            pairs = con.execute(
+                """SELECT DISTINCT a.record_id, b.record_id
+                                   FROM blocking_map a
+                                   INNER JOIN indexed_records b
+                                   USING (block_key)
+                                   ORDER BY a.record_id"""
+            )
+
+        yield from pairs
+
+        pairs.close()
+        con.execute("ROLLBACK")
+        self._release(con)
+
+    def close(self) -> None:
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+
+class SortedArrayBackend(BlockingBackend):
+    """
+    Sorts numpy arrays of hashed block keys, see
+    :mod:`dedupe.sorted_blocking`. Usually much faster than SQLite.
+
+    Oversized blocks are reported by the signed 64 bit hash of their
+    block key, :func:`dedupe.sorted_blocking.hash_block_key`, which is
+    the block key itself when it is already a hash.
+
+    Unless `in_memory` is True, arrays of more than `max_rows` rows are
+    sorted in runs on disk when pairing records. The index searched by
+    :meth:`search` is always kept in memory.
+    """
+
+    def __init__(
+        self, in_memory: bool = False, max_rows: int = sorted_blocking.MAX_ROWS
+    ):
+        super().__init__()
+        self.in_memory = in_memory
+        self.max_rows = max_rows
+
+        self._index_ids: list[RecordID]
+        self._index_codes: dict[RecordID, int]
+        self._index_keys: numpy.typing.NDArray[numpy.uint64]
+        self._index_values: numpy.typing.NDArray[numpy.uint64]
+        self.close()
+
+    @property
+    def _max_rows(self) -> Optional[int]:
+        return None if self.in_memory else self.max_rows
+
+    def pairs(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        self._oversized = {}
+        ids = sorted(record_ids)
+        codes = {record_id: code for code, record_id in enumerate(ids)}
+
+        code_block_keys = (
+            (block_key, codes[record_id]) for block_key, record_id in block_keys
+        )
+
+        for codes_a, codes_b in sorted_blocking.dedupe_pairs(
+            code_block_keys,
+            self._max_rows,
+            max_block_size=max_block_size,
+            oversized=self._oversized,
+        ):
+            for a, b in zip(codes_a.tolist(), codes_b.tolist()):
+                yield ids[a], ids[b]
+
+    def link_pairs(
+        self,
+        block_keys_1: BlockKeys,
+        record_ids_1: Collection[RecordID],
+        block_keys_2: BlockKeys,
+        record_ids_2: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        self._oversized = {}
+        ids_1 = sorted(record_ids_1)
+        ids_2 = sorted(record_ids_2)
+        codes_1 = {record_id: code for code, record_id in enumerate(ids_1)}
+        codes_2 = {record_id: code for code, record_id in enumerate(ids_2)}
+
+        code_block_keys_1 = (
+            (block_key, codes_1[record_id]) for block_key, record_id in block_keys_1
+        )
+        code_block_keys_2 = (
+            (block_key, codes_2[record_id]) for block_key, record_id in block_keys_2
+        )
+
+        for codes_a, codes_b in sorted_blocking.link_pairs(
+            code_block_keys_1,
+            code_block_keys_2,
+            self._max_rows,
+            max_block_size=max_block_size,
+            oversized=self._oversized,
+        ):
+            for a, b in zip(codes_a.tolist(), codes_b.tolist()):
+                yield ids_1[a], ids_2[b]
+
+    def index(self, block_keys: BlockKeys, record_ids: Collection[RecordID]) -> None:
+        codes = self._index_codes
+        for record_id in record_ids:
+            if record_id not in codes:
+                codes[record_id] = len(self._index_ids)
+                self._index_ids.append(record_id)
+
+        keys, values = hashed_rows(
+            (block_key, codes[record_id]) for block_key, record_id in block_keys
+        )
+        self._index_keys = numpy.concatenate((self._index_keys, keys))
+        self._index_values = numpy.concatenate((self._index_values, values))
+        self._index_sorted = False
+
+    def unindex(self, record_ids: Collection[RecordID]) -> None:
+        removed = [
+            self._index_codes.pop(record_id)
+            for record_id in record_ids
+            if record_id in self._index_codes
+        ]
+        keep = ~numpy.isin(self._index_values, numpy.array(removed, dtype="u8"))
+        self._index_keys = self._index_keys[keep]
+        self._index_values = self._index_values[keep]
+
+    def search(
+        self,
+        block_keys: BlockKeys,
+        record_ids: Collection[RecordID],
+        max_block_size: Optional[int] = None,
+    ) -> Iterator[RecordIDPair]:
+        self._oversized = {}
+        if not self._index_sorted:
+            self._index_keys, self._index_values = sorted_blocking.sort_unique(
+                self._index_keys, self._index_values
+            )
+            self._index_sorted = True
+
+        ids = sorted(record_ids)
+        codes = {record_id: code for code, record_id in enumerate(ids)}
+
+        keys, values = hashed_rows(
+            (block_key, codes[record_id]) for block_key, record_id in block_keys
+        )
+
+        index_keys = self._index_keys
+        starts = numpy.searchsorted(index_keys, keys, "left")
+        counts = numpy.searchsorted(index_keys, keys, "right") - starts
+
+        if max_block_size is not None:
+            too_big = counts > max_block_size
+            oversized_keys, first, n_queries = numpy.unique(
+                keys[too_big], return_index=True, return_counts=True
+            )
+            n_indexed = counts[too_big][first]
+            for key, n_query, n_index in zip(
+                oversized_keys.view("i8").tolist(),
+                n_queries.tolist(),
+                n_indexed.tolist(),
+            ):
+                self._oversized[key] = (n_index, n_query * n_index)
+            counts[too_big] = 0
+
+        # all the pairs are made in one batch, to sort them by query
+        rows = numpy.arange(len(keys))
+        max_pairs = max(1, int(counts.sum()))
+        for a, b in sorted_blocking.cartesian(
+            rows, numpy.ones_like(rows), starts, counts, max_pairs
+        ):
+            query_codes, index_codes = sorted_blocking.sort_unique(
+                values[a], self._index_values[b]
+            )
+            index_ids = self._index_ids
+            for query_code, index_code in zip(
+                query_codes.tolist(), index_codes.tolist()
+            ):
+                yield ids[query_code], index_ids[index_code]
+
+    def close(self) -> None:
+        self._index_ids = []
+        self._index_codes = {}
+        self._index_keys = numpy.empty(0, dtype="u8")
+        self._index_values = numpy.empty(0, dtype="u8")
+        self._index_sorted = True
+
+
+def hashed_rows(
+    block_keys: Iterable[tuple[BlockKey, int]]
+) -> tuple[numpy.typing.NDArray[numpy.uint64], numpy.typing.NDArray[numpy.uint64]]:
+    keys = []
+    codes = []
+    for block_key, code in block_keys:
+        keys.append(block_key)
+        codes.append(code)
+
+    return sorted_blocking.hash_block_keys(keys), numpy.array(codes, dtype="u8")
@@ -2,25 +2,35 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import collections
+import hashlib
+import itertools
 import logging
 import time
 from collections import defaultdict
 from typing import TYPE_CHECKING
 
+import dedupe.predicates
+from dedupe.predicate_functions import TOKEN_PREDICATES, Tokens
+
+from .backport import Pool
+
 if TYPE_CHECKING:
     from typing import (
+        AbstractSet,
         Any,
         Callable,
         DefaultDict,
         Generator,
         Iterable,
+        Iterator,
         List,
         Sequence,
         Union,
     )
 
-    import dedupe.predicates
-    from dedupe._typing import Data, Record, RecordID
+    from dedupe._typing import BlockKey, Data, Record, RecordDict, RecordID
+    from dedupe.core import RecordStore
     from dedupe.index import Index
 
     Docs = Union[Iterable[str], Iterable[Iterable[str]]]
@@ -34,9 +44,178 @@ def index_list() -> IndexList:
     return defaultdict(list)
 
 
+def hash_block_key(predicate_index: int, key: str | tuple[str, ...]) -> int:
+    """
+    A signed 64 bit integer hash of a key of the predicate at
+    `predicate_index`, which is the same in every process. The key of a
+    compound predicate is the tuple of the keys of its predicates.
+    """
+    if isinstance(key, tuple):
+        key = "\x1f".join(key)
+    digest = hashlib.blake2b(
+        (str(predicate_index) + "\x1f" + key).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class PredicatePlan(object):
+    """
+    Evaluates predicates, given along with their position among the
+    predicates of a fingerprinter, on one record at a time.
+
+    Each distinct simple predicate is evaluated once per record, even
+    when it is also a member of compound predicates, whose keys are
+    then combined from the keys of their members. String predicates on
+    the same field share the normalized value of the field, which is
+    tokenized at most once for all of them, see
+    :data:`dedupe.predicate_functions.TOKEN_PREDICATES`.
+    """
+
+    def __init__(
+        self, predicates: Iterable[tuple[int, dedupe.predicates.Predicate]]
+    ) -> None:
+        self.simple_predicates: list[dedupe.predicates.Predicate] = []
+        self.outputs: list[tuple[int, list[int], bool]] = []
+
+        slots: dict[Any, int] = {}
+        for i, predicate in predicates:
+            members = []
+            for part in predicate:
+                # equal index predicates can still have different
+                # indices, so only the same one is evaluated once
+                key = id(part) if hasattr(part, "index") else part
+                if key not in slots:
+                    slots[key] = len(self.simple_predicates)
+                    self.simple_predicates.append(part)
+                members.append(slots[key])
+
+            compound = isinstance(predicate, dedupe.predicates.CompoundPredicate)
+            self.outputs.append((i, members, compound))
+
+        # string predicates get the normalized field value, as
+        # tokens shared with the other string predicates on the field
+        self._string_functions: list[
+            tuple[str, Callable[[Tokens], AbstractSet[str]]] | None
+        ] = []
+        for predicate in self.simple_predicates:
+            if type(predicate).__call__ is dedupe.predicates.StringPredicate.__call__:
+                func = predicate.func  # type: ignore[attr-defined]
+                self._string_functions.append(
+                    (
+                        predicate.field,  # type: ignore[attr-defined]
+                        TOKEN_PREDICATES.get(func, _on_field(func)),
+                    )
+                )
+            else:
+                self._string_functions.append(None)
+
+    def __call__(
+        self, record: RecordDict, target: bool = False
+    ) -> Iterator[tuple[int, Iterable[Any], bool]]:
+        """
+        Yields the position of each predicate, its keys, and whether it
+        is a compound predicate, whose keys are tuples of the keys of
+        its members.
+        """
+        tokens: dict[str, Tokens] = {}
+        keys: list[AbstractSet[str]] = []
+        for predicate, string_function in zip(
+            self.simple_predicates, self._string_functions
+        ):
+            if string_function is None:
+                keys.append(predicate(record, target=target))
+            else:
+                field, func = string_function
+                column = record[field]
+                if column:
+                    if field not in tokens:
+                        tokens[field] = Tokens(dedupe.predicates.normalize(column))
+                    keys.append(func(tokens[field]))
+                else:
+                    keys.append(frozenset())
+
+        for i, members, compound in self.outputs:
+            if compound:
+                yield i, itertools.product(*[keys[m] for m in members]), True
+            else:
+                yield i, keys[members[0]], False
+
+
+def _on_field(
+    func: Callable[[str], AbstractSet[str]]
+) -> Callable[[Tokens], AbstractSet[str]]:
+    return lambda tokens: func(tokens.field)
+
+
+def join_key(key: tuple[str, ...]) -> str:
+    """The block key of a compound predicate from the keys of its members"""
+    # must escape : to avoid confusion with : join separator
+    return ":".join(b.replace(":", "\\:") for b in key)
+
+
+def fingerprint(
+    predicates: Iterable[tuple[int, dedupe.predicates.Predicate]],
+    records: Iterable[Record],
+    target: bool = False,
+    hashed: bool = False,
+) -> Generator[tuple[BlockKey, RecordID], None, None]:
+    """
+    The block keys of records from the predicates, given along with
+    their position among the predicates of a fingerprinter, see
+    :meth:`Fingerprinter.__call__`.
+    """
+    plan = PredicatePlan(predicates)
+    if hashed:
+        # the keys of compound predicates are hashed without joining
+        # and escaping them into strings
+        for record_id, instance in records:
+            for i, keys, _ in plan(instance, target):
+                for key in keys:
+                    yield hash_block_key(i, key), record_id
+    else:
+        suffixes = {i: ":" + str(i) for i, _, _ in plan.outputs}
+        for record_id, instance in records:
+            for i, keys, compound in plan(instance, target):
+                suffix = suffixes[i]
+                if compound:
+                    for key in keys:
+                        yield join_key(key) + suffix, record_id
+                else:
+                    for key in keys:
+                        yield key + suffix, record_id
+
+
+def _chunks(records: Iterable[Record], size: int) -> Iterator[list[Record]]:
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_worker_fingerprint: Any = None
+
+
+def _start_fingerprint_worker(
+    predicates: Sequence[tuple[int, dedupe.predicates.Predicate]],
+    target: bool,
+    hashed: bool,
+) -> None:
+    global _worker_fingerprint
+    _worker_fingerprint = (predicates, target, hashed)
+
+
+def _fingerprint_chunk(chunk: list[Record]) -> list[tuple[BlockKey, RecordID]]:
+    predicates, target, hashed = _worker_fingerprint
+    return list(fingerprint(predicates, chunk, target, hashed))
+
+
 class Fingerprinter(object):
     """Takes in a record and returns all blocks that record belongs to"""
 
+    chunk_size = 10000
+
     def __init__(self, predicates: Iterable[dedupe.predicates.Predicate]) -> None:
         self.predicates = predicates
 
@@ -57,8 +236,12 @@ class Fingerprinter(object):
                     self.index_predicates.append(predicate)
 
     def __call__(
-        self, records: Iterable[Record], target: bool = False
-    ) -> Generator[tuple[str, RecordID], None, None]:
+        self,
+        records: Iterable[Record],
+        target: bool = False,
+        hashed: bool = False,
+        num_cores: int = 1,
+    ) -> Generator[tuple[BlockKey, RecordID], None, None]:
         """
         Generate the predicates for records. Yields tuples of (predicate,
         record_id).
@@ -86,6 +269,18 @@ class Fingerprinter(object):
                     the `target` argument on one of your datasets,
                     you will dramatically reduce the total number
                     of comparisons without a loss of accuracy.
+            hashed: If True, block keys are 64 bit integer hashes of
+                    the predicate and its key, see
+                    :func:`hash_block_key`, instead of strings.
+                    Integer keys are smaller and faster to compare
+                    when pairing up records.
+            num_cores: If more than 1, records are fingerprinted
+                       in chunks of `chunk_size` records by a pool
+                       of that many processes. Predicates that use
+                       an index are still computed in this process,
+                       so the indices don't need to be copied. The
+                       block keys are the same as with one core,
+                       but they are not in the same order.
 
         .. code:: python
 
@@ -96,24 +291,79 @@ class Fingerprinter(object):
 
         """
 
-        start_time = time.perf_counter()
-        predicates = [
-            (":" + str(i), predicate) for i, predicate in enumerate(self.predicates)
-        ]
+        predicates = list(enumerate(self.predicates))
+        chunks = _chunks(records, self.chunk_size)
 
-        for i, record in enumerate(records):
-            record_id, instance = record
+        if num_cores > 1:
+            # starting processes isn't worth it for a single chunk
+            first_chunks = list(itertools.islice(chunks, 2))
+            if len(first_chunks) < 2:
+                num_cores = 1
+            chunks = itertools.chain(first_chunks, chunks)
 
-            for pred_id, predicate in predicates:
-                block_keys = predicate(instance, target=target)
-                for block_key in block_keys:
-                    yield block_key + pred_id, record_id
+        start_time = time.perf_counter()
+        if num_cores > 1:
+            yield from self._parallel(
+                predicates, chunks, target, hashed, num_cores, start_time
+            )
+        else:
+            for i, chunk in enumerate(chunks):
+                yield from fingerprint(predicates, chunk, target, hashed)
+                self._log_progress(i, start_time)
+
+    def _parallel(
+        self,
+        predicates: Sequence[tuple[int, dedupe.predicates.Predicate]],
+        chunks: Iterable[list[Record]],
+        target: bool,
+        hashed: bool,
+        num_cores: int,
+        start_time: float,
+    ) -> Generator[tuple[BlockKey, RecordID], None, None]:
+        # the indices of index predicates live in this process, and
+        # can be big, so they are not copied to the workers. Instead,
+        # we fingerprint with the index predicates here, while the
+        # workers fingerprint with the rest.
+        indexed = [
+            (i, predicate)
+            for i, predicate in predicates
+            if any(hasattr(part, "index") for part in predicate)
+        ]
+        unindexed = [
+            (i, predicate)
+            for i, predicate in predicates
+            if not any(hasattr(part, "index") for part in predicate)
+        ]
 
-            if i and i % 10000 == 0:
-                logger.info(
-                    "%(iteration)d, %(elapsed)f2 seconds",
-                    {"iteration": i, "elapsed": time.perf_counter() - start_time},
-                )
+        with Pool(
+            num_cores,
+            initializer=_start_fingerprint_worker,
+            initargs=(unindexed, target, hashed),
+        ) as pool:
+            pending: collections.deque[Any] = collections.deque()
+            for i, chunk in enumerate(chunks):
+                pending.append(pool.apply_async(_fingerprint_chunk, (chunk,)))
+                yield from fingerprint(indexed, chunk, target, hashed)
+
+                # don't read records much faster than the workers
+                # fingerprint them
+                while pending and (len(pending) > 2 * num_cores or pending[0].ready()):
+                    yield from pending.popleft().get()
+
+                self._log_progress(i, start_time)
+
+            while pending:
+                yield from pending.popleft().get()
+
+    def _log_progress(self, i: int, start_time: float) -> None:
+        if i:
+            logger.info(
+                "%(iteration)d, %(elapsed)f2 seconds",
+                {
+                    "iteration": i * self.chunk_size,
+                    "elapsed": time.perf_counter() - start_time,
+                },
+            )
 
     def reset_indices(self) -> None:
         """
@@ -187,7 +437,7 @@ class Fingerprinter(object):
                 predicate.index = index
                 predicate.bust_cache()
 
-    def index_all(self, data: Data) -> None:
+    def index_all(self, data: Data | RecordStore) -> None:
         for field in self.index_fields:
             unique_fields = {record[field] for record in data.values() if record[field]}
             self.index(unique_fields, field)
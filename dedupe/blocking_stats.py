@@ -0,0 +1,261 @@
+"""
+Statistics of the blocks that a set of predicates makes, to size a
+job, or to reject a set of predicates, before pairing up records.
+
+Records are fingerprinted into arrays of hashed block keys, which are
+sorted like in :mod:`dedupe.sorted_blocking`, but pairs of records are
+never generated. The number of distinct pairs is estimated by sampling
+pairs of records in blocks, and checking if the block is the first one
+the two records share, see
+:meth:`dedupe.sorted_blocking.SharedBlocks.first_shared`. Every
+distinct pair is in exactly one such first block.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy
+
+import dedupe.sorted_blocking as sorted_blocking
+from dedupe.blocking import PredicatePlan, hash_block_key, join_key
+
+if TYPE_CHECKING:
+    from typing import Optional, Sequence
+
+    import numpy.typing
+
+    from dedupe._typing import RecordDict
+    from dedupe.predicates import Predicate
+
+    Codes = numpy.typing.NDArray[numpy.uint64]
+    Counts = numpy.typing.NDArray[numpy.int64]
+
+
+class PredicateStats(NamedTuple):
+    """
+    The blocks of one predicate that pair up records, the number of
+    pairs they make, counting a pair once for every block it is in,
+    and the number of records in the largest one
+    """
+
+    predicate: Predicate
+    n_blocks: int
+    n_pairs: int
+    largest_block: int
+
+
+class BlockStats(NamedTuple):
+    """A block, by its block key like the fingerprinter makes it"""
+
+    block_key: str
+    n_records: int
+    n_pairs: int
+
+
+class BlockingStats(NamedTuple):
+    """
+    Statistics of the blocks of the fingerprinted records.
+
+    `n_pairs` counts a pair once for every block it is in, and
+    `distinct_pairs` is an estimate of the number of different pairs,
+    which is exact when there are at most as many pairs as the
+    pairs sampled. If only a sample of the records was fingerprinted,
+    `estimated_pairs` scales the distinct pairs up to all the
+    records. `block_sizes` maps powers of two to the number of blocks
+    that pair up records and have at least that many records, but
+    fewer than the next power of two.
+    """
+
+    n_records: int
+    n_pairs: int
+    distinct_pairs: int
+    estimated_pairs: int
+    block_sizes: dict[int, int]
+    predicates: list[PredicateStats]
+    largest_blocks: list[BlockStats]
+
+
+def blocking_stats(
+    predicates: Sequence[Predicate],
+    records_1: Sequence[RecordDict],
+    records_2: Optional[Sequence[RecordDict]] = None,
+    scale: float = 1.0,
+    n_largest: int = 10,
+    max_sampled_pairs: int = 100000,
+    seed: Optional[int] = None,
+) -> BlockingStats:
+    """
+    Statistics of the blocks of `records_1`, or, if `records_2` is
+    given, of the blocks that pair a record of `records_1` with one of
+    `records_2`, which are fingerprinted as the target. Index
+    predicates must already be indexed.
+
+    The estimated distinct pairs are scaled by `scale`, and at most
+    `max_sampled_pairs` pairs are sampled to estimate them.
+    """
+    plan = PredicatePlan(enumerate(predicates))
+
+    preds: list[int] = []
+    keys: list[int] = []
+    codes: list[int] = []
+    datasets = [(records_1, False)]
+    if records_2 is not None:
+        datasets.append((records_2, True))
+    code = 0
+    for records, target in datasets:
+        for record in records:
+            for i, block_keys, _ in plan(record, target):
+                for key in block_keys:
+                    preds.append(i)
+                    keys.append(hash_block_key(i, key))
+                    codes.append(code)
+            code += 1
+
+    hashes = numpy.array(keys, dtype="i8").view("u8")
+    order = numpy.lexsort((numpy.array(codes, dtype="u8"), hashes))
+    hashes = hashes[order]
+    row_codes = numpy.array(codes, dtype="u8")[order]
+    row_preds = numpy.array(preds, dtype=numpy.intp)[order]
+
+    starts = sorted_blocking.block_starts(hashes)
+    if not len(hashes):
+        starts = starts[:0]
+    sizes = numpy.diff(numpy.append(starts, len(hashes))).astype(numpy.int64)
+    if records_2 is None:
+        a_sizes = b_sizes = sizes
+        pairs = sizes * (sizes - 1) // 2
+    else:
+        # the records of the second dataset sort last in every block
+        in_second = (row_codes >= len(records_1)).astype(numpy.int64)
+        b_sizes = numpy.add.reduceat(in_second, starts) if len(starts) else sizes
+        a_sizes = sizes - b_sizes
+        pairs = a_sizes * b_sizes
+
+    block_preds = row_preds[starts]
+    pairing = pairs > 0
+
+    n_blocks = numpy.bincount(block_preds[pairing], minlength=len(predicates))
+    predicate_pairs = numpy.zeros(len(predicates), dtype=numpy.int64)
+    numpy.add.at(predicate_pairs, block_preds, pairs)
+    largest = numpy.zeros(len(predicates), dtype=numpy.int64)
+    numpy.maximum.at(largest, block_preds[pairing], sizes[pairing])
+
+    buckets = numpy.floor(numpy.log2(sizes[pairing])).astype(numpy.int64)
+    block_sizes = {
+        2**bucket: int(count)
+        for bucket, count in enumerate(numpy.bincount(buckets))
+        if count
+    }
+
+    distinct = _distinct_pairs(
+        row_codes,
+        starts,
+        sizes,
+        a_sizes,
+        b_sizes,
+        pairs,
+        records_2 is None,
+        max_sampled_pairs,
+        numpy.random.default_rng(seed),
+    )
+
+    # a block that pairs up records starts with a record of the first
+    # dataset, which gives the key of the block back
+    largest_blocks = []
+    for block in numpy.argsort(-pairs, kind="stable")[:n_largest]:
+        if not pairs[block]:
+            break
+        start = starts[block]
+        record = records_1[int(row_codes[start])]
+        block_key = _block_key(plan, int(row_preds[start]), hashes[start], record)
+        largest_blocks.append(
+            BlockStats(block_key, int(sizes[block]), int(pairs[block]))
+        )
+
+    return BlockingStats(
+        n_records=code,
+        n_pairs=int(pairs.sum()),
+        distinct_pairs=distinct,
+        estimated_pairs=int(round(distinct * scale)),
+        block_sizes=block_sizes,
+        predicates=[
+            PredicateStats(
+                predicate, int(n_blocks[i]), int(predicate_pairs[i]), int(largest[i])
+            )
+            for i, predicate in enumerate(predicates)
+        ],
+        largest_blocks=largest_blocks,
+    )
+
+
+def _distinct_pairs(
+    row_codes: Codes,
+    starts: numpy.typing.NDArray[numpy.intp],
+    sizes: Counts,
+    a_sizes: Counts,
+    b_sizes: Counts,
+    pairs: Counts,
+    dedupe: bool,
+    max_sampled_pairs: int,
+    rng: numpy.random.Generator,
+) -> int:
+    total = int(pairs.sum())
+    if not total:
+        return 0
+
+    # the blocks of every record, with blocks numbered in sorted order
+    stride = len(starts) + 1
+    row_blocks = numpy.repeat(numpy.arange(len(starts), dtype="u8"), sizes)
+    shared = sorted_blocking.SharedBlocks(
+        numpy.sort(row_codes * numpy.uint64(stride) + row_blocks), stride
+    )
+
+    b_starts = starts + sizes - b_sizes
+    if total <= max_sampled_pairs:
+        n_distinct = 0
+        if dedupe:
+            batches = sorted_blocking.triangle(starts, sizes, max_sampled_pairs)
+        else:
+            batches = sorted_blocking.cartesian(
+                starts, a_sizes, b_starts, b_sizes, max_sampled_pairs
+            )
+        for a, b in batches:
+            codes_a, codes_b = row_codes[a], row_codes[b]
+            n_distinct += int(
+                shared.first_shared(codes_a, codes_b, row_blocks[a]).sum()
+            )
+        return n_distinct
+
+    # sample blocks by how many pairs they make, and then a pair of
+    # each sampled block
+    blocks = numpy.searchsorted(
+        numpy.cumsum(pairs), rng.integers(0, total, max_sampled_pairs), "right"
+    )
+    a = starts[blocks] + rng.integers(0, a_sizes[blocks])
+    if dedupe:
+        # a second, different record of the block
+        b = starts[blocks] + rng.integers(0, sizes[blocks] - 1)
+        b += b >= a
+    else:
+        b = b_starts[blocks] + rng.integers(0, b_sizes[blocks])
+
+    first = shared.first_shared(row_codes[a], row_codes[b], row_blocks[a])
+    return int(round(total * first.mean()))
+
+
+def _block_key(
+    plan: PredicatePlan,
+    i: int,
+    hashed: numpy.uint64,
+    record: RecordDict,
+) -> str:
+    """The block key of predicate `i` of a record with the given hash"""
+    for j, keys, compound in plan(record):
+        if j != i:
+            continue
+        for key in keys:
+            if numpy.uint64(hash_block_key(i, key) % 2**64) == hashed:
+                return (join_key(key) if compound else key) + ":" + str(i)
+
+    raise ValueError("No block key of the record has the hash %d" % hashed)
@@ -12,8 +12,18 @@ from typing import Generator, Iterable, Sequence, cast
 import numpy
 import numpy.typing
 import scipy.cluster.hierarchy
-
-from dedupe._typing import ArrayLinks, Clusters, RecordID, Scores, TupleLinks
+import scipy.sparse
+import scipy.sparse.csgraph
+
+from dedupe._typing import (
+    ArrayLinks,
+    ClusterInt,
+    Clusters,
+    ClustersInt,
+    RecordID,
+    Scores,
+    TupleLinks,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -260,6 +270,104 @@ def cluster(
                 yield tuple(ids), (score,) * 2
 
 
+class IncrementalClusters(object):
+    """
+    Clusters of records, identified by integer codes, that are kept up
+    to date as records are added, along with the scores of their pairs.
+
+    Every scored pair is kept, and each record is labeled with its
+    connected component in the graph of scored pairs. When records are
+    added, only the components that their pairs touch are clustered
+    again, from all their pairs, which gives the same clusters as
+    clustering all the pairs at once with :func:`cluster`.
+    """
+
+    def __init__(self, threshold: float = 0.5, max_components: int = 30000):
+        self.threshold = threshold
+        self.max_components = max_components
+
+        self.edges: Scores = numpy.empty(0, dtype=[("pairs", "i8", 2), ("score", "f4")])
+        # the component of each code, or -1 if it is in no scored pair
+        self.components = numpy.empty(0, dtype=numpy.int64)
+        self.clusters: dict[int, list[ClusterInt]] = {}
+        self._n_components = 0
+
+    def update(self, n_codes: int, scores: Scores) -> list[ClusterInt]:
+        """
+        Add the records with codes up to `n_codes`, and the scores of
+        their pairs, which must not pair up two earlier records.
+        Returns the clusters that changed, and, as clusters of one
+        record, the new records, and the records of the components
+        clustered again, that are in no cluster.
+        """
+        n_old = len(self.components)
+        components = numpy.full(n_codes, -1, dtype=numpy.int64)
+        components[:n_old] = self.components
+
+        edges = numpy.empty(len(scores), dtype=self.edges.dtype)
+        # the smaller code comes first, like the smaller record id
+        edges["pairs"] = numpy.sort(scores["pairs"], axis=1)
+        edges["score"] = scores["score"]
+
+        touched = numpy.unique(components[edges["pairs"]])
+        touched = touched[touched >= 0]
+        in_touched = numpy.isin(components[self.edges["pairs"][:, 0]], touched)
+        sub_graph = numpy.concatenate((self.edges[in_touched], edges))
+        self.edges = numpy.concatenate((self.edges, edges))
+
+        affected = numpy.isin(components, touched)
+        affected[n_old:] = True
+        for label in touched.tolist():
+            self.clusters.pop(label, None)
+
+        codes, positions = numpy.unique(sub_graph["pairs"], return_inverse=True)
+        positions = positions.reshape(-1, 2)
+        graph = scipy.sparse.coo_matrix(
+            (
+                numpy.ones(len(positions), dtype=numpy.int8),
+                (positions[:, 0], positions[:, 1]),
+            ),
+            shape=(len(codes), len(codes)),
+        )
+        n_components, labels = scipy.sparse.csgraph.connected_components(
+            graph, directed=False
+        )
+        components[codes] = labels + self._n_components
+        self._n_components += n_components
+        self.components = components
+
+        changed: list[ClusterInt] = []
+        if len(sub_graph):
+            for cluster_codes, cluster_scores in cluster(
+                sub_graph, self.threshold, self.max_components
+            ):
+                cluster_codes = tuple(int(code) for code in cluster_codes)
+                label = int(components[cluster_codes[0]])
+                self.clusters.setdefault(label, []).append(
+                    (cluster_codes, cluster_scores)
+                )
+                changed.append((cluster_codes, cluster_scores))
+
+        clustered = {code for cluster_codes, _ in changed for code in cluster_codes}
+        for code in numpy.flatnonzero(affected).tolist():
+            if code not in clustered:
+                changed.append(((code,), (1.0,)))
+
+        return changed
+
+    def all_clusters(self) -> ClustersInt:
+        """All the clusters, and the records in no cluster, as clusters of one"""
+        clustered: set[int] = set()
+        for clusters in self.clusters.values():
+            for cluster_codes, scores in clusters:
+                clustered.update(cluster_codes)
+                yield cluster_codes, scores
+
+        for code in range(len(self.components)):
+            if code not in clustered:
+                yield (code,), (1.0,)
+
+
 def confidences(
     cluster: Sequence[int],
     squared_distances: numpy.typing.NDArray[numpy.float_],
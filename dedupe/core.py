@@ -5,20 +5,28 @@ from __future__ import annotations
 import collections
 import functools
 import itertools
+import logging
+import mmap
 import multiprocessing
 import multiprocessing.dummy
 import os
+import pickle
 import queue
+import shutil
 import tempfile
+import threading
+import time
+import weakref
 from typing import TYPE_CHECKING, overload
 
 import numpy
-
-from dedupe.backport import RLock
+import scipy.special
+import sklearn.linear_model
 
 if TYPE_CHECKING:
     from typing import (
         Any,
+        Callable,
         Generator,
         Iterable,
         Iterator,
@@ -28,99 +36,607 @@ if TYPE_CHECKING:
         Union,
     )
 
+    import numpy.typing
+
     from dedupe._typing import (
-        Block,
+        BlockInt,
         Blocks,
+        BlockStr,
         Classifier,
-        ClosableJoinable,
         Data,
         FeaturizerFunction,
         Literal,
-        MapLike,
+        Record,
+        RecordDict,
+        RecordDictPair,
         RecordID,
         RecordIDDType,
         RecordPairs,
+        Scorer,
         Scores,
+        ScoringJob,
     )
+    from dedupe.datamodel import Cascade
 
     _Queue = Union[multiprocessing.dummy.Queue, multiprocessing.Queue]
+    RecordStores = tuple["RecordStore", "RecordStore"]
+
+logger = logging.getLogger(__name__)
 
 
 class BlockingError(Exception):
     pass
 
 
-class ScoreDupes(object):
+class RecordStore(object):
+    """
+    A read-only store of records, written once to a file on disk.
+
+    Records are looked up by their position, or code, in the
+    store. When a store is sent to other processes, only the path to
+    the file and the offsets of the records are pickled, and each
+    process memory maps the file when it first needs a record. This
+    lets us send pairs of codes to the scoring processes, instead of
+    pickling the same records over and over again.
+
+    A store can also stand in for the dictionary of records that
+    :meth:`dedupe.Dedupe.partition`, :meth:`dedupe.RecordLink.join` and
+    their `pairs` methods take, for data that doesn't fit in memory.
+    The records are then written to disk as they are read from
+    `records`, which can be any iterator of record ids and records,
+    streamed back in order to fingerprint them, and read from the
+    file by code only when a pair of records is scored. Only the
+    record ids are kept in memory.
+
+    If `in_memory` is true, the records are just kept in a list,
+    which is all we need when the records are scored by threads of
+    this process. Otherwise the file is written in `directory`, or
+    the default temporary directory.
+    """
+
+    def __init__(
+        self,
+        records: Iterable[Record],
+        in_memory: bool = False,
+        directory: Optional[str] = None,
+    ) -> None:
+        self.ids: list[RecordID] = []
+        self.path: Optional[str] = None
+        self._records: Optional[list[RecordDict]] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+        if in_memory:
+            self._records = []
+            for record_id, record in records:
+                self.ids.append(record_id)
+                self._records.append(record)
+            self.offsets = numpy.arange(len(self.ids) + 1, dtype=numpy.int64)
+            return
+
+        fd, self.path = tempfile.mkstemp(dir=directory)
+
+        offsets = [0]
+        with os.fdopen(fd, "wb") as f:
+            for record_id, record in records:
+                self.ids.append(record_id)
+                f.write(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+                offsets.append(f.tell())
+
+        self.offsets = numpy.array(offsets, dtype=numpy.int64)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code: int) -> RecordDict:
+        if self._records is not None:
+            return self._records[code]
+
+        if self._mmap is None:
+            assert self.path is not None
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start, stop = self.offsets[code : code + 2]
+        record: RecordDict = pickle.loads(self._mmap[start:stop])
+        return record
+
+    def keys(self) -> list[RecordID]:
+        """The record ids, in code order"""
+        return self.ids
+
+    def values(self) -> Iterator[RecordDict]:
+        """Read the records back, in code order"""
+        if self._records is not None:
+            yield from self._records
+            return
+
+        assert self.path is not None
+        with open(self.path, "rb") as f:
+            for _ in range(len(self)):
+                yield pickle.load(f)
+
+    def items(self) -> Iterator[tuple[RecordID, RecordDict]]:
+        """Read the record ids and records back, in code order"""
+        return zip(self.ids, self.values())
+
+    def codes(self) -> dict[RecordID, int]:
+        """Return a dictionary from record ids to their codes in the store"""
+        return {record_id: code for code, record_id in enumerate(self.ids)}
+
+    def mean_record_size(self) -> Optional[float]:
+        """
+        The average size of a pickled record in the store, or None
+        for an in-memory store
+        """
+        if self._records is not None or not len(self):
+            return None
+        return float(self.offsets[-1]) / len(self)
+
+    def code_type(self) -> str:
+        """The smallest integer type that can hold any code of the store"""
+        return "i4" if len(self) < 2**31 else "i8"
+
+    def release(self) -> None:
+        """Unmap the file of the store, until a record is needed again"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def close(self) -> None:
+        self.release()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self) -> "RecordStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the scoring processes only need codes, so we don't
+        # send them the record ids
+        odict = self.__dict__.copy()
+        odict["_mmap"] = None
+        odict["ids"] = []
+        return odict
+
+
+class ScoringPool(object):
+    """
+    A pool of long-lived scoring workers.
+
+    The featurizer and classifier are sent to every worker once, when
+    the pool starts. After that, each call to :func:`scoreDuplicates`
+    or :func:`scoreGazette` with the pool only sends the workers a
+    small job describing the call, followed by the chunks of pairs to
+    score. With `num_cores` below 2, the pool is a single thread of
+    this process.
+    """
+
     def __init__(
         self,
         featurizer: FeaturizerFunction,
-        classifier: Classifier,
-        records_queue: _Queue,
-        exception_queue: _Queue,
-        score_file_path: str,
-        dtype: numpy.dtype,
-        offset,
+        classifier: Scorer,
+        num_cores: int = 1,
     ):
+        if num_cores < 2:
+            from multiprocessing.dummy import Process, Queue
+        else:
+            from .backport import Process, Queue  # type: ignore
+
         self.featurizer = featurizer
         self.classifier = classifier
-        self.records_queue = records_queue
-        self.exception_queue = exception_queue
-        self.score_file_path = score_file_path
-        self.dtype = dtype
-        self.offset = offset
+        self.num_workers = max(num_cores, 1)
+
+        self._lock = threading.Lock()
+        self._data_queue: _Queue = Queue(2 * self.num_workers)
+        self._result_queue: _Queue = Queue()
+        self._control_queues: list[_Queue] = [Queue() for _ in range(self.num_workers)]
+
+        self._workers = []
+        for worker_id, control_queue in enumerate(self._control_queues):
+            worker = Process(
+                target=score_worker,
+                args=(
+                    featurizer,
+                    classifier,
+                    worker_id,
+                    control_queue,
+                    self._data_queue,
+                    self._result_queue,
+                ),
+            )
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        self._finalizer = weakref.finalize(
+            self,
+            _stop_workers,
+            self._workers,
+            self._control_queues,
+            self._data_queue,
+            True,
+        )
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self) -> None:
+        """Stop the workers once they are done with the current job"""
+        with self._lock:
+            self._finalizer()
+
+    def __enter__(self) -> "ScoringPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def map(
+        self,
+        job: ScoringJob,
+        items: Iterable[Any],
+        chunk_size: int = 20000,
+        pack: Optional[Callable[[tuple[Any, ...]], Any]] = None,
+        chunk_sizer: Optional[ChunkSizer] = None,
+        item_bytes: Optional[float] = None,
+    ) -> list[Any]:
+        """
+        Run `job` on chunks of `items` in the workers, and return
+        everything the job returned for the chunks, in no particular
+        order. See :meth:`imap`.
+        """
+        return list(self.imap(job, items, chunk_size, pack, chunk_sizer, item_bytes))
+
+    def imap(
+        self,
+        job: ScoringJob,
+        items: Iterable[Any],
+        chunk_size: int = 20000,
+        pack: Optional[Callable[[tuple[Any, ...]], Any]] = None,
+        chunk_sizer: Optional[ChunkSizer] = None,
+        item_bytes: Optional[float] = None,
+    ) -> Iterator[Any]:
+        """
+        Run `job` on chunks of `items` in the workers, and yield what
+        the job returns for each chunk as soon as it comes back, in no
+        particular order. Only one job runs at a time, so the pool
+        can't be used for another job until the results are exhausted.
+        If they are not, the workers are stopped.
+
+        If a `chunk_sizer` is given, it picks the size of each chunk
+        from how long the workers took on the previous chunks, instead
+        of using `chunk_size`. See :func:`fillQueue`.
+        """
+        with self._lock:
+            if self.closed:
+                raise ValueError("The scoring pool is closed")
+
+            self._results: list[Any] = []
+            self._errors: list[Exception] = []
+            self._done = 0
+            self._chunk_sizer = chunk_sizer
+
+            try:
+                for control_queue in self._control_queues:
+                    control_queue.put(job)
+
+                for chunk in chunks(items, chunk_size, pack, chunk_sizer, item_bytes):
+                    self.put(chunk)
+                    yield from self._pop_results()
+
+                for _ in self._workers:
+                    self.put(None)
+
+                while self._done < len(self._workers):
+                    self._receive(timeout=1)
+                    yield from self._pop_results()
+
+            except BaseException:
+                # the workers could be anywhere in the job, so we can't
+                # use them again
+                if self._finalizer.detach() is not None:
+                    _stop_workers(
+                        self._workers, self._control_queues, self._data_queue, False
+                    )
+                raise
+
+            errors = self._errors
+            self._results, self._errors = [], []
+
+        if chunk_sizer is not None:
+            logger.debug("chunk sizes for %s: %s", type(job).__name__, chunk_sizer)
 
-    def __call__(self) -> None:
+        if errors:
+            raise ChildProcessError from errors[0]
+
+    def _pop_results(self) -> list[Any]:
+        results, self._results = self._results, []
+        return results
+
+    def put(self, item: Any) -> None:
+        """
+        Put a chunk on the queue of the workers, making sure that they
+        are still alive while we wait for room on the queue. While we
+        are at it, we pick up what the workers have sent back.
+        """
         while True:
-            record_pairs: Optional[RecordPairs] = self.records_queue.get()
-            if record_pairs is None:
+            while self._receive():
+                pass
+
+            try:
+                self._data_queue.put(item, timeout=1)
+            except queue.Full:
+                self._check_workers()
+            else:
+                return
+
+    def _receive(self, timeout: Optional[float] = None) -> bool:
+        """
+        Handle one message from the workers. Without a timeout, only
+        handle a message that is already waiting.
+        """
+        try:
+            if timeout is None:
+                kind, value = self._result_queue.get_nowait()
+            else:
+                kind, value = self._result_queue.get(timeout=timeout)
+        except queue.Empty:
+            self._check_workers()
+            return False
+
+        if kind == "timing":
+            if self._chunk_sizer is not None:
+                self._chunk_sizer.observe(*value)
+        elif kind == "done":
+            self._done += 1
+            if value is not None:
+                self._errors.append(value)
+        else:
+            self._results.append(value)
+
+        return True
+
+    def _check_workers(self) -> None:
+        if not all(worker.is_alive() for worker in self._workers):
+            raise ChildProcessError("A scoring process stopped unexpectedly")
+
+
+def score_worker(
+    featurizer: FeaturizerFunction,
+    classifier: Scorer,
+    worker_id: int,
+    control_queue: _Queue,
+    data_queue: _Queue,
+    result_queue: _Queue,
+) -> None:
+    """
+    The main loop of a worker of a ScoringPool. The worker waits for
+    a job, runs it on chunks from the data queue until it gets a
+    poison pill and then reports that it is done, along with the first
+    exception the job raised, if any.
+    """
+    while True:
+        job: Optional[ScoringJob] = control_queue.get()
+        if job is None:
+            break
+
+        error: Optional[Exception] = None
+        try:
+            job.start(featurizer, classifier, worker_id)
+        except Exception as e:
+            error = e
+
+        # keep taking chunks off the queue after an error, so that the
+        # pool stays in step
+        while True:
+            chunk = data_queue.get()
+            if chunk is None:
                 break
 
+            if error is None:
+                try:
+                    start = time.perf_counter()
+                    result = job(chunk)
+                    seconds = time.perf_counter() - start
+                except Exception as e:
+                    error = e
+                else:
+                    result_queue.put(("timing", (len(chunk), seconds)))
+                    if result is not None:
+                        result_queue.put(("result", result))
+
+        try:
+            job.finish()
+        except Exception as e:
+            error = error or e
+
+        if error is not None:
             try:
-                self.fieldDistance(record_pairs)
-            except Exception as e:
-                self.exception_queue.put(e)
-                raise
+                pickle.dumps(error)
+            except Exception:
+                error = ChildProcessError(repr(error))
+
+        result_queue.put(("done", error))
+
+
+def _stop_workers(
+    workers: Sequence[Any],
+    control_queues: Sequence[_Queue],
+    data_queue: _Queue,
+    clean: bool,
+) -> None:
+    if not clean:
+        processes = [worker for worker in workers if hasattr(worker, "terminate")]
+        for process in processes:
+            process.terminate()
+
+        # threads can't be terminated, so let them run out the
+        # current job
+        for _ in range(len(workers) - len(processes)):
+            data_queue.put(None)
+
+    for control_queue in control_queues:
+        control_queue.put(None)
+
+    for worker in workers:
+        worker.join()
+
+
+class ScoreDupes(object):
+    """
+    A scoring job for chunks of record pairs. Every worker appends the
+    scored pairs to its own shard file, so that workers never have to
+    wait on each other to write their results.
+    """
+
+    def __init__(
+        self,
+        score_file_path: str,
+        dtype: numpy.dtype,
+        record_stores: Optional[RecordStores] = None,
+        threshold: float = 0.0,
+        cascade: Optional[Cascade] = None,
+    ):
+        self.score_file_path = score_file_path
+        self.dtype = dtype
+        self.record_stores = record_stores
+        self.threshold = threshold
+        self.cascade = cascade
+
+    def start(
+        self, featurizer: FeaturizerFunction, classifier: Scorer, worker_id: int
+    ) -> None:
+        self.featurizer = featurizer
+        self.classifier = classifier
+        self.score_file = open(self.score_file_path + "_%d" % worker_id, "ab")
+
+    def __call__(self, record_pairs: RecordPairs) -> None:
+        scored_pairs = self.fieldDistance(record_pairs)
+        if scored_pairs is not None:
+            self.score_file.write(scored_pairs.tobytes())
+
+    def finish(self) -> None:
+        self.score_file.close()
+
+        if self.record_stores is not None:
+            for store in self.record_stores:
+                store.release()
+
+        # each scoring process has its own comparator caches, so
+        # report how well they did here
+        cache_info = getattr(
+            getattr(self.featurizer, "__self__", None), "cache_info", None
+        )
+        if cache_info is not None and cache_info():
+            logger.debug("comparator caches: %s", cache_info())
+
+        if self.cascade is not None:
+            logger.debug(
+                "cascade dropped %d of %d pairs",
+                self.cascade.pruned,
+                self.cascade.pairs,
+            )
+
+    def fieldDistance(self, record_pairs: RecordPairs) -> Optional[Scores]:
+        if self.record_stores is None:
+            record_ids, records = zip(
+                *(zip(*record_pair) for record_pair in record_pairs)
+            )
+        else:
+            record_ids, records = self.lookup(record_pairs)  # type: ignore[arg-type]
 
-    def fieldDistance(self, record_pairs: RecordPairs) -> None:
-        record_ids, records = zip(*(zip(*record_pair) for record_pair in record_pairs))
         if not records:
-            return
+            return None
+
+        if self.cascade is not None:
+            keep = self.cascade.could_score_above(records, self.threshold)
+            if not keep.all():
+                records = [pair for pair, kept in zip(records, keep) if kept]
+                record_ids = numpy.asarray(record_ids)[keep]
+                if not records:
+                    return None
 
         features = self.featurizer(records)
         scores = self.classifier.predict_proba(features)[:, -1]
 
-        mask = scores > 0
+        mask = scores > self.threshold
         if not mask.any():
-            return
-        scores = scores[mask]
-        record_id_array = numpy.array(record_ids)[mask]
-
-        with self.offset.get_lock():
-            fp: Scores
-            fp = numpy.memmap(
-                self.score_file_path,
-                dtype=self.dtype,
-                offset=self.offset.value,
-                shape=(len(record_id_array),),
-            )
-            fp["pairs"] = record_id_array
-            fp["score"] = scores
-            fp.flush()
+            return None
 
-            self.offset.value += len(record_id_array) * self.dtype.itemsize
+        scored_pairs: Scores = numpy.empty(mask.sum(), dtype=self.dtype)
+        scored_pairs["pairs"] = numpy.array(record_ids)[mask]
+        scored_pairs["score"] = scores[mask]
+
+        return scored_pairs
+
+    def lookup(
+        self, code_pairs: numpy.typing.NDArray[numpy.int64]
+    ) -> tuple[numpy.typing.NDArray[numpy.int64], list[RecordDictPair]]:
+        """
+        Get the records for pairs of codes from the record
+        stores. Records in big blocks appear in many pairs, so each
+        distinct record is only read once per chunk, and the records
+        are read in code order, so that a store on disk is read
+        forward. The codes themselves stand in for the record ids in
+        the scores.
+        """
+        assert self.record_stores is not None
+        store_a, store_b = self.record_stores
+
+        codes_a = code_pairs[:, 0].tolist()
+        codes_b = code_pairs[:, 1].tolist()
+
+        if store_b is store_a:
+            records_a = {code: store_a[code] for code in sorted({*codes_a, *codes_b})}
+            records_b = records_a
+        else:
+            records_a = {code: store_a[code] for code in sorted(set(codes_a))}
+            records_b = {code: store_b[code] for code in sorted(set(codes_b))}
+
+        records = [(records_a[a], records_b[b]) for a, b in zip(codes_a, codes_b)]
+
+        return code_pairs, records
 
 
 def scoreDuplicates(
     record_pairs: RecordPairs,
     featurizer: FeaturizerFunction,
-    classifier: Classifier,
+    classifier: Scorer,
     num_cores: int = 1,
+    record_stores: Optional[RecordStores] = None,
+    threshold: float = 0.0,
+    pool: Optional[ScoringPool] = None,
+    chunk_sizer: Optional[ChunkSizer] = None,
+    cascade: Optional[Cascade] = None,
 ) -> Scores:
-    if num_cores < 2:
-        from multiprocessing.dummy import Process, Queue
-    else:
-        from .backport import Process, Queue  # type: ignore
-
+    """
+    Score pairs of records and write the scores of the pairs that
+    have a score above `threshold` to a memory mapped file. Pairs
+    at or below the threshold are dropped by the scoring processes
+    and never written out.
+
+    If `record_stores` is given, `record_pairs` should be pairs of
+    codes of records in the two stores rather than pairs of
+    records. The scores will then also hold pairs of codes, which
+    take much less room than string ids and are much faster to
+    cluster. Use :func:`decode_scores` to get back the record ids.
+
+    If a `pool` is given, the pairs are scored by its workers with
+    the featurizer and classifier it was started with. Otherwise, a
+    pool with `num_cores` workers is started just for this call.
+
+    The pairs are sent to the workers in chunks, and the size of the
+    chunks is adapted to how long the workers take on them by
+    `chunk_sizer`, see :class:`ChunkSizer`.
+
+    If a `cascade` is given, the expensive distances are only computed
+    for the pairs that could score above `threshold`, see
+    :class:`dedupe.datamodel.Cascade`.
+    """
     first, record_pairs = peek(record_pairs)
     if first is None:
         raise BlockingError(
@@ -130,48 +646,55 @@ def scoreDuplicates(
             "more training data."
         )
 
-    record_pairs_queue: _Queue = Queue(2)
-    exception_queue: _Queue = Queue()
     scored_pairs_file, score_file_path = tempfile.mkstemp()
     os.close(scored_pairs_file)
 
-    # explicitly defining the lock from the "spawn context" seems to
-    # be necessary for python 3.7 on mac os.
-    offset = multiprocessing.Value("Q", 0, lock=RLock())
+    if chunk_sizer is None:
+        chunk_sizer = ChunkSizer()
 
-    id_type = sniff_id_type(first)
+    pack: Optional[Callable[[tuple[Any, ...]], Any]] = None
+    item_bytes: Optional[float] = None
+    if record_stores is None:
+        id_type = sniff_id_type(first)
+    else:
+        store_a, store_b = record_stores
+        id_type = max(store_a.code_type(), store_b.code_type())
+        pack = functools.partial(numpy.array, dtype=id_type)
+        # the workers read the records of the pairs from the stores,
+        # so that's what takes up their memory, not the codes
+        record_sizes = (store_a.mean_record_size(), store_b.mean_record_size())
+        if None not in record_sizes:
+            item_bytes = sum(record_sizes)  # type: ignore[arg-type]
     dtype = numpy.dtype([("pairs", id_type, 2), ("score", "f4")])
 
-    n_map_processes = max(num_cores, 1)
-    score_records = ScoreDupes(
-        featurizer,
-        classifier,
-        record_pairs_queue,
-        exception_queue,
-        score_file_path,
-        dtype,
-        offset,
-    )
-    map_processes = [Process(target=score_records) for _ in range(n_map_processes)]
-
-    for process in map_processes:
-        process.start()
+    own_pool = pool is None
+    if pool is None:
+        pool = ScoringPool(featurizer, classifier, num_cores)
 
-    fillQueue(record_pairs_queue, record_pairs, n_map_processes)
-
-    for process in map_processes:
-        process.join()
+    # every worker writes to its own shard of the scores, and we
+    # stitch the shards together when they are all done
+    shard_paths = [score_file_path + "_%d" % i for i in range(pool.num_workers)]
 
     try:
-        exc = exception_queue.get_nowait()
-    except queue.Empty:
-        pass
-    else:
-        raise ChildProcessError from exc
+        pool.map(
+            ScoreDupes(score_file_path, dtype, record_stores, threshold, cascade),
+            record_pairs,
+            pack=pack,
+            chunk_sizer=chunk_sizer,
+            item_bytes=item_bytes,
+        )
+        merge_shards(shard_paths, score_file_path)
+
+    finally:
+        if own_pool:
+            pool.close()
+        for shard_path in shard_paths:
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
 
     scored_pairs: Scores
 
-    if offset.value:  # type: ignore
+    if os.path.getsize(score_file_path):
         scored_pairs = numpy.memmap(score_file_path, dtype=dtype)
     else:
         scored_pairs = numpy.array([], dtype=dtype)
@@ -179,31 +702,247 @@ def scoreDuplicates(
     return scored_pairs
 
 
+def decode_scores(
+    scores: Scores, ids_a: Sequence[RecordID], ids_b: Sequence[RecordID]
+) -> Scores:
+    """
+    Replace the codes in the pairs of `scores` with the record ids
+    at those positions of `ids_a` and `ids_b`
+    """
+    id_array_a = numpy.array(ids_a, dtype=object)
+    id_array_b = id_array_a if ids_b is ids_a else numpy.array(ids_b, dtype=object)
+
+    pair_ids = numpy.empty((len(scores), 2), dtype=object)
+    pair_ids[:, 0] = id_array_a[scores["pairs"][:, 0]]
+    pair_ids[:, 1] = id_array_b[scores["pairs"][:, 1]]
+
+    id_type = sniff_id_type([(ids_a[0], ids_b[0])]) if ids_a else int  # type: ignore
+    dtype = numpy.dtype([("pairs", id_type, 2), ("score", "f4")])
+
+    decoded: Scores = numpy.empty(len(scores), dtype=dtype)
+    decoded["pairs"] = pair_ids
+    decoded["score"] = scores["score"]
+
+    return decoded
+
+
+def merge_shards(shard_paths: Sequence[str], merged_path: str) -> None:
+    """
+    Concatenate the shard files into one file. If only one shard has
+    any data, we can just move it into place.
+    """
+    shard_paths = [
+        path for path in shard_paths if os.path.exists(path) and os.path.getsize(path)
+    ]
+
+    if len(shard_paths) == 1:
+        os.replace(shard_paths[0], merged_path)
+    else:
+        with open(merged_path, "wb") as merged:
+            for shard_path in shard_paths:
+                with open(shard_path, "rb") as shard:
+                    shutil.copyfileobj(shard, merged)
+
+
+class ChunkSizer(object):
+    """
+    Picks the number of items in each chunk sent to the scoring
+    workers.
+
+    Chunks should take the workers about `target_seconds`, which is
+    long enough to make the cost of sending a chunk negligible but
+    short enough that the workers finish at about the same time. As
+    the workers report how long they took on their chunks, the chunk
+    size moves towards that target, changing by at most a factor of
+    two at a time. Chunks are also kept below about `max_bytes`, so
+    that large records don't blow up the memory of the workers.
+
+    The current chunk size is in `size`, and the sizes of the most
+    recent chunks in `sizes`.
+    """
+
+    def __init__(
+        self,
+        min_size: int = 100,
+        max_size: int = 100000,
+        target_seconds: float = 0.5,
+        max_bytes: int = 2**26,
+        initial_size: int = 2000,
+    ):
+        if not 0 < min_size <= max_size:
+            raise ValueError("min_size must be positive and at most max_size")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+
+        self.size = self._clamp(initial_size)
+        self.sizes: collections.deque[int] = collections.deque(maxlen=100)
+        self.seconds_per_item: Optional[float] = None
+        self.bytes_per_item: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return "ChunkSizer(size=%d, seconds_per_item=%s, bytes_per_item=%s)" % (
+            self.size,
+            self.seconds_per_item,
+            self.bytes_per_item,
+        )
+
+    def next_size(self) -> int:
+        size = self.size
+        if self.bytes_per_item:
+            size = min(size, int(self.max_bytes / self.bytes_per_item))
+        size = self._clamp(size)
+
+        self.sizes.append(size)
+        return size
+
+    def observe(self, n_items: int, seconds: float) -> None:
+        """Update the chunk size from the time a chunk took to score"""
+        if not n_items:
+            return
+
+        seconds_per_item = seconds / n_items
+        if self.seconds_per_item is None:
+            self.seconds_per_item = seconds_per_item
+        else:
+            self.seconds_per_item = (self.seconds_per_item + seconds_per_item) / 2
+
+        if self.seconds_per_item > 0:
+            ideal = self.target_seconds / self.seconds_per_item
+        else:
+            ideal = self.max_size
+
+        self.size = self._clamp(min(max(ideal, self.size / 2), self.size * 2))
+
+    def observe_bytes(self, sample: Sequence[Any]) -> None:
+        """Estimate the memory footprint of an item from a sample"""
+        if sample:
+            n_bytes = len(pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL))
+            self.bytes_per_item = n_bytes / len(sample)
+
+    def _clamp(self, size: float) -> int:
+        return int(min(max(size, self.min_size), self.max_size))
+
+
 def fillQueue(
-    queue: _Queue, iterable: Iterable[Any], stop_signals: int, chunk_size: int = 20000
+    queue: Union[_Queue, ScoringPool],
+    iterable: Iterable[Any],
+    stop_signals: int,
+    chunk_size: int = 20000,
+    pack: Optional[Callable[[tuple[Any, ...]], Any]] = None,
+    chunk_sizer: Optional[ChunkSizer] = None,
+    item_bytes: Optional[float] = None,
 ) -> None:
+    """
+    Put chunks of `iterable` on the queue, followed by a poison pill
+    for each consumer. See :func:`chunks`.
+    """
+    for chunk in chunks(iterable, chunk_size, pack, chunk_sizer, item_bytes):
+        queue.put(chunk)
+
+    # put poison pills in queue to tell scorers that they are done
+    for _ in range(stop_signals):
+        queue.put(None)
+
+
+def chunks(
+    iterable: Iterable[Any],
+    chunk_size: int = 20000,
+    pack: Optional[Callable[[tuple[Any, ...]], Any]] = None,
+    chunk_sizer: Optional[ChunkSizer] = None,
+    item_bytes: Optional[float] = None,
+) -> Iterator[Any]:
+    """
+    Split `iterable` into chunks of `chunk_size` items, each passed
+    through `pack` if it is given.
+
+    If a `chunk_sizer` is given, it picks the size of each chunk
+    instead of `chunk_size`. If `item_bytes` is given, it is the
+    memory footprint of an item, otherwise it is estimated from a
+    sample of each chunk. Since the queue the chunks are put on is
+    bounded, a slow consumer holds up the producer, and the chunk sizer
+    keeps the chunks waiting on the queue small.
+    """
     iterable = iter(iterable)
 
+    if chunk_sizer is not None:
+        chunk_sizer.bytes_per_item = item_bytes
+
     while True:
-        chunk = tuple(itertools.islice(iterable, chunk_size))
-        if chunk:
-            queue.put(chunk)
-            del chunk
+        if chunk_sizer is not None:
+            chunk_size = chunk_sizer.next_size()
 
-        else:
-            # put poison pills in queue to tell scorers that they are
-            # done
-            for _ in range(stop_signals):
-                queue.put(None)
+        chunk = tuple(itertools.islice(iterable, chunk_size))
+        if not chunk:
             break
 
+        if chunk_sizer is not None and item_bytes is None:
+            chunk_sizer.observe_bytes(chunk[:32])
+        yield chunk if pack is None else pack(chunk)
+        del chunk
+
+
+class LinearScorer(object):
+    """
+    The fitted weights of a binary logistic regression, for scoring
+    record pairs without going through sklearn's input validation and
+    float64 copies on every chunk. It is also much cheaper to send to
+    the scoring processes than the classifier it was compiled from.
+    """
+
+    def __init__(
+        self,
+        coef: numpy.typing.NDArray[numpy.float_],
+        intercept: float,
+    ):
+        self.coef = numpy.asarray(coef, dtype="f4").ravel()
+        self.intercept = numpy.float32(intercept)
+
+    def predict_proba(
+        self, X: numpy.typing.NDArray[numpy.float_]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        X = numpy.asarray(X, dtype="f4")
+        scores = scipy.special.expit(X @ self.coef + self.intercept)
+
+        return numpy.column_stack((1 - scores, scores))
+
+
+def compile_classifier(classifier: Classifier) -> Scorer:
+    """
+    Return a LinearScorer for a fitted binary logistic regression,
+    or one wrapped in a search like GridSearchCV. Any other classifier
+    is returned as is.
+    """
+    estimator = getattr(classifier, "best_estimator_", classifier)
+
+    if (
+        isinstance(estimator, sklearn.linear_model.LogisticRegression)
+        and hasattr(estimator, "coef_")
+        and estimator.coef_.shape[0] == 1
+    ):
+        return LinearScorer(estimator.coef_, estimator.intercept_[0])
+
+    return classifier
+
 
 class ScoreGazette(object):
-    def __init__(self, featurizer: FeaturizerFunction, classifier: Classifier):
+    """A scoring job for chunks of blocks of record pairs"""
+
+    def start(
+        self, featurizer: FeaturizerFunction, classifier: Scorer, worker_id: int
+    ) -> None:
         self.featurizer = featurizer
         self.classifier = classifier
 
-    def __call__(self, block: Block) -> Scores:
+    def __call__(self, blocks: Sequence[Union[BlockInt, BlockStr]]) -> list[Scores]:
+        return [self.score_block(block) for block in blocks]
+
+    def finish(self) -> None:
+        pass
+
+    def score_block(self, block: Union[BlockInt, BlockStr]) -> Scores:
         record_ids, records = zip(*(zip(*each) for each in block))
 
         features = self.featurizer(records)
@@ -227,50 +966,35 @@ class ScoreGazette(object):
 def scoreGazette(
     record_pairs: Blocks,
     featurizer: FeaturizerFunction,
-    classifier: Classifier,
+    classifier: Scorer,
     num_cores: int = 1,
+    pool: Optional[ScoringPool] = None,
+    chunk_sizer: Optional[ChunkSizer] = None,
 ) -> Generator[Scores, None, None]:
     first, record_pairs = peek(record_pairs)
     if first is None:
         return  # terminate iteration
 
-    imap, pool = appropriate_imap(num_cores)
+    score_records = ScoreGazette()
 
-    score_records = ScoreGazette(featurizer, classifier)
+    if pool is None and num_cores < 2:
+        score_records.start(featurizer, classifier, 0)
+        for block in record_pairs:
+            yield score_records.score_block(block)
+        return
 
-    for scored_pairs in imap(score_records, record_pairs):
-        yield scored_pairs
+    own_pool = pool is None
+    if pool is None:
+        pool = ScoringPool(featurizer, classifier, num_cores)
 
-    # The underlying processes in the pool should terminate when the
-    # pool is garbage collected, but sometimes it takes a while
-    # before GC, so do it explicitly here
-    pool.close()
-    pool.join()
-
-
-class MockPool(object):
-    def close(self) -> None:
-        pass
-
-    def join(self) -> None:
-        pass
-
-
-def appropriate_imap(num_cores: int) -> tuple[MapLike, ClosableJoinable]:
-    if num_cores < 2:
-        imap: MapLike = map
-
-        # in order to make it simpler to cleanup a pool of processes
-        # always return something that we can close and join
-
-        pool: ClosableJoinable = MockPool()
-    else:
-        from .backport import Pool
-
-        pool = Pool(processes=num_cores)
-        imap = functools.partial(pool.imap_unordered, chunksize=20000)
-
-    return imap, pool
+    try:
+        for scored_pairs in pool.imap(
+            score_records, record_pairs, chunk_sizer=chunk_sizer or ChunkSizer()
+        ):
+            yield from scored_pairs
+    finally:
+        if own_pool:
+            pool.close()
 
 
 def peek(seq: Iterator[Any]) -> tuple[Optional[Any], Iterator[Any]]:
@@ -331,8 +1055,12 @@ def sniff_id_type(ids: Sequence[tuple[RecordID, RecordID]]) -> RecordIDDType:
     return dtype
 
 
-def sqlite_id_type(data: Data) -> Literal["text", "integer"]:
-    example = next(iter(data.keys()))
+def sqlite_id_type(record_ids: Iterable[RecordID]) -> Literal["text", "integer"]:
+    """
+    The SQLite column type of record ids. Also accepts a mapping of
+    record ids to records
+    """
+    example = next(iter(record_ids))
     python_type = type(example)
 
     if python_type is str:
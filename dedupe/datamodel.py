@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import copyreg
+import functools
+import operator
 import pkgutil
 import types
 from typing import TYPE_CHECKING, cast
 
 import numpy
+import scipy.special
 
 import dedupe.variables
 from dedupe.variables.base import FieldType as FieldVariable
@@ -18,15 +21,17 @@ for _, module, _ in pkgutil.iter_modules(  # type: ignore
     __import__(module)
 
 if TYPE_CHECKING:
-    from typing import Generator, Iterable, Sequence
+    from typing import Any, Generator, Iterable, Sequence
 
     from dedupe._typing import (
+        BatchComparator,
         Comparator,
         RecordDict,
         RecordDictPair,
         VariableDefinition,
     )
     from dedupe.predicates import Predicate
+    from dedupe.variables.base import CacheInfo, ComparatorCache
 
 VARIABLE_CLASSES = {k: v for k, v in FieldVariable.all_subclasses() if k}
 
@@ -69,6 +74,28 @@ class DataModel(object):
             yield (var.field, comparator, start, stop)
             start = stop
 
+    @property
+    def _field_batch_comparators(
+        self,
+    ) -> Generator[tuple[str, BatchComparator, int, int], None, None]:
+        start = 0
+        stop = 0
+        for var in self.primary_variables:
+            stop = start + len(var)
+            yield (var.field, batch_comparator(var), start, stop)
+            start = stop
+
+    def cache_info(self) -> dict[str, CacheInfo]:
+        """
+        Hit and miss statistics of the comparator caches of the
+        variables that have a 'cache size'
+        """
+        return {
+            var.name: var.comparator_cache.cache_info()
+            for var in self.primary_variables
+            if var.comparator_cache is not None
+        }
+
     @property
     def predicates(self) -> set[Predicate]:
         predicates = set()
@@ -84,14 +111,14 @@ class DataModel(object):
 
         distances = numpy.empty((num_records, len(self)), "f4")
 
-        for i, (record_1, record_2) in enumerate(record_pairs):
-            for field, compare, start, stop in self._field_comparators:
-                if record_1[field] is not None and record_2[field] is not None:
-                    distances[i, start:stop] = compare(record_1[field], record_2[field])
-                elif hasattr(compare, "missing"):
-                    distances[i, start:stop] = compare(record_1[field], record_2[field])
-                else:
-                    distances[i, start:stop] = numpy.nan
+        columns = FieldColumns(record_pairs)
+
+        for field, compare, start, stop in self._field_batch_comparators:
+            column_1, column_2 = columns[field]
+
+            distances[:, start:stop] = compare_columns(
+                compare, column_1, column_2, stop - start
+            )
 
         distances = self._add_derived_distances(distances)
 
@@ -140,6 +167,242 @@ class DataModel(object):
         self.__dict__ = d
 
 
+class FieldColumns(object):
+    """
+    The values of fields in pairs of records, gathered into a pair of
+    columns for each field the first time they are needed
+    """
+
+    def __init__(self, record_pairs: Sequence[RecordDictPair]):
+        self.records_1 = [record_1 for record_1, _ in record_pairs]
+        self.records_2 = [record_2 for _, record_2 in record_pairs]
+        self._columns: dict[str, tuple[list[Any], list[Any]]] = {}
+
+    def __getitem__(self, field: str) -> tuple[list[Any], list[Any]]:
+        try:
+            return self._columns[field]
+        except KeyError:
+            get_field = operator.itemgetter(field)
+            columns = self._columns[field] = (
+                list(map(get_field, self.records_1)),
+                list(map(get_field, self.records_2)),
+            )
+            return columns
+
+
+class FeaturePlan(object):
+    """
+    Computes the same distances as a data model, except for the
+    variables that a linear classifier gives no weight to, directly or
+    through an interaction or a missing-data indicator. Those variables
+    are never compared and get a distance of 0, which doesn't change
+    the scores.
+    """
+
+    def __init__(self, data_model: DataModel, coef: numpy.typing.NDArray[numpy.float_]):
+        self.data_model = data_model
+        self.variables = used_variables(data_model, coef)
+
+    @property
+    def skipped_variables(self) -> list[FieldVariable]:
+        used = {var.name for var, _, _ in self.variables}
+        return [
+            var for var in self.data_model.primary_variables if var.name not in used
+        ]
+
+    def __call__(
+        self, record_pairs: Sequence[RecordDictPair]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        data_model = self.data_model
+
+        distances = numpy.zeros((len(record_pairs), len(data_model)), "f4")
+
+        columns = FieldColumns(record_pairs)
+
+        for var, start, stop in self.variables:
+            column_1, column_2 = columns[var.field]
+
+            distances[:, start:stop] = compare_columns(
+                batch_comparator(var), column_1, column_2, stop - start
+            )
+
+        return data_model._add_derived_distances(distances)
+
+
+class Cascade(object):
+    """
+    Bounds the score that a linear classifier could give to pairs of
+    records, using only the distances of the variables that are cheap
+    to compare.
+
+    For expensive variables, we only look at which fields are
+    missing, and otherwise assume that the distance could be anywhere
+    within the `distance_bounds` of the variable. Pairs that can't
+    score above a threshold, whatever their expensive distances turn
+    out to be, can be dropped before computing those distances at all.
+    """
+
+    # slack for the float32 rounding of features and weights
+    margin = 1e-3
+
+    def __init__(
+        self,
+        data_model: DataModel,
+        coef: numpy.typing.NDArray[numpy.float_],
+        intercept: float,
+    ):
+        self.coef = numpy.asarray(coef, dtype=float).ravel()
+        self.intercept = float(intercept)
+
+        self._n_columns = data_model._derived_start + len(
+            data_model._interaction_indices
+        )
+        self._interaction_indices = data_model._interaction_indices
+        self._missing_field_indices = data_model._missing_field_indices
+
+        self.cheap_variables: list[tuple[FieldVariable, int, int]] = []
+        self.expensive_variables: list[tuple[FieldVariable, int, int]] = []
+        for var, start, stop in used_variables(data_model, self.coef):
+            if var.expensive:
+                self.expensive_variables.append((var, start, stop))
+            else:
+                self.cheap_variables.append((var, start, stop))
+
+        self.pairs = 0
+        self.pruned = 0
+
+    def upper_bound(
+        self, record_pairs: Sequence[RecordDictPair]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        """The highest logit the classifier could give each pair"""
+        num_records = len(record_pairs)
+        n_columns = self._n_columns
+
+        low = numpy.zeros((num_records, n_columns))
+        high = numpy.zeros((num_records, n_columns))
+        # whether a distance will be missing for sure, or could be
+        # missing, for example for an empty string
+        missing = numpy.zeros((num_records, n_columns), dtype=bool)
+        maybe_missing = numpy.zeros((num_records, n_columns), dtype=bool)
+
+        columns = FieldColumns(record_pairs)
+
+        for var, start, stop in self.cheap_variables:
+            column_1, column_2 = columns[var.field]
+            distances = compare_columns(
+                batch_comparator(var), column_1, column_2, stop - start
+            )
+            low[:, start:stop] = high[:, start:stop] = distances
+            missing[:, start:stop] = numpy.isnan(distances)
+
+        for var, start, stop in self.expensive_variables:
+            low[:, start:stop], high[:, start:stop] = var.distance_bounds
+            maybe_missing[:, start:stop] = True
+            if not hasattr(batch_comparator(var), "missing"):
+                column_1, column_2 = columns[var.field]
+                none = numpy.fromiter(
+                    (
+                        value_1 is None or value_2 is None
+                        for value_1, value_2 in zip(column_1, column_2)
+                    ),
+                    bool,
+                    count=num_records,
+                )
+                missing[none, start:stop] = True
+
+        with numpy.errstate(invalid="ignore"):
+            column = n_columns - len(self._interaction_indices)
+            for indices in self._interaction_indices:
+                product_low, product_high = low[:, indices[0]], high[:, indices[0]]
+                for i in indices[1:]:
+                    products = numpy.stack(
+                        (
+                            product_low * low[:, i],
+                            product_low * high[:, i],
+                            product_high * low[:, i],
+                            product_high * high[:, i],
+                        )
+                    )
+                    # zero times an infinite bound is zero
+                    products[numpy.isnan(products)] = 0
+                    product_low = products.min(axis=0)
+                    product_high = products.max(axis=0)
+
+                low[:, column] = product_low
+                high[:, column] = product_high
+                missing[:, column] = missing[:, indices].any(axis=1)
+                maybe_missing[:, column] = maybe_missing[:, indices].any(axis=1)
+                column += 1
+
+            weights = self.coef[:n_columns]
+            contributions = numpy.maximum(weights * low, weights * high)
+            contributions[numpy.isnan(contributions)] = 0
+
+        # a distance that is present also turns on its missing-data
+        # indicator, and a missing distance counts as zero
+        missing_weights = numpy.zeros(n_columns)
+        missing_weights[self._missing_field_indices] = self.coef[n_columns:]
+        contributions += missing_weights
+
+        contributions[maybe_missing] = numpy.maximum(contributions[maybe_missing], 0)
+        contributions[missing] = 0
+
+        upper_bound: numpy.typing.NDArray[
+            numpy.float_
+        ] = self.intercept + contributions.sum(axis=1)
+        return upper_bound
+
+    def could_score_above(
+        self, record_pairs: Sequence[RecordDictPair], threshold: float
+    ) -> numpy.typing.NDArray[numpy.bool_]:
+        """
+        Which pairs could get a score above `threshold`, a probability
+        between 0 and 1
+        """
+        if threshold <= 0:
+            return numpy.ones(len(record_pairs), dtype=bool)
+
+        logit = scipy.special.logit(min(threshold, 1.0))
+        keep = self.upper_bound(record_pairs) > logit - self.margin
+
+        self.pairs += len(keep)
+        self.pruned += len(keep) - int(keep.sum())
+
+        return keep
+
+
+def used_variables(
+    data_model: DataModel, coef: numpy.typing.NDArray[numpy.float_]
+) -> list[tuple[FieldVariable, int, int]]:
+    """
+    The primary variables, and their columns, that a linear classifier
+    with weights `coef` depends on. A variable is used if any of its
+    columns has a weight, or if it is part of an interaction or has a
+    missing-data indicator that has a weight.
+    """
+    weighted = numpy.asarray(coef).ravel() != 0
+
+    n_columns = data_model._derived_start + len(data_model._interaction_indices)
+    used = weighted[:n_columns].copy()
+    used[data_model._missing_field_indices] |= weighted[n_columns:]
+
+    column = data_model._derived_start
+    for indices in data_model._interaction_indices:
+        if used[column]:
+            used[indices] = True
+        column += 1
+
+    variables = []
+    start = 0
+    for var in data_model.primary_variables:
+        stop = start + len(var)
+        if used[start:stop].any():
+            variables.append((var, start, stop))
+        start = stop
+
+    return variables
+
+
 def typify_variables(
     variable_definitions: Iterable[VariableDefinition],
 ) -> tuple[list[FieldVariable], list[Variable]]:
@@ -207,6 +470,92 @@ def typify_variables(
     return primary_variables, all_variables
 
 
+def compare_columns(
+    compare: BatchComparator,
+    column_1: Sequence[Any],
+    column_2: Sequence[Any],
+    width: int,
+) -> numpy.typing.NDArray[numpy.float_]:
+    """
+    Compare two columns of field values and return a (len(column_1) X
+    width) block of distances. Pairs where either value is missing get
+    a distance of nan, unless the comparator is flagged to handle
+    missing values itself.
+    """
+    if hasattr(compare, "missing"):
+        return numpy.asarray(compare(column_1, column_2), "f4").reshape(-1, width)
+
+    block = numpy.full((len(column_1), width), numpy.nan, "f4")
+
+    present = [
+        i
+        for i, (value_1, value_2) in enumerate(zip(column_1, column_2))
+        if value_1 is not None and value_2 is not None
+    ]
+    if present:
+        if len(present) == len(column_1):
+            values_1, values_2 = column_1, column_2
+        else:
+            values_1 = [column_1[i] for i in present]
+            values_2 = [column_2[i] for i in present]
+        block[present] = numpy.asarray(compare(values_1, values_2), "f4").reshape(
+            -1, width
+        )
+
+    return block
+
+
+def batch_comparator(var: FieldVariable) -> BatchComparator:
+    """
+    The comparator of the variable for columns of field values, built
+    from the comparator for two field values if the variable doesn't
+    have one
+    """
+    if var.batch_comparator is not None:
+        compare = var.batch_comparator
+    else:
+        compare = elementwise(cast("Comparator", var.comparator))
+
+    if var.comparator_cache is not None:
+        compare = cached(var.comparator_cache, compare)
+
+    return compare
+
+
+def elementwise(comparator: Comparator) -> BatchComparator:
+    """
+    Turn a comparator of two field values into a comparator of two
+    columns of field values. The comparator is still called once per
+    pair, which is how the string comparators run. They are compiled,
+    and take most of the time of comparing the columns, so for models
+    of mostly strings, comparing columns is only a few times faster
+    than comparing pairs field by field.
+    """
+
+    def batch_comparator(
+        column_1: Sequence[Any], column_2: Sequence[Any]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        return numpy.array(list(map(comparator, column_1, column_2)), "f4")
+
+    if hasattr(comparator, "missing"):
+        batch_comparator.missing = True  # type: ignore[attr-defined]
+
+    return batch_comparator
+
+
+def cached(cache: ComparatorCache, compare: BatchComparator) -> BatchComparator:
+    """
+    Look up the distances of pairs of field values in `cache` before
+    calling `compare` on them
+    """
+    batch_comparator = functools.partial(cache, compare)
+
+    if hasattr(compare, "missing"):
+        batch_comparator.missing = True  # type: ignore[attr-defined]
+
+    return batch_comparator
+
+
 def missing(variables: list[Variable]) -> list[MissingDataType]:
     missing_variables = []
     for var in variables:
@@ -12,6 +12,7 @@ import sklearn.linear_model
 
 import dedupe.core as core
 import dedupe.training as training
+from dedupe.predicates import SortedNeighborhoodPredicate
 
 if TYPE_CHECKING:
     from typing import Dict, Iterable, Literal, Mapping
@@ -206,9 +207,13 @@ class BlockLearner(Learner):
 def _filter_canopy_predicates(
     predicates: Iterable[Predicate], canopies: bool
 ) -> set[Predicate]:
-    result = set()
+    result: set[Predicate] = set()
     for predicate in predicates:
-        if hasattr(predicate, "index"):
+        # sorted neighborhood predicates block records the same way
+        # whether they are targets or not, so they are learned by both
+        if isinstance(predicate, SortedNeighborhoodPredicate):
+            result.add(predicate)
+        elif hasattr(predicate, "index"):
             is_canopy = hasattr(predicate, "canopy")
             if is_canopy == canopies:
                 result.add(predicate)
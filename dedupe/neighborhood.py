@@ -0,0 +1,59 @@
+"""
+An index of the sort keys of field values, for sorted neighborhood
+blocking.
+
+The distinct sort keys are sorted, and a value is blocked with the
+values whose keys are near its own in that order. Instead of sliding a
+window over the sorted keys, which would put every value in as many
+blocks as the window is wide, the sorted keys are cut into windows of
+`window` keys twice, the second time shifted by half a window. Every
+value is in two blocks, of at most `window` distinct values, and any
+two values that are at most half a window apart share a block.
+"""
+
+from __future__ import annotations
+
+import bisect
+from typing import TYPE_CHECKING
+
+from .index import Index
+
+if TYPE_CHECKING:
+    from typing import Any
+
+
+class SortedNeighborhoodIndex(Index):
+    _doc_to_id: dict[Any, int]  # type: ignore[assignment]
+
+    def __init__(self) -> None:
+        # maps sort keys to their rank, once the index is searchable
+        self._doc_to_id = {}
+        self._sorted_docs: list[Any] = []
+
+    def index(self, doc: Any) -> None:
+        if doc not in self._doc_to_id:
+            self._doc_to_id[doc] = -1
+
+    def unindex(self, doc: Any) -> None:
+        del self._doc_to_id[doc]
+
+    def initSearch(self) -> None:
+        self._sorted_docs = sorted(self._doc_to_id)
+        for rank, doc in enumerate(self._sorted_docs):
+            self._doc_to_id[doc] = rank
+
+    def rank(self, doc: Any) -> int:
+        """
+        The position of a sort key among the indexed keys. A key that
+        is not indexed takes the position of the next larger key.
+        """
+        try:
+            return self._doc_to_id[doc]
+        except KeyError:
+            return bisect.bisect_left(self._sorted_docs, doc)
+
+    def search(self, doc: Any, threshold: int | float = 2) -> list[int]:
+        """The two windows of `threshold` keys that the key falls in"""
+        window = max(int(threshold), 2)
+        rank = self.rank(doc)
+        return [2 * (rank // window), 2 * ((rank + window // 2) // window) + 1]
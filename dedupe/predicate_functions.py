@@ -1,7 +1,8 @@
+import functools
 import re
 from itertools import chain
 from math import copysign, floor, log10
-from typing import Any, FrozenSet, Sequence, Tuple, Union
+from typing import Any, Callable, Dict, FrozenSet, Sequence, Tuple, Union
 
 from doublemetaphone import doublemetaphone
 
@@ -224,3 +225,110 @@ def roundTo1(field: float) -> FrozenSet[str]:
     order = int(floor(log10(abs_num)))
     rounded = round(abs_num, -order)
     return frozenset((str(int(copysign(rounded, field))),))
+
+
+class _cached(object):
+    """Like functools.cached_property, which needs Python 3.8"""
+
+    def __init__(self, func: Callable[[Any], Any]) -> None:
+        self.func = func
+        self.name = func.__name__
+
+    def __get__(self, obj: Any, cls: Any) -> Any:
+        if obj is None:
+            return self
+        value = obj.__dict__[self.name] = self.func(obj)
+        return value
+
+
+class Tokens(object):
+    """
+    The tokens, integers, n-gram source and metaphone codes of a
+    string field, each computed at most once, from which the predicate
+    functions in `TOKEN_PREDICATES` derive their keys.
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+
+    @_cached
+    def word_tokens(self) -> Sequence[str]:
+        return words(self.field)
+
+    @_cached
+    def split_tokens(self) -> Sequence[str]:
+        return self.field.split()
+
+    @_cached
+    def integer_values(self) -> Sequence[int]:
+        return [int(i) for i in integers(self.field)]
+
+    @_cached
+    def integer_strings(self) -> Sequence[str]:
+        # `str(int(i))` removes leading zeros
+        return [str(i) for i in self.integer_values]
+
+    @_cached
+    def compact(self) -> str:
+        return self.field.replace(" ", "")
+
+    def token_ngrams(self, n: int) -> FrozenSet[str]:
+        """The same as `ngramsTokens(self.split_tokens, n)`"""
+        tokens = self.split_tokens
+        return frozenset(map(" ".join, zip(*(tokens[i:] for i in range(n)))))
+
+    @_cached
+    def token_metaphones(self) -> FrozenSet[str]:
+        return frozenset(
+            code
+            for token in self.split_tokens
+            for code in _cached_metaphone(token)
+            if code
+        )
+
+
+# words, and the tokens of short fields, repeat a lot across records
+_cached_metaphone = functools.lru_cache(maxsize=2**16)(doublemetaphone)
+
+
+TokenPredicateFunction = Callable[[Tokens], FrozenSet[str]]
+
+TOKEN_PREDICATES: Dict[Callable[[Any], FrozenSet[str]], TokenPredicateFunction] = {
+    tokenFieldPredicate: lambda t: frozenset(t.word_tokens),
+    commonIntegerPredicate: lambda t: frozenset(t.integer_strings),
+    nearIntegersPredicate: lambda t: frozenset(
+        str(i + d) for i in t.integer_values for d in (-1, 0, 1)
+    ),
+    hundredIntegerPredicate: lambda t: frozenset(
+        s[:-2] + "00" for s in t.integer_strings
+    ),
+    hundredIntegersOddPredicate: lambda t: frozenset(
+        s[:-2] + "0" + str(i % 2) for s, i in zip(t.integer_strings, t.integer_values)
+    ),
+    commonTwoTokens: lambda t: t.token_ngrams(2),
+    commonThreeTokens: lambda t: t.token_ngrams(3),
+    fingerprint: lambda t: frozenset(("".join(sorted(t.split_tokens)),)),
+    sortedAcronym: lambda t: frozenset(
+        ("".join(sorted(each[0] for each in t.split_tokens)),)
+    ),
+    oneGramFingerprint: lambda t: frozenset(("".join(sorted({*t.compact})),)),
+    twoGramFingerprint: lambda t: (
+        frozenset(("".join(sorted(unique_ngrams(t.compact, 2))),))
+        if len(t.field) > 1
+        else frozenset()
+    ),
+    commonFourGram: lambda t: frozenset(unique_ngrams(t.compact, 4)),
+    commonSixGram: lambda t: frozenset(unique_ngrams(t.compact, 6)),
+    sameThreeCharStartPredicate: lambda t: frozenset(initials(t.compact, 3)),
+    sameFiveCharStartPredicate: lambda t: frozenset(initials(t.compact, 5)),
+    sameSevenCharStartPredicate: lambda t: frozenset(initials(t.compact, 7)),
+    doubleMetaphone: lambda t: frozenset(
+        metaphone for metaphone in _cached_metaphone(t.field) if metaphone
+    ),
+    metaphoneToken: lambda t: t.token_metaphones,
+}
+"""
+Versions of predicate functions on strings that derive their keys
+from a shared :class:`Tokens` of the field, instead of tokenizing it
+again.
+"""
@@ -9,6 +9,7 @@ from itertools import product
 from typing import TYPE_CHECKING
 
 import dedupe.levenshtein as levenshtein
+import dedupe.neighborhood as neighborhood
 import dedupe.tfidf as tfidf
 from dedupe.cpredicates import ngrams
 
@@ -32,6 +33,11 @@ def strip_punc(s: str) -> str:
     return s.translate(PUNCTABLE)
 
 
+def normalize(s: str) -> str:
+    """Strip the punctuation of a string and collapse its whitespace"""
+    return " ".join(strip_punc(s).split())
+
+
 class NoIndexError(AttributeError):
     def __init__(self, *args) -> None:
         super().__init__(args[0])
@@ -99,7 +105,7 @@ class StringPredicate(SimplePredicate):
     def __call__(self, record: RecordDict, **kwargs) -> FrozenSet[str]:
         column: str = record[self.field]
         if column:
-            return self.func(" ".join(strip_punc(column).split()))
+            return self.func(normalize(column))
         else:
             return frozenset()
 
@@ -303,7 +309,7 @@ class TfidfSetPredicate(IndexPredicate):
 
 class TfidfNGramPredicate(IndexPredicate):
     def preprocess(self, doc: str) -> Sequence[str]:
-        return tuple(sorted(ngrams(" ".join(strip_punc(doc).split()), 2)))
+        return tuple(sorted(ngrams(normalize(doc), 2)))
 
 
 class TfidfTextSearchPredicate(TfidfTextPredicate, TfidfSearchPredicate):
@@ -336,7 +342,7 @@ class LevenshteinPredicate(IndexPredicate):
         return levenshtein.LevenshteinIndex()
 
     def preprocess(self, doc: str) -> str:
-        return " ".join(strip_punc(doc).split())
+        return normalize(doc)
 
 
 class LevenshteinCanopyPredicate(CanopyPredicate, LevenshteinPredicate):
@@ -347,6 +353,84 @@ class LevenshteinSearchPredicate(SearchPredicate, LevenshteinPredicate):
     type = "LevenshteinSearchPredicate"
 
 
+class SortedNeighborhoodPredicate(IndexPredicate):
+    """
+    Blocks a record with the records whose sort keys are its neighbors
+    when the keys of the indexed records are sorted. The threshold is
+    the number of distinct keys in a block, see
+    :mod:`dedupe.neighborhood`. Unlike canopy and search predicates,
+    records get the same block keys as targets.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._cache = {}
+
+    def initIndex(self) -> Index:
+        self.reset()
+        return neighborhood.SortedNeighborhoodIndex()
+
+    def freeze(
+        self, records_1: Iterable[RecordDict], records_2: Iterable[RecordDict] = ()
+    ) -> None:
+        self._cache = {record[self.field]: self(record) for record in records_1}
+        self._cache.update({record[self.field]: self(record) for record in records_2})
+        self.index = None
+
+    def reset(self) -> None:
+        self._cache = {}
+        self.index = None
+
+    def __call__(self, record: RecordDict, **kwargs) -> FrozenSet[str]:
+        column = record[self.field]
+        if column:
+            if column in self._cache:
+                return self._cache[column]
+
+            try:
+                assert self.index is not None
+            except AssertionError:
+                raise NoIndexError(
+                    "Attempting to block with an index "
+                    "predicate without indexing records",
+                    record,
+                )
+
+            doc = self.preprocess(column)
+            result = frozenset(
+                str(window) for window in self.index.search(doc, self.threshold)
+            )
+            self._cache[column] = result
+            return result
+        else:
+            return frozenset()
+
+
+class FieldNeighborhoodPredicate(SortedNeighborhoodPredicate):
+    type = "FieldNeighborhoodPredicate"
+
+    def preprocess(self, doc: str) -> str:
+        return normalize(doc).lower()
+
+
+class ReversedNeighborhoodPredicate(SortedNeighborhoodPredicate):
+    """Sorts by the reversed value, so typos at the start don't matter"""
+
+    type = "ReversedNeighborhoodPredicate"
+
+    def preprocess(self, doc: str) -> str:
+        return normalize(doc).lower()[::-1]
+
+
+class TokenNeighborhoodPredicate(SortedNeighborhoodPredicate):
+    """Sorts by the sorted tokens of the value, so their order doesn't matter"""
+
+    type = "TokenNeighborhoodPredicate"
+
+    def preprocess(self, doc: str) -> str:
+        return " ".join(sorted(normalize(doc).lower().split()))
+
+
 class CompoundPredicate(tuple, Predicate):
     type = "CompoundPredicate"
 
@@ -361,16 +445,23 @@ class CompoundPredicate(tuple, Predicate):
         return frozenset(self) == frozenset(other)
 
     def __call__(self, record: RecordDict, **kwargs) -> FrozenSet[str]:
-        predicate_keys = [predicate(record, **kwargs) for predicate in self]
         return frozenset(
             ":".join(
                 # must escape : to avoid confusion with : join separator
                 b.replace(":", "\\:")
                 for b in block_key
             )
-            for block_key in product(*predicate_keys)
+            for block_key in self.key_tuples(record, **kwargs)
         )
 
+    def key_tuples(self, record: RecordDict, **kwargs) -> Iterable[tuple[str, ...]]:
+        """
+        The combinations of the keys of the predicates, before they are
+        joined into block keys
+        """
+        predicate_keys = [predicate(record, **kwargs) for predicate in self]
+        return product(*predicate_keys)
+
     def __add__(self, other: Predicate) -> "CompoundPredicate":  # type: ignore
         if isinstance(other, CompoundPredicate):
             return CompoundPredicate(tuple(self) + tuple(other))
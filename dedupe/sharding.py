@@ -0,0 +1,169 @@
+"""
+Split pairing up and scoring the records of one deduplication job into
+shards, that separate processes, possibly on machines that share a
+filesystem, work on.
+
+The hashed block keys of the records are partitioned by their hash
+into shard files, so that all the records of a block end up in the
+same shard. Each shard pairs up the records of its blocks, like
+:func:`dedupe.sorted_blocking.dedupe_pairs`, and scores them into its
+own score file. Two records can share blocks in different shards, so
+merging the score files drops the pairs that more than one shard
+scored.
+
+Fingerprints can be written to the shards by more than one process,
+each writing its own `part` of every shard.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+from typing import TYPE_CHECKING
+
+import numpy
+
+import dedupe.sorted_blocking as sorted_blocking
+
+if TYPE_CHECKING:
+    from typing import Iterable, Iterator, Optional, Sequence
+
+    from dedupe._typing import BlockKey, Scores
+    from dedupe.sorted_blocking import Rows
+
+
+def blocks_path(directory: str, shard: int, part: int = 0) -> str:
+    """The file of a part of the block keys of a shard"""
+    return os.path.join(directory, "blocks-%d-%d" % (shard, part))
+
+
+def scores_path(directory: str, shard: int) -> str:
+    """The file of the scores of a shard"""
+    return os.path.join(directory, "scores-%d" % shard)
+
+
+def write_shards(
+    block_keys: Iterable[tuple[BlockKey, int]],
+    directory: str,
+    n_shards: int,
+    part: int = 0,
+) -> None:
+    """
+    Hash the block keys of (block key, record code) rows, and write
+    each row to its `part` of the shard its hash falls in, replacing
+    any rows written to that part before
+    """
+    files = [
+        open(blocks_path(directory, shard, part), "wb") for shard in range(n_shards)
+    ]
+    try:
+        for keys, codes in sorted_blocking.hashed_batches(block_keys):
+            shards = keys % numpy.uint64(n_shards)
+            order = numpy.argsort(shards, kind="stable")
+
+            rows = numpy.empty(len(keys), dtype=sorted_blocking.ROW_DTYPE)
+            rows["key"] = keys[order]
+            rows["value"] = codes[order]
+
+            bounds = numpy.searchsorted(shards[order], numpy.arange(n_shards + 1))
+            for shard, f in enumerate(files):
+                f.write(rows[bounds[shard] : bounds[shard + 1]].tobytes())
+    finally:
+        for f in files:
+            f.close()
+
+
+def shard_pairs(
+    directory: str,
+    shard: int,
+    max_rows: Optional[int] = sorted_blocking.MAX_ROWS,
+    max_block_size: Optional[int] = None,
+    oversized: Optional[dict[BlockKey, tuple[int, int]]] = None,
+) -> Iterator[Rows]:
+    """
+    Yield batches of the distinct pairs of codes of records that share
+    a block key of the shard, with the smaller code first. Blocks of
+    more than `max_block_size` records are skipped and added to
+    `oversized`, see :func:`dedupe.sorted_blocking.dedupe_pairs`.
+    """
+    blocks = sorted_blocking.ExternalSorter(max_rows)
+    try:
+        parts = glob.glob(os.path.join(directory, "blocks-%d-*" % shard))
+        for keys, codes in _read_rows(parts):
+            blocks.add(keys, codes)
+        yield from sorted_blocking.sorted_dedupe_pairs(
+            blocks, max_block_size, oversized
+        )
+    finally:
+        blocks.close()
+
+
+def _read_rows(paths: Sequence[str], batch_size: int = 2**20) -> Iterator[Rows]:
+    dtype = sorted_blocking.ROW_DTYPE
+    for path in sorted(paths):
+        n_rows = os.path.getsize(path) // dtype.itemsize
+        for start in range(0, n_rows, batch_size):
+            rows = numpy.fromfile(
+                path, dtype=dtype, count=batch_size, offset=start * dtype.itemsize
+            )
+            yield rows["key"], rows["value"]
+
+
+def merge_scores(
+    paths: Sequence[str],
+    dtype: numpy.dtype,
+    merged_path: str,
+    n_codes: int,
+    max_rows: Optional[int] = sorted_blocking.MAX_ROWS,
+) -> Scores:
+    """
+    Merge the score files of the shards into one file at `merged_path`,
+    sorted by pair, keeping each pair only once, and memory map it.
+
+    The pairs of codes below `n_codes` are sorted as single keys along
+    with their scores, in sorted runs on disk if there are more than
+    `max_rows` of them, so the scores of all the shards are never in
+    memory at once.
+    """
+    n = numpy.uint64(n_codes)
+    sorter = sorted_blocking.ExternalSorter(max_rows)
+    try:
+        for path in paths:
+            for scores in _read_scores(path, dtype):
+                pairs = scores["pairs"].astype("u8")
+                sorter.add(
+                    pairs[:, 0] * n + pairs[:, 1],
+                    scores["score"].view("u4").astype("u8"),
+                )
+
+        size = 0
+        with open(merged_path, "wb") as f:
+            for keys, values in sorter.groups():
+                # a pair scored by more than one shard got the same score
+                distinct = numpy.ones(len(keys), dtype=bool)
+                distinct[1:] = keys[1:] != keys[:-1]
+                keys, values = keys[distinct], values[distinct]
+
+                merged = numpy.empty(len(keys), dtype=dtype)
+                merged["pairs"][:, 0] = keys // n
+                merged["pairs"][:, 1] = keys % n
+                merged["score"] = values.astype("u4").view("f4")
+                merged.tofile(f)
+                size += len(merged)
+    finally:
+        sorter.close()
+
+    if not size:
+        os.remove(merged_path)
+        return numpy.empty(0, dtype=dtype)
+    return numpy.memmap(merged_path, dtype=dtype, mode="r", shape=(size,))
+
+
+def _read_scores(
+    path: str, dtype: numpy.dtype, batch_size: int = 2**20
+) -> Iterator[Scores]:
+    n_rows = os.path.getsize(path) // dtype.itemsize
+    for start in range(0, n_rows, batch_size):
+        yield numpy.fromfile(
+            path, dtype=dtype, count=batch_size, offset=start * dtype.itemsize
+        )
@@ -0,0 +1,656 @@
+"""
+Pair records that share block keys by sorting arrays of hashed block
+keys, instead of joining a table of block keys with itself in SQLite.
+
+The block keys of the records are hashed to 64 bit integers and
+sorted together with the codes of the records, which puts the records
+of every block next to each other. The pairs of each block are then
+generated with numpy. Two records can share more than one block, so a
+pair is only kept in the first block, in sorted order, that its records
+share, which we check from the list of blocks of each record. This
+way, no pass over all the pairs is needed to drop duplicates, and
+pairs are yielded as soon as their block is reached.
+
+Sorting happens in memory while the arrays are small enough, and
+spills to sorted runs on disk, that are merged at the end, when they
+are not.
+
+Two different block keys can hash to the same integer, but that is so
+unlikely that we accept that it would only add a few pairs to score.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+import numpy
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+    import numpy.typing
+
+    from dedupe._typing import BlockKey
+
+    Codes = numpy.typing.NDArray[numpy.uint64]
+    NDArrayIntp = numpy.typing.NDArray[numpy.intp]
+    Rows = tuple[Codes, Codes]
+
+
+logger = logging.getLogger(__name__)
+
+# the number of rows that are sorted in memory before spilling a
+# sorted run to disk, about 256MB of keys and values
+MAX_ROWS = 2**24
+
+# the number of pairs of records made in one batch, about 50MB of
+# positions, codes and blocks
+MAX_PAIRS = 2**20
+
+ROW_DTYPE = numpy.dtype([("key", "u8"), ("value", "u8")])
+
+
+def hash_block_key(block_key: str) -> int:
+    """
+    A signed 64 bit hash of a block key, which is the same in every
+    process
+    """
+    digest = hashlib.blake2b(block_key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def hash_block_keys(block_keys: Sequence[BlockKey]) -> Codes:
+    """
+    The hashes of block keys. Integer block keys, like those of
+    :class:`dedupe.blocking.Fingerprinter` with `hashed=True`, are
+    already signed 64 bit hashes. The signed hashes are reinterpreted
+    as unsigned, to sort them.
+    """
+    if block_keys and isinstance(block_keys[0], int):
+        hashes: Iterable[int] = block_keys  # type: ignore[assignment]
+    else:
+        hashes = (hash_block_key(block_key) for block_key in block_keys)  # type: ignore[arg-type]
+
+    return numpy.fromiter(hashes, "i8", len(block_keys)).view("u8")
+
+
+class ExternalSorter(object):
+    """
+    Sorts rows of pairs of unsigned 64 bit integers, a key and a value,
+    and drops duplicate rows.
+
+    Rows are gathered and sorted in memory until there are more than
+    `max_rows` of them, then written to a temporary directory as a
+    sorted run. The runs are merged when the rows are read back, which
+    can be done more than once. If `max_rows` is None, the rows are
+    always kept in memory.
+    """
+
+    def __init__(
+        self, max_rows: Optional[int] = MAX_ROWS, temp_dir: Optional[str] = None
+    ):
+        self.max_rows = max_rows
+        self.temp_dir = temp_dir
+        self.runs: list[str] = []
+        # the number of rows added, including duplicates
+        self.n_rows = 0
+
+        self._keys: list[Codes] = []
+        self._values: list[Codes] = []
+        self._n_buffered = 0
+        self._sorted: Optional[Rows] = None
+        self._run_dir: Optional[tempfile.TemporaryDirectory[str]] = None
+
+    def add(self, keys: Codes, values: Codes) -> None:
+        if not len(keys):
+            return
+
+        self._keys.append(numpy.asarray(keys, dtype="u8"))
+        self._values.append(numpy.asarray(values, dtype="u8"))
+        self._n_buffered += len(keys)
+        self.n_rows += len(keys)
+
+        if self.max_rows is not None and self._n_buffered >= self.max_rows:
+            self._spill()
+
+    def _sorted_buffer(self) -> Rows:
+        if self._keys:
+            keys = numpy.concatenate(self._keys)
+            values = numpy.concatenate(self._values)
+        else:
+            keys = numpy.empty(0, dtype="u8")
+            values = numpy.empty(0, dtype="u8")
+
+        self._keys, self._values = [], []
+        self._n_buffered = 0
+
+        return sort_unique(keys, values)
+
+    def _spill(self) -> None:
+        keys, values = self._sorted_buffer()
+
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(dir=self.temp_dir)
+
+        rows = numpy.empty(len(keys), dtype=ROW_DTYPE)
+        rows["key"] = keys
+        rows["value"] = values
+
+        path = os.path.join(self._run_dir.name, "run_%d.npy" % len(self.runs))
+        numpy.save(path, rows)
+        self.runs.append(path)
+
+        logger.debug("wrote sorted run %d of %d rows", len(self.runs), len(rows))
+
+    def groups(self) -> Iterator[Rows]:
+        """
+        Yield the distinct rows sorted by key and then by value, in
+        chunks that never split the rows of a key
+        """
+        if not self.runs:
+            if self._sorted is None or self._n_buffered:
+                if self._sorted is not None:
+                    self._keys.append(self._sorted[0])
+                    self._values.append(self._sorted[1])
+                self._sorted = self._sorted_buffer()
+
+            keys, values = self._sorted
+            if len(keys):
+                yield keys, values
+            return
+
+        if self._n_buffered:
+            self._spill()
+
+        runs = [numpy.load(path, mmap_mode="r") for path in self.runs]
+        assert self.max_rows is not None
+        chunk_rows = max(1, self.max_rows // (len(runs) + 1))
+
+        yield from merge_runs(runs, chunk_rows)
+
+    def sorted_keys(self) -> Codes:
+        """
+        All the distinct keys, sorted. The keys are read from a file
+        on disk if the rows were spilled.
+        """
+        if not self.runs:
+            chunks = [keys for keys, _ in self.groups()]
+            return (
+                numpy.unique(numpy.concatenate(chunks))
+                if chunks
+                else numpy.empty(0, "u8")
+            )
+
+        assert self._run_dir is not None
+        path = os.path.join(self._run_dir.name, "keys_%d.u8" % len(self.runs))
+        size = 0
+        with open(path, "wb") as f:
+            for keys, _ in self.groups():
+                keys = numpy.unique(keys)
+                keys.tofile(f)
+                size += len(keys)
+
+        if not size:
+            return numpy.empty(0, "u8")
+        return numpy.memmap(path, dtype="u8", mode="r", shape=(size,))
+
+    def close(self) -> None:
+        self._keys, self._values = [], []
+        self._n_buffered = 0
+        self._sorted = None
+        self.runs = []
+        self.n_rows = 0
+        if self._run_dir is not None:
+            self._run_dir.cleanup()
+            self._run_dir = None
+
+
+def sort_unique(keys: Codes, values: Codes) -> Rows:
+    """Sort rows by key and then by value, and drop duplicate rows"""
+    order = numpy.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+
+    distinct = numpy.ones(len(keys), dtype=bool)
+    distinct[1:] = (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])
+
+    return keys[distinct], values[distinct]
+
+
+def merge_runs(
+    runs: list[numpy.typing.NDArray[numpy.void]], chunk_rows: int
+) -> Iterator[Rows]:
+    """
+    Merge sorted runs of rows, reading `chunk_rows` rows of every run
+    at a time. A chunk of every run is kept in a window and, at each
+    step, we take the rows with keys smaller than the last key of every
+    window of a run that has more rows left to read. No row that is
+    still on disk can have one of those keys.
+    """
+    windows = [numpy.array(run[:chunk_rows]) for run in runs]
+    positions = [len(window) for window in windows]
+
+    while True:
+        unfinished = [
+            window["key"][-1]
+            for run, window, position in zip(runs, windows, positions)
+            if position < len(run)
+        ]
+        if not any(len(window) for window in windows):
+            break
+
+        taken = []
+        for i, window in enumerate(windows):
+            if unfinished:
+                end = numpy.searchsorted(window["key"], min(unfinished), "left")
+            else:
+                end = len(window)
+            taken.append(window[:end])
+            windows[i] = window[end:]
+
+        rows = numpy.concatenate(taken)
+        if len(rows):
+            yield sort_unique(rows["key"], rows["value"])
+
+        # a window with rows of only one key left could have more rows
+        # of that key on disk, so we read more of that run
+        for i, (run, window) in enumerate(zip(runs, windows)):
+            position = positions[i]
+            if position < len(run) and (
+                not len(window) or window["key"][0] == window["key"][-1]
+            ):
+                more = numpy.array(run[position : position + chunk_rows])
+                windows[i] = numpy.concatenate((window, more))
+                positions[i] = position + len(more)
+
+
+def block_starts(keys: Codes) -> numpy.typing.NDArray[numpy.intp]:
+    """The positions where a new key starts in sorted keys"""
+    starts = numpy.flatnonzero(keys[1:] != keys[:-1]) + 1
+    return numpy.concatenate(([0], starts)).astype(numpy.intp)
+
+
+def cartesian(
+    a_start: numpy.typing.NDArray[numpy.intp],
+    a_count: numpy.typing.NDArray[numpy.intp],
+    b_start: numpy.typing.NDArray[numpy.intp],
+    b_count: numpy.typing.NDArray[numpy.intp],
+    max_pairs: int,
+) -> Iterator[
+    tuple[numpy.typing.NDArray[numpy.intp], numpy.typing.NDArray[numpy.intp]]
+]:
+    """
+    For ranges of positions a_start[i]:a_start[i] + a_count[i] and
+    b_start[i]:b_start[i] + b_count[i], yield all the pairs of a
+    position in the first range and a position in the second, in
+    batches of about `max_pairs` pairs
+    """
+    counts = a_count * b_count
+
+    # ranges with too many pairs are split along the first range
+    too_big = numpy.flatnonzero(counts > max_pairs)
+    if len(too_big):
+        pieces = []
+        for i in too_big:
+            step = max(1, max_pairs // b_count[i])
+            for start in range(0, a_count[i], step):
+                pieces.append(
+                    (
+                        a_start[i] + start,
+                        min(step, a_count[i] - start),
+                        b_start[i],
+                        b_count[i],
+                    )
+                )
+        keep = counts <= max_pairs
+        split = numpy.array(pieces, dtype=numpy.intp).T
+        a_start = numpy.concatenate((a_start[keep], split[0]))
+        a_count = numpy.concatenate((a_count[keep], split[1]))
+        b_start = numpy.concatenate((b_start[keep], split[2]))
+        b_count = numpy.concatenate((b_count[keep], split[3]))
+        counts = a_count * b_count
+
+    ends = numpy.cumsum(counts)
+    begin = 0
+    while begin < len(counts):
+        offset = ends[begin] - counts[begin]
+        end = max(begin + 1, int(numpy.searchsorted(ends, offset + max_pairs, "right")))
+
+        batch_counts = counts[begin:end]
+        batch = numpy.repeat(numpy.arange(begin, end), batch_counts)
+        within = numpy.arange(len(batch)) - numpy.repeat(
+            ends[begin:end] - batch_counts - offset, batch_counts
+        )
+
+        width = b_count[batch]
+        yield a_start[batch] + within // width, b_start[batch] + within % width
+
+        begin = end
+
+
+def triangle(
+    start: numpy.typing.NDArray[numpy.intp],
+    count: numpy.typing.NDArray[numpy.intp],
+    max_pairs: int,
+) -> Iterator[
+    tuple[numpy.typing.NDArray[numpy.intp], numpy.typing.NDArray[numpy.intp]]
+]:
+    """
+    For ranges of positions start[i]:start[i] + count[i], yield the
+    pairs of two positions of a range, the smaller one first, in
+    batches of about `max_pairs` pairs
+    """
+    # each position of a range is paired with the positions after it
+    rank = numpy.arange(int(count.sum())) - numpy.repeat(
+        numpy.cumsum(count) - count, count
+    )
+    first = numpy.repeat(start, count) + rank
+    n_after = numpy.repeat(count, count) - rank - 1
+
+    later = n_after > 0
+    first, n_after = first[later], n_after[later]
+    yield from cartesian(first, numpy.ones_like(first), first + 1, n_after, max_pairs)
+
+
+class SharedBlocks(object):
+    """
+    The blocks of every record, to find whether two records share a
+    block before a given one.
+
+    Blocks are numbered in sorted order of their keys, and each block
+    of a record is stored as `code * stride + block` in one sorted
+    array, so the blocks of a record are next to each other and sorted.
+    `stride` must be greater than the number of blocks.
+    """
+
+    def __init__(self, memberships: Codes, stride: int):
+        self.memberships = memberships
+        self.stride = numpy.uint64(stride)
+
+    def contains(
+        self, codes: Codes, blocks: Codes
+    ) -> numpy.typing.NDArray[numpy.bool_]:
+        """Whether the record of each code is in the matching block"""
+        memberships = self.memberships
+        if not len(memberships):
+            return numpy.zeros(len(codes), dtype=bool)
+
+        wanted = codes * self.stride + blocks
+        positions = numpy.searchsorted(memberships, wanted).clip(
+            max=len(memberships) - 1
+        )
+        found: numpy.typing.NDArray[numpy.bool_] = memberships[positions] == wanted
+        return found
+
+    def first_shared(
+        self, codes_a: Codes, codes_b: Codes, block: Codes
+    ) -> numpy.typing.NDArray[numpy.bool_]:
+        """
+        Whether `block` is the first block that the records of each pair
+        of codes share
+        """
+        memberships = self.memberships
+        stride = self.stride
+
+        first = numpy.ones(len(codes_a), dtype=bool)
+
+        # walk the blocks of the first records, that come before `block`,
+        # and look them up in the blocks of the second records
+        unchecked = numpy.arange(len(codes_a))
+        positions = numpy.searchsorted(memberships, codes_a * stride)
+        while len(unchecked):
+            positions = positions.clip(max=len(memberships) - 1)
+            earlier = memberships[positions]
+            in_record = (earlier // stride == codes_a[unchecked]) & (
+                earlier % stride < block[unchecked]
+            )
+            unchecked, positions, earlier = (
+                unchecked[in_record],
+                positions[in_record],
+                earlier[in_record],
+            )
+
+            shared = self.contains(codes_b[unchecked], earlier % stride)
+            first[unchecked[shared]] = False
+
+            unchecked, positions = unchecked[~shared], positions[~shared] + 1
+            # the last membership has no next one
+            unchecked = unchecked[positions < len(memberships)]
+            positions = positions[positions < len(memberships)]
+
+        return first
+
+
+def add_rows(
+    sorter: ExternalSorter,
+    block_keys: Iterable[tuple[BlockKey, int]],
+    offset: int = 0,
+    batch_size: int = 100000,
+) -> int:
+    """
+    Hash the block keys of (block key, record code) rows and sort them,
+    adding `offset` to the codes. Returns the number of codes used,
+    the largest code plus one.
+    """
+    n_codes = 0
+    for keys, codes in hashed_batches(block_keys, batch_size):
+        n_codes = max(n_codes, int(codes.max()) + 1)
+        sorter.add(keys, codes + numpy.uint64(offset))
+
+    return n_codes
+
+
+def hashed_batches(
+    block_keys: Iterable[tuple[BlockKey, int]], batch_size: int = 100000
+) -> Iterator[Rows]:
+    """Hash the block keys of (block key, record code) rows, in batches"""
+    rows = iter(block_keys)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+
+        keys = hash_block_keys([block_key for block_key, _ in batch])
+        codes = numpy.fromiter((code for _, code in batch), "u8", len(batch))
+        yield keys, codes
+
+
+def shared_blocks(
+    blocks: ExternalSorter,
+    sizes_of: Callable[[Codes, Codes], tuple[NDArrayIntp, NDArrayIntp]],
+    memberships: ExternalSorter,
+) -> SharedBlocks:
+    """
+    Number the blocks that can pair up records, whose `sizes_of` both
+    sides are not empty, and sort the blocks of every record with the
+    `memberships` sorter
+    """
+
+    # a block can't hold more than all the rows
+    stride = blocks.n_rows + 1
+    n_blocks = 0
+    in_memory = []
+    for keys, values in blocks.groups():
+        starts = block_starts(keys)
+        a_sizes, b_sizes = sizes_of(keys, values)
+        pairing = (a_sizes > 0) & (b_sizes > 0)
+
+        sizes = numpy.diff(numpy.append(starts, len(keys)))
+        numbers = numpy.cumsum(pairing) - 1 + n_blocks
+        n_blocks += int(pairing.sum())
+
+        in_pairing = numpy.repeat(pairing, sizes)
+        row_blocks = numpy.repeat(numbers, sizes)[in_pairing].astype("u8")
+        codes = values[in_pairing]
+        if blocks.runs:
+            memberships.add(
+                codes * numpy.uint64(stride) + row_blocks, numpy.zeros_like(codes)
+            )
+        else:
+            in_memory.append(codes * numpy.uint64(stride) + row_blocks)
+
+    if in_memory:
+        return SharedBlocks(numpy.unique(numpy.concatenate(in_memory)), stride)
+
+    return SharedBlocks(memberships.sorted_keys(), stride)
+
+
+def first_shared_pairs(
+    blocks: ExternalSorter,
+    sizes_of: Callable[[Codes, Codes], tuple[NDArrayIntp, NDArrayIntp]],
+    max_pairs: int = MAX_PAIRS,
+    one_dataset: bool = False,
+) -> Iterator[Rows]:
+    """
+    Yield batches of the pairs of codes of records in each block, the
+    first side of a block against the second, where the block is the
+    first the two records share. If `one_dataset` is True, both sides
+    of a block are all its records, and each pair of them is made once,
+    with the smaller code first.
+    """
+    memberships = ExternalSorter(blocks.max_rows, blocks.temp_dir)
+    try:
+        shared = shared_blocks(blocks, sizes_of, memberships)
+        yield from _first_shared_pairs(blocks, sizes_of, max_pairs, shared, one_dataset)
+    finally:
+        memberships.close()
+
+
+def _first_shared_pairs(
+    blocks: ExternalSorter,
+    sizes_of: Callable[[Codes, Codes], tuple[NDArrayIntp, NDArrayIntp]],
+    max_pairs: int,
+    shared: SharedBlocks,
+    one_dataset: bool,
+) -> Iterator[Rows]:
+    n_blocks = 0
+    for keys, values in blocks.groups():
+        starts = block_starts(keys)
+        a_sizes, b_sizes = sizes_of(keys, values)
+        pairing = (a_sizes > 0) & (b_sizes > 0)
+
+        sizes = numpy.diff(numpy.append(starts, len(keys)))
+        numbers = (numpy.cumsum(pairing) - 1 + n_blocks).astype("u8")
+        n_blocks += int(pairing.sum())
+        row_blocks = numpy.repeat(numbers, sizes)
+
+        starts, a_sizes, b_sizes = starts[pairing], a_sizes[pairing], b_sizes[pairing]
+        b_starts = starts + sizes[pairing] - b_sizes
+
+        if one_dataset:
+            # the codes of a block are sorted and distinct
+            batches = triangle(starts, a_sizes, max_pairs)
+        else:
+            batches = cartesian(starts, a_sizes, b_starts, b_sizes, max_pairs)
+
+        for a, b in batches:
+            codes_a, codes_b = values[a], values[b]
+            first = shared.first_shared(codes_a, codes_b, row_blocks[a])
+            if first.any():
+                yield codes_a[first], codes_b[first]
+
+
+def dedupe_pairs(
+    block_keys: Iterable[tuple[BlockKey, int]],
+    max_rows: Optional[int] = MAX_ROWS,
+    temp_dir: Optional[str] = None,
+    max_block_size: Optional[int] = None,
+    oversized: Optional[dict[BlockKey, tuple[int, int]]] = None,
+) -> Iterator[Rows]:
+    """
+    From (block key, record code) rows, yield batches of the distinct
+    pairs of codes of records that share a block key, with the
+    smaller code first.
+
+    Blocks of more than `max_block_size` records are skipped, and
+    added to `oversized`, by their signed hash, with their number of
+    records and of pairs, before the first batch is yielded.
+    """
+    blocks = ExternalSorter(max_rows, temp_dir)
+    try:
+        add_rows(blocks, block_keys)
+        yield from sorted_dedupe_pairs(blocks, max_block_size, oversized)
+    finally:
+        blocks.close()
+
+
+def sorted_dedupe_pairs(
+    blocks: ExternalSorter,
+    max_block_size: Optional[int] = None,
+    oversized: Optional[dict[BlockKey, tuple[int, int]]] = None,
+) -> Iterator[Rows]:
+    """
+    Like :func:`dedupe_pairs`, but from the rows of hashed block keys
+    and record codes already added to a sorter
+    """
+
+    def sizes_of(keys: Codes, values: Codes) -> tuple[NDArrayIntp, NDArrayIntp]:
+        starts = block_starts(keys)
+        sizes = numpy.diff(numpy.append(starts, len(keys)))
+        # a block of one record doesn't pair it up with anything
+        sizes[sizes < 2] = 0
+        if max_block_size is not None:
+            too_big = sizes > max_block_size
+            if oversized is not None:
+                for key, size in zip(
+                    keys[starts[too_big]].view("i8").tolist(), sizes[too_big].tolist()
+                ):
+                    oversized[key] = (size, size * (size - 1) // 2)
+            sizes[too_big] = 0
+        return sizes, sizes
+
+    yield from first_shared_pairs(blocks, sizes_of, one_dataset=True)
+
+
+def link_pairs(
+    block_keys_a: Iterable[tuple[BlockKey, int]],
+    block_keys_b: Iterable[tuple[BlockKey, int]],
+    max_rows: Optional[int] = MAX_ROWS,
+    temp_dir: Optional[str] = None,
+    max_block_size: Optional[int] = None,
+    oversized: Optional[dict[BlockKey, tuple[int, int]]] = None,
+) -> Iterator[Rows]:
+    """
+    From the (block key, record code) rows of two datasets, yield
+    batches of the distinct pairs of a code of a record in the first
+    and a code of a record in the second that share a block key.
+
+    Blocks of more than `max_block_size` records of both datasets are
+    skipped, and reported like with :func:`dedupe_pairs`.
+    """
+    blocks = ExternalSorter(max_rows, temp_dir)
+
+    try:
+        # the codes of the second dataset come after the codes of the
+        # first, so its records sort last in every block
+        n_codes_a = add_rows(blocks, block_keys_a)
+        add_rows(blocks, block_keys_b, offset=n_codes_a)
+
+        offset = numpy.uint64(n_codes_a)
+
+        def sizes_of(keys: Codes, values: Codes) -> tuple[NDArrayIntp, NDArrayIntp]:
+            starts = block_starts(keys)
+            sizes = numpy.diff(numpy.append(starts, len(keys)))
+            b_sizes = numpy.add.reduceat((values >= offset).astype(numpy.intp), starts)
+            a_sizes = sizes - b_sizes
+            if max_block_size is not None:
+                too_big = (sizes > max_block_size) & (a_sizes > 0) & (b_sizes > 0)
+                if oversized is not None:
+                    for key, n_a, n_b in zip(
+                        keys[starts[too_big]].view("i8").tolist(),
+                        a_sizes[too_big].tolist(),
+                        b_sizes[too_big].tolist(),
+                    ):
+                        oversized[key] = (n_a + n_b, n_a * n_b)
+                a_sizes[too_big] = 0
+                b_sizes[too_big] = 0
+            return a_sizes, b_sizes
+
+        for codes_a, codes_b in first_shared_pairs(blocks, sizes_of):
+            yield codes_a, codes_b - offset
+    finally:
+        blocks.close()
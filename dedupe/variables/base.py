@@ -1,13 +1,21 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import collections
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy
 
 from dedupe import predicates
 
 if TYPE_CHECKING:
     from typing import Any, ClassVar, Generator, Iterable, Optional, Sequence, Type
 
-    from dedupe._typing import Comparator, PredicateFunction, VariableDefinition
+    from dedupe._typing import (
+        BatchComparator,
+        Comparator,
+        PredicateFunction,
+        VariableDefinition,
+    )
 
 
 class Variable(object):
@@ -80,6 +88,21 @@ class FieldType(Variable):
     _Predicate: Type[predicates.SimplePredicate] = predicates.SimplePredicate
     comparator: Comparator
 
+    # Variables can optionally provide a comparator that takes two
+    # columns of field values and returns the distances for all the
+    # pairs at once. If present, the data model will prefer it to
+    # calling `comparator` on each pair.
+    batch_comparator: BatchComparator | None = None
+
+    comparator_cache: ComparatorCache | None = None
+
+    # Comparators of expensive variables are skipped for pairs that
+    # can't score above the threshold whatever their distance is, as
+    # long as that distance is within `distance_bounds`, see
+    # dedupe.datamodel.Cascade
+    expensive = False
+    distance_bounds: tuple[float, float] = (-numpy.inf, numpy.inf)
+
     def __init__(self, definition: VariableDefinition):
         self.field = definition["field"]
 
@@ -88,6 +111,10 @@ class FieldType(Variable):
         else:
             self.name = "(%s: %s)" % (self.field, self.type)
 
+        cache_size = definition.get("cache size", 0)
+        if cache_size:
+            self.comparator_cache = ComparatorCache(cache_size)
+
         self.predicates = [
             self._Predicate(pred, self.field) for pred in self._predicate_functions
         ]
@@ -101,6 +128,7 @@ class FieldType(Variable):
 
 class CustomType(FieldType):
     type = "Custom"
+    expensive = True
 
     def __init__(self, definition: VariableDefinition):
         super(CustomType, self).__init__(definition)
@@ -122,6 +150,92 @@ class CustomType(FieldType):
             )
 
 
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ComparatorCache(object):
+    """
+    A bounded cache of the distances between pairs of field values.
+
+    Blocks often pair up the same field values over and over again,
+    so we remember the distances of the most recently seen pairs of
+    values and evict the least recently used pair when the cache is
+    full. The cache is emptied when it is pickled, so every scoring
+    process keeps its own cache and its own statistics.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize < 1:
+            raise ValueError("The size of a comparator cache must be positive")
+
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self) -> None:
+        self._cache: collections.OrderedDict[
+            tuple[Any, Any], numpy.typing.NDArray[numpy.float_]
+        ] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def __call__(
+        self,
+        compare: BatchComparator,
+        column_1: Sequence[Any],
+        column_2: Sequence[Any],
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        """
+        Compare two columns of field values, only calling `compare` on
+        the distinct pairs of values that are not in the cache
+        """
+        cache = self._cache
+
+        try:
+            keys = list(zip(column_1, column_2))
+            distinct_keys = dict.fromkeys(keys)
+        except TypeError:
+            # unhashable field values can't be cached
+            return numpy.asarray(compare(column_1, column_2))
+
+        found = {}
+        new_keys = []
+        for key in distinct_keys:
+            try:
+                found[key] = cache[key]
+            except KeyError:
+                new_keys.append(key)
+            else:
+                cache.move_to_end(key)
+
+        self.hits += len(keys) - len(new_keys)
+        self.misses += len(new_keys)
+
+        if new_keys:
+            values_1, values_2 = zip(*new_keys)
+            distances = numpy.asarray(compare(list(values_1), list(values_2)))
+            for key, row in zip(new_keys, distances.reshape(len(new_keys), -1)):
+                found[key] = cache[key] = row
+
+            while len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+        return numpy.array([found[key] for key in keys])
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, d: dict[str, Any]) -> None:
+        self.maxsize = d["maxsize"]
+        self.clear()
+
+
 def indexPredicates(
     predicates: Iterable[Type[predicates.IndexPredicate]],
     thresholds: Sequence[float],
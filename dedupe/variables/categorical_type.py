@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+from typing import Any, Sequence
+
+import numpy
+import numpy.typing
 from categorical import CategoricalComparator
 
 from dedupe import predicates
@@ -10,6 +14,8 @@ from dedupe.variables.base import DerivedType, FieldType
 class CategoricalType(FieldType):
     type = "Categorical"
     _predicate_functions: list[PredicateFunction] = [predicates.wholeFieldPredicate]
+    _codes: dict[Any, int]
+    _responses: numpy.typing.NDArray[numpy.float_]
 
     def _categories(self, definition: VariableDefinition) -> list[str]:
         try:
@@ -35,3 +41,41 @@ class CategoricalType(FieldType):
 
     def __len__(self) -> int:
         return len(self.higher_vars)
+
+    def batch_comparator(
+        self, column_1: Sequence[Any], column_2: Sequence[Any]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        codes, responses = self._response_table()
+
+        try:
+            codes_1 = numpy.fromiter(map(codes.__getitem__, column_1), int)
+            codes_2 = numpy.fromiter(map(codes.__getitem__, column_2), int)
+        except KeyError:
+            unmatched = (set(column_1) | set(column_2)) - codes.keys()
+            raise ValueError(
+                "value(s) %s not among declared set of categories: %s"
+                % (unmatched, set(codes))
+            )
+
+        return responses[codes_1, codes_2]
+
+    def _response_table(
+        self,
+    ) -> tuple[dict[Any, int], numpy.typing.NDArray[numpy.float_]]:
+        """
+        Lay out the responses of the categorical comparator as a
+        lookup table indexed by the codes of the two categories
+        """
+        try:
+            return self._codes, self._responses
+        except AttributeError:
+            pass
+
+        comparator: CategoricalComparator = self.comparator  # type: ignore[assignment]
+        levels = list(comparator.levels)
+        self._codes = {level: i for i, level in enumerate(levels)}
+        self._responses = numpy.array(
+            [[comparator(level_1, level_2) for level_2 in levels] for level_1 in levels]
+        ).reshape(len(levels), len(levels), -1)
+
+        return self._codes, self._responses
@@ -1,4 +1,8 @@
-from typing import Any
+import operator
+from typing import Any, Sequence
+
+import numpy
+import numpy.typing
 
 from dedupe import predicates
 from dedupe.variables.base import FieldType
@@ -14,3 +18,11 @@ class ExactType(FieldType):
             return 1
         else:
             return 0
+
+    @staticmethod
+    def batch_comparator(
+        column_1: Sequence[Any], column_2: Sequence[Any]
+    ) -> numpy.typing.NDArray[numpy.bool_]:
+        return numpy.fromiter(
+            map(operator.eq, column_1, column_2), bool, count=len(column_1)
+        )
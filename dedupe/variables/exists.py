@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Sequence
 
+import numpy
+import numpy.typing
 from categorical import CategoricalComparator
 
 from dedupe._typing import PredicateFunction, VariableDefinition
@@ -36,3 +38,22 @@ class ExistsType(CategoricalType):
     # This flag tells fieldDistances in dedupe.core to pass
     # missing values (None) into the comparator
     comparator.missing = True  # type: ignore
+
+    def batch_comparator(
+        self, column_1: Sequence[Any], column_2: Sequence[Any]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        n_exists = numpy.fromiter(map(bool, column_1), int, count=len(column_1))
+        n_exists += numpy.fromiter(map(bool, column_2), int, count=len(column_2))
+
+        # indexed by the number of fields that have a value
+        responses = numpy.array(
+            [
+                self.cat_comparator(0, 0),
+                self.cat_comparator(0, 1),
+                self.cat_comparator(1, 1),
+            ]
+        )
+
+        return responses[n_exists]
+
+    batch_comparator.missing = True  # type: ignore
@@ -1,12 +1,22 @@
 from __future__ import annotations
 
 from math import sqrt
+from typing import TYPE_CHECKING
 
+import numpy
 from haversine import haversine
 
 from dedupe import predicates
 from dedupe.variables.base import FieldType
 
+if TYPE_CHECKING:
+    from typing import Sequence
+
+    import numpy.typing
+
+# mean earth radius in kilometers, the same that `haversine` uses
+AVG_EARTH_RADIUS = 6371.0088
+
 
 class LatLongType(FieldType):
     type = "LatLong"
@@ -16,3 +26,19 @@ class LatLongType(FieldType):
     @staticmethod
     def comparator(x: tuple[float, float], y: tuple[float, float]) -> float:
         return sqrt(haversine(x, y))
+
+    @staticmethod
+    def batch_comparator(
+        x: Sequence[tuple[float, float]], y: Sequence[tuple[float, float]]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        lat_1, lng_1 = numpy.radians(numpy.asarray(x, dtype=float).reshape(-1, 2)).T
+        lat_2, lng_2 = numpy.radians(numpy.asarray(y, dtype=float).reshape(-1, 2)).T
+
+        d = (
+            numpy.sin((lat_2 - lat_1) * 0.5) ** 2
+            + numpy.cos(lat_1)
+            * numpy.cos(lat_2)
+            * numpy.sin((lng_2 - lng_1) * 0.5) ** 2
+        )
+
+        return numpy.sqrt(2 * AVG_EARTH_RADIUS * numpy.arcsin(numpy.sqrt(d)))
@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 import numpy
 
 from dedupe import predicates
 from dedupe.variables.base import FieldType
 
+if TYPE_CHECKING:
+    from typing import Sequence
+
+    import numpy.typing
+
 
 class PriceType(FieldType):
     _predicate_functions = [
@@ -22,3 +29,19 @@ class PriceType(FieldType):
             return numpy.nan
         else:
             return abs(numpy.log10(price_1) - numpy.log10(price_2))
+
+    @staticmethod
+    def batch_comparator(
+        prices_1: Sequence[int | float], prices_2: Sequence[int | float]
+    ) -> numpy.typing.NDArray[numpy.float_]:
+        array_1 = numpy.asarray(prices_1, dtype=float)
+        array_2 = numpy.asarray(prices_2, dtype=float)
+
+        distances = numpy.full(len(array_1), numpy.nan)
+
+        positive = (array_1 > 0) & (array_2 > 0)
+        distances[positive] = numpy.abs(
+            numpy.log10(array_1[positive]) - numpy.log10(array_2[positive])
+        )
+
+        return distances
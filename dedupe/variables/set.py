@@ -7,6 +7,8 @@ from dedupe.variables.base import FieldType
 
 class SetType(FieldType):
     type = "Set"
+    expensive = True
+    distance_bounds = (0.0, 1.0)
 
     _predicate_functions = (
         predicates.wholeSetPredicate,
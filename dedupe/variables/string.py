@@ -1,5 +1,6 @@
 from typing import Sequence, Type
 
+import numpy
 from affinegap import normalizedAffineGapDistance as affineGap
 from highered import CRFEditDistance
 from simplecosine.cosine import CosineTextSimilarity
@@ -35,6 +36,8 @@ base_predicates = (
 class BaseStringType(FieldType):
     _Predicate = predicates.StringPredicate
     _predicate_functions: Sequence[PredicateFunction] = ()
+    expensive = True
+    distance_bounds = (0.0, numpy.inf)
 
     def __init__(self, definition: VariableDefinition):
         super(BaseStringType, self).__init__(definition)
@@ -48,6 +51,17 @@ class BaseStringType(FieldType):
             self.field,
         )
 
+        if definition.get("neighborhood", False) is True:
+            self.predicates += indexPredicates(
+                (
+                    predicates.FieldNeighborhoodPredicate,
+                    predicates.ReversedNeighborhoodPredicate,
+                    predicates.TokenNeighborhoodPredicate,
+                ),
+                (4, 16),
+                self.field,
+            )
+
 
 class ShortStringType(BaseStringType):
     type = "ShortString"
@@ -89,6 +103,7 @@ class StringType(ShortStringType):
 
 class TextType(BaseStringType):
     type = "Text"
+    distance_bounds = (0.0, 1.0)
 
     _predicate_functions = base_predicates
 
@@ -1,9 +1,20 @@
+import io
 import itertools
+import pickle
+import tempfile
 import unittest
+import unittest.mock
 import warnings
 from collections import OrderedDict
 
+import pytest
+import sklearn.linear_model
+
 import dedupe.api
+import dedupe.blocking
+import dedupe.core
+import dedupe.datamodel
+import dedupe.predicates
 
 
 def icfi(x):
@@ -43,6 +54,17 @@ data_dict_2 = OrderedDict(
 )
 
 
+def name_classifier(data_model):
+    classifier = sklearn.linear_model.LogisticRegression().fit(
+        data_model.distances(DATA_SAMPLE), [1, 0, 0, 0, 0]
+    )
+    # more distant names are less likely to match
+    classifier.coef_[:] = 0
+    classifier.coef_[0, 0] = -1
+    classifier.intercept_[:] = 3
+    return classifier
+
+
 class ActiveMatch(unittest.TestCase):
     def setUp(self):
         self.field_definition = [
@@ -111,5 +133,221 @@ class ActiveMatch(unittest.TestCase):
             assert str(w[-1].message) == "Didn't return any labeled record pairs"
 
 
+class RecordStoreInput(unittest.TestCase):
+    def setUp(self):
+        same_age = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "age"
+        )
+        self.fingerprinter = dedupe.blocking.Fingerprinter([same_age])
+
+    def test_dedupe_pairs(self):
+        deduper = dedupe.api.Dedupe([{"field": "name", "type": "String"}])
+        deduper._fingerprinter = self.fingerprinter
+
+        with dedupe.core.RecordStore(iter(data_dict.items())) as store:
+            assert list(store.items()) == list(data_dict.items())
+            assert list(deduper.pairs(store)) == list(deduper.pairs(data_dict))
+
+    def test_link_pairs(self):
+        linker = dedupe.api.RecordLink([{"field": "name", "type": "String"}])
+        linker._fingerprinter = self.fingerprinter
+
+        expected = sorted(linker.pairs(data_dict, data_dict_2))
+        assert expected
+
+        with dedupe.core.RecordStore(iter(data_dict_2.items())) as store:
+            assert sorted(linker.pairs(data_dict, store)) == expected
+
+    def test_record_store_on_disk(self):
+        store = dedupe.api._record_store(data_dict, 2)
+        assert store.path is None
+        assert list(store.items()) == list(data_dict.items())
+
+        with unittest.mock.patch.object(dedupe.api, "MAX_IN_MEMORY_RECORDS", 5):
+            assert dedupe.api._record_store(data_dict, 1).path is None
+            with dedupe.api._record_store(data_dict, 2) as store:
+                assert store.path is not None
+                assert list(store.items()) == list(data_dict.items())
+
+    def test_partition_unsorted_ids(self):
+        deduper = dedupe.api.Dedupe([{"field": "name", "type": "String"}], 2)
+        deduper._fingerprinter = self.fingerprinter
+        deduper.classifier = name_classifier(deduper.data_model)
+
+        # record ids that don't sort in the order of the data
+        data = OrderedDict(
+            ("record %d" % (len(data_dict) - i), record)
+            for i, record in data_dict.items()
+        )
+
+        def clusters(data):
+            return sorted(
+                sorted(zip(ids, [round(score, 6) for score in scores]))
+                for ids, scores in deduper.partition(data, 0.1)
+            )
+
+        expected = [
+            sorted(("record %d" % (len(data_dict) - i), score) for i, score in cluster)
+            for cluster in clusters(data_dict)
+        ]
+        assert any(len(cluster) > 1 for cluster in expected)
+
+        assert clusters(data) == sorted(expected)
+        with unittest.mock.patch.object(dedupe.api, "MAX_IN_MEMORY_RECORDS", 0):
+            assert clusters(data) == sorted(expected)
+
+        deduper.close()
+
+
+class OverriddenMethods(unittest.TestCase):
+    def setUp(self):
+        same_age = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "age"
+        )
+        self.fingerprinter = dedupe.blocking.Fingerprinter([same_age])
+
+    def test_partition_pairs(self):
+        class NoBob(dedupe.api.Dedupe):
+            def pairs(self, data):
+                for (id_1, record_1), (id_2, record_2) in super().pairs(data):
+                    if 0 not in (id_1, id_2):
+                        yield (id_1, record_1), (id_2, record_2)
+
+        clusters = {}
+        for cls in (dedupe.api.Dedupe, NoBob):
+            deduper = cls([{"field": "name", "type": "String"}])
+            deduper._fingerprinter = self.fingerprinter
+            deduper.classifier = name_classifier(deduper.data_model)
+            clusters[cls] = [ids for ids, _ in deduper.partition(data_dict, 0.1)]
+
+        assert any(0 in ids and len(ids) > 1 for ids in clusters[dedupe.api.Dedupe])
+        assert (0,) in clusters[NoBob]
+        assert sorted(clusters[NoBob]) != sorted(clusters[dedupe.api.Dedupe])
+
+    def test_join_score(self):
+        class Doubtful(dedupe.api.RecordLink):
+            def score(self, pairs, threshold=0.0):
+                scores = super().score(pairs, threshold)
+                scores["score"] /= 2
+                return scores
+
+        links = {}
+        for cls in (dedupe.api.RecordLink, Doubtful):
+            linker = cls([{"field": "name", "type": "String"}])
+            linker._fingerprinter = self.fingerprinter
+            linker.classifier = name_classifier(linker.data_model)
+            links[cls] = dict(linker.join(data_dict, data_dict_2, 0.0))
+
+        assert links[Doubtful]
+        for pair, score in links[Doubtful].items():
+            assert score == pytest.approx(links[dedupe.api.RecordLink][pair] / 2)
+
+    def test_shard(self):
+        deduper = dedupe.api.Dedupe([{"field": "name", "type": "String"}])
+        deduper._fingerprinter = self.fingerprinter
+        deduper.classifier = name_classifier(deduper.data_model)
+
+        expected = sorted(
+            ids for ids, _ in deduper.partition(data_dict, 0.1) if len(ids) > 1
+        )
+        assert expected
+
+        with tempfile.TemporaryDirectory() as directory:
+            deduper.shard(data_dict, directory, 3)
+            for shard in range(3):
+                deduper.score_shard(directory, shard)
+            scores = deduper.merge_shards(directory)
+
+            assert len(scores) == len(list(deduper.pairs(data_dict)))
+            clusters = sorted(ids for ids, _ in deduper.cluster(scores, 0.1))
+            assert clusters == expected
+
+            # sharding again in the same directory would score every
+            # pair twice
+            with self.assertRaises(ValueError):
+                deduper.shard(data_dict, directory, 3)
+
+
+class AddRecords(unittest.TestCase):
+    def setUp(self):
+        data_model = dedupe.datamodel.DataModel([{"field": "name", "type": "String"}])
+        same_age = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "age"
+        )
+
+        self.settings = io.BytesIO()
+        pickle.dump(data_model, self.settings)
+        pickle.dump(name_classifier(data_model), self.settings)
+        pickle.dump([same_age], self.settings)
+
+        self.first = OrderedDict(itertools.islice(data_dict.items(), 4))
+        self.second = OrderedDict(itertools.islice(data_dict.items(), 4, None))
+
+    def matcher(self):
+        self.settings.seek(0)
+        return dedupe.api.StaticDedupe(self.settings)
+
+    @staticmethod
+    def rounded(clusters):
+        return sorted(
+            (ids, tuple(round(score, 6) for score in scores))
+            for ids, scores in clusters
+        )
+
+    def test_state(self):
+        for max_block_size in (None, 2):
+            matcher = self.matcher()
+            matcher.max_block_size = max_block_size
+            expected = self.rounded(matcher.partition(data_dict, 0.1))
+            assert any(len(ids) > 1 for ids, _ in expected)
+
+            matcher.add_records(self.first, 0.1)
+            state = io.BytesIO()
+            matcher.write_state(state)
+            assert b"Linda" not in state.getvalue()
+
+            state.seek(0)
+            restored = self.matcher()
+            restored.max_block_size = max_block_size
+            restored.read_state(state, self.first)
+            assert self.rounded(restored.clusters()) == self.rounded(matcher.clusters())
+
+            restored.add_records(self.second, 0.1)
+            assert self.rounded(restored.clusters()) == expected
+
+            matcher.add_records(self.second, 0.1)
+            assert self.rounded(matcher.clusters()) == expected
+
+    def test_max_block_size(self):
+        matcher = self.matcher()
+        matcher.max_block_size = 2
+        matcher.add_records(self.first, 0.1)
+
+        # the block of the three records aged 51 only gets too big now
+        with self.assertLogs("dedupe.api", "WARNING"):
+            matcher.add_records(self.second, 0.1)
+        (block,) = matcher._added_index.oversized_blocks
+        assert block.n_records == 3
+        assert [cluster for cluster, _ in matcher.clusters() if len(cluster) > 1] == [
+            (1, 6)
+        ]
+
+    def test_read_state_missing_records(self):
+        matcher = self.matcher()
+        matcher.add_records(self.first, 0.1)
+        state = io.BytesIO()
+        matcher.write_state(state)
+
+        state.seek(0)
+        with self.assertRaises(ValueError):
+            self.matcher().read_state(state, self.second)
+
+        state.seek(0)
+        with dedupe.core.RecordStore(iter(data_dict.items())) as store:
+            restored = self.matcher()
+            restored.read_state(state, store)
+            assert self.rounded(restored.clusters()) == self.rounded(matcher.clusters())
+
+
 if __name__ == "__main__":
     unittest.main()
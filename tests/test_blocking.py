@@ -1,9 +1,19 @@
+import glob
+import itertools
+import os
+import random
+import tempfile
 import unittest
 from collections import defaultdict
 
+import numpy
 from future.utils import viewitems, viewvalues
 
 import dedupe
+import dedupe.backends
+import dedupe.blocking_stats
+import dedupe.sharding
+import dedupe.sorted_blocking
 
 
 class BlockingTest(unittest.TestCase):
@@ -134,5 +144,613 @@ class TfIndexUnindex(unittest.TestCase):
         assert len(blocks.values()) == 0
 
 
+class HashedBlockKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.data_d = {
+            100: {"name": "Bob Smith", "city": "Chicago"},
+            105: {"name": "Bob Smyth", "city": "Chicago"},
+            110: {"name": "Bobby Smith", "city": "Evanston"},
+            115: {"name": "Sue Jones", "city": "Chicago"},
+            120: {"name": "Sue Jonas", "city": "Evanston"},
+        }
+        name_first = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.firstTokenPredicate, "name"
+        )
+        name_tokens = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeSetPredicate, "name"
+        )
+        city = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "city"
+        )
+        self.blocker = dedupe.blocking.Fingerprinter(
+            [
+                name_first,
+                dedupe.predicates.CompoundPredicate((name_first, city)),
+                dedupe.predicates.CompoundPredicate((name_tokens, city)),
+            ]
+        )
+
+    def test_same_blocks(self):
+        blocks = defaultdict(set)
+        for block_key, record_id in self.blocker(self.data_d.items()):
+            blocks[block_key].add(record_id)
+
+        hashed_blocks = defaultdict(set)
+        for block_key, record_id in self.blocker(self.data_d.items(), hashed=True):
+            assert isinstance(block_key, int)
+            assert -(2**63) <= block_key < 2**63
+            hashed_blocks[block_key].add(record_id)
+
+        assert len(hashed_blocks) == len(blocks)
+        assert sorted(map(sorted, hashed_blocks.values())) == sorted(
+            map(sorted, blocks.values())
+        )
+
+    def test_predicates_do_not_collide(self):
+        # the same key of two predicates is two different block keys
+        assert dedupe.blocking.hash_block_key(
+            0, "Bob"
+        ) != dedupe.blocking.hash_block_key(1, "Bob")
+        assert dedupe.blocking.hash_block_key(
+            0, ("Bob", "Chicago")
+        ) != dedupe.blocking.hash_block_key(0, ("BobChicago",))
+
+
+class PredicatePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            (1, {"name": "Bob: Smith", "city": "Chicago"}),
+            (2, {"name": "bob smith!", "city": ""}),
+            (3, {"name": "", "city": "Evanston"}),
+        ]
+        self.calls = 0
+
+        def first_token(field):
+            self.calls += 1
+            return dedupe.predicates.firstTokenPredicate(field)
+
+        first_token.__name__ = "firstTokenPredicate"
+
+        self.name_first = dedupe.predicates.StringPredicate(first_token, "name")
+        name_tokens = dedupe.predicates.StringPredicate(
+            dedupe.predicates.tokenFieldPredicate, "name"
+        )
+        city = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "city"
+        )
+        self.predicates = [
+            self.name_first,
+            dedupe.predicates.CompoundPredicate((self.name_first, city)),
+            dedupe.predicates.CompoundPredicate((name_tokens, self.name_first)),
+            dedupe.predicates.ExistsPredicate("city"),
+        ]
+
+    def test_evaluated_once(self):
+        blocker = dedupe.blocking.Fingerprinter(self.predicates)
+        list(blocker(self.records))
+
+        # the name is empty in the last record
+        assert self.calls == 2
+
+    def test_same_keys(self):
+        blocker = dedupe.blocking.Fingerprinter(self.predicates)
+
+        expected = [
+            (block_key + ":" + str(i), record_id)
+            for record_id, record in self.records
+            for i, predicate in enumerate(self.predicates)
+            for block_key in predicate(record)
+        ]
+        assert sorted(blocker(self.records)) == sorted(expected)
+
+
+class ParallelFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        names = ["Bob", "Bobby", "Sue", "Susan", "Jim", "Jimbo", "Willy", "William"]
+        self.records = [
+            (i, {"name": rng.choice(names) + " " + rng.choice(names)})
+            for i in range(50)
+        ]
+
+        name_first = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.firstTokenPredicate, "name"
+        )
+        tfidf = dedupe.predicates.TfidfTextSearchPredicate(0.5, "name")
+        self.blocker = dedupe.blocking.Fingerprinter(
+            [
+                name_first,
+                tfidf,
+                dedupe.predicates.CompoundPredicate((name_first, tfidf)),
+            ]
+        )
+        self.blocker.chunk_size = 7
+        self.blocker.index({record["name"] for _, record in self.records}, "name")
+
+    def test_same_block_keys(self):
+        for hashed in (False, True):
+            serial = list(self.blocker(self.records, hashed=hashed))
+            parallel = list(self.blocker(self.records, hashed=hashed, num_cores=2))
+            assert sorted(parallel) == sorted(serial)
+
+    def test_single_chunk(self):
+        records = self.records[:5]
+        assert list(self.blocker(records, num_cores=2)) == list(self.blocker(records))
+
+
+class BlockingStatsTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        names = ["Bob", "Bobby", "Sue", "Susan", "Jim", "Jimbo", "Willy", "William"]
+        cities = ["Chicago", "Boston", "Austin"]
+        self.records = [
+            {"name": rng.choice(names) + " " + rng.choice(names), "city": city}
+            for city in (rng.choice(cities) for _ in range(60))
+        ]
+
+        name_first = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.firstTokenPredicate, "name"
+        )
+        city = dedupe.predicates.SimplePredicate(
+            dedupe.predicates.wholeFieldPredicate, "city"
+        )
+        name_tokens = dedupe.predicates.StringPredicate(
+            dedupe.predicates.tokenFieldPredicate, "name"
+        )
+        self.predicates = [
+            name_first,
+            name_tokens,
+            dedupe.predicates.CompoundPredicate((name_first, city)),
+        ]
+        self.blocker = dedupe.blocking.Fingerprinter(self.predicates)
+
+    def block_keys(self, records, target=False):
+        return list(self.blocker(enumerate(records), target=target))
+
+    def test_dedupe(self):
+        block_keys = self.block_keys(self.records)
+        blocks = SortedBlockingTest.blocks(block_keys)
+        pairs = {
+            pair
+            for codes in blocks.values()
+            for pair in itertools.combinations(sorted(codes), 2)
+        }
+
+        stats = dedupe.blocking_stats.blocking_stats(self.predicates, self.records)
+        assert stats.n_records == len(self.records)
+        assert stats.distinct_pairs == stats.estimated_pairs == len(pairs)
+        assert stats.n_pairs == sum(
+            len(codes) * (len(codes) - 1) // 2 for codes in blocks.values()
+        )
+        assert sum(stats.block_sizes.values()) == sum(
+            len(codes) > 1 for codes in blocks.values()
+        )
+
+        for i, predicate_stats in enumerate(stats.predicates):
+            sizes = [
+                len(codes)
+                for block_key, codes in blocks.items()
+                if block_key.endswith(":%d" % i) and len(codes) > 1
+            ]
+            assert predicate_stats.n_blocks == len(sizes)
+            assert predicate_stats.largest_block == max(sizes)
+
+        largest = max(blocks.items(), key=lambda block: len(block[1]))
+        assert stats.largest_blocks[0].block_key == largest[0]
+        assert stats.largest_blocks[0].n_records == len(largest[1])
+
+        sampled = dedupe.blocking_stats.blocking_stats(
+            self.predicates, self.records, max_sampled_pairs=20000, seed=1
+        )
+        assert abs(sampled.distinct_pairs - len(pairs)) < 0.05 * len(pairs)
+
+    def test_link(self):
+        records_1, records_2 = self.records[:35], self.records[35:]
+        blocks_1 = SortedBlockingTest.blocks(self.block_keys(records_1))
+        blocks_2 = SortedBlockingTest.blocks(self.block_keys(records_2, target=True))
+        pairs = {
+            pair
+            for block_key, codes in blocks_1.items()
+            for pair in itertools.product(codes, blocks_2.get(block_key, ()))
+        }
+
+        stats = dedupe.blocking_stats.blocking_stats(
+            self.predicates, records_1, records_2, scale=2.0
+        )
+        assert stats.n_records == len(self.records)
+        assert stats.distinct_pairs == len(pairs)
+        assert stats.estimated_pairs == 2 * len(pairs)
+        assert stats.n_pairs == sum(
+            len(codes) * len(blocks_2.get(block_key, ()))
+            for block_key, codes in blocks_1.items()
+        )
+
+
+class SortedBlockingTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(123)
+        self.block_keys_a = [
+            (str(rng.randrange(40)) + ":" + str(rng.randrange(3)), rng.randrange(100))
+            for _ in range(300)
+        ]
+        self.block_keys_b = [
+            (str(rng.randrange(40)) + ":" + str(rng.randrange(3)), rng.randrange(80))
+            for _ in range(200)
+        ]
+
+    @staticmethod
+    def blocks(block_keys):
+        blocks = defaultdict(set)
+        for block_key, code in block_keys:
+            blocks[block_key].add(code)
+        return blocks
+
+    @staticmethod
+    def pairs(batches):
+        pairs = []
+        for codes_a, codes_b in batches:
+            pairs.extend(zip(codes_a.tolist(), codes_b.tolist()))
+        return pairs
+
+    def test_dedupe_pairs(self):
+        expected = set()
+        for codes in self.blocks(self.block_keys_a).values():
+            expected.update(itertools.combinations(sorted(codes), 2))
+
+        for max_rows in (None, 50, 7):
+            pairs = self.pairs(
+                dedupe.sorted_blocking.dedupe_pairs(self.block_keys_a, max_rows)
+            )
+            assert len(pairs) == len(expected)
+            assert set(pairs) == expected
+
+    def test_link_pairs(self):
+        blocks_a = self.blocks(self.block_keys_a)
+        blocks_b = self.blocks(self.block_keys_b)
+        expected = set()
+        for block_key, codes in blocks_a.items():
+            expected.update(itertools.product(codes, blocks_b.get(block_key, ())))
+
+        for max_rows in (None, 50, 7):
+            pairs = self.pairs(
+                dedupe.sorted_blocking.link_pairs(
+                    self.block_keys_a, self.block_keys_b, max_rows
+                )
+            )
+            assert len(pairs) == len(expected)
+            assert set(pairs) == expected
+
+    def test_triangle(self):
+        starts = numpy.array([0, 3, 3, 10], dtype=numpy.intp)
+        counts = numpy.array([3, 0, 7, 40], dtype=numpy.intp)
+        expected = []
+        for start, count in zip(starts.tolist(), counts.tolist()):
+            expected.extend(itertools.combinations(range(start, start + count), 2))
+
+        for max_pairs in (1, 50, 10000):
+            batches = list(dedupe.sorted_blocking.triangle(starts, counts, max_pairs))
+            assert sorted(self.pairs(batches)) == sorted(expected)
+            # only the pairs of two positions are made, each just once,
+            # in batches no bigger than a position has pairs
+            assert max(len(a) for a, _ in batches) <= max(max_pairs, 39)
+
+    def test_external_sorter(self):
+        rng = numpy.random.default_rng(5)
+        keys = rng.integers(0, 20, 1000).astype("u8")
+        values = rng.integers(0, 50, 1000).astype("u8")
+
+        sorter = dedupe.sorted_blocking.ExternalSorter(max_rows=64)
+        for start in range(0, 1000, 30):
+            sorter.add(keys[start : start + 30], values[start : start + 30])
+        assert len(sorter.runs) > 1
+
+        chunks = list(sorter.groups())
+        sorter.close()
+
+        seen_keys = [set(chunk_keys.tolist()) for chunk_keys, _ in chunks]
+        for keys_1, keys_2 in itertools.combinations(seen_keys, 2):
+            assert not keys_1 & keys_2
+
+        rows = list(
+            zip(
+                numpy.concatenate([k for k, _ in chunks]).tolist(),
+                numpy.concatenate([v for _, v in chunks]).tolist(),
+            )
+        )
+        assert rows == sorted(set(zip(keys.tolist(), values.tolist())))
+
+
+class ShardingTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.block_keys = [
+            (str(rng.randrange(40)) + ":" + str(rng.randrange(3)), rng.randrange(100))
+            for _ in range(300)
+        ]
+
+        self.pairs = set()
+        for codes in SortedBlockingTest.blocks(self.block_keys).values():
+            self.pairs.update(itertools.combinations(sorted(codes), 2))
+
+    def test_shards(self):
+        n_shards = 4
+        with tempfile.TemporaryDirectory() as directory:
+            # two processes, each writing its part of every shard
+            for part, block_keys in enumerate(
+                (self.block_keys[::2], self.block_keys[1::2])
+            ):
+                # writing a part again replaces it
+                for _ in range(2):
+                    dedupe.sharding.write_shards(block_keys, directory, n_shards, part)
+
+            n_rows = sum(
+                os.path.getsize(path) // dedupe.sorted_blocking.ROW_DTYPE.itemsize
+                for path in glob.glob(os.path.join(directory, "blocks-*"))
+            )
+            assert n_rows == len(self.block_keys)
+
+            dtype = numpy.dtype([("pairs", "i4", 2), ("score", "f4")])
+            n_pairs = 0
+            for shard in range(n_shards):
+                pairs = SortedBlockingTest.pairs(
+                    dedupe.sharding.shard_pairs(directory, shard, max_rows=50)
+                )
+                n_pairs += len(pairs)
+
+                scores = numpy.empty(len(pairs), dtype=dtype)
+                scores["pairs"] = numpy.array(pairs).reshape(-1, 2)
+                scores["score"] = [a / (a + b) for a, b in pairs]
+                scores.tofile(dedupe.sharding.scores_path(directory, shard))
+
+            merged = dedupe.sharding.merge_scores(
+                [dedupe.sharding.scores_path(directory, s) for s in range(n_shards)],
+                dtype,
+                os.path.join(directory, "merged"),
+                100,
+                max_rows=20,
+            )
+            assert isinstance(merged, numpy.memmap)
+            merged = numpy.array(merged)
+
+        # pairs that share blocks in more than one shard are scored more
+        # than once, but merged once
+        assert n_pairs > len(self.pairs)
+        assert len(merged) == len(self.pairs)
+        assert merged["pairs"].tolist() == sorted(map(list, self.pairs))
+        numpy.testing.assert_allclose(
+            merged["score"], [a / (a + b) for a, b in merged["pairs"].tolist()]
+        )
+
+
+class BlockingBackendTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        # like from the fingerprinter, the block keys of a record are distinct
+        self.block_keys_1 = sorted(
+            {
+                ("%d:0" % rng.randrange(15), "a%02d" % rng.randrange(30))
+                for _ in range(60)
+            }
+        )
+        self.block_keys_2 = sorted(
+            {
+                ("%d:0" % rng.randrange(15), "b%02d" % rng.randrange(20))
+                for _ in range(40)
+            }
+        )
+        self.ids_1 = {record_id for _, record_id in self.block_keys_1}
+        self.ids_2 = {record_id for _, record_id in self.block_keys_2}
+
+        blocks_1 = SortedBlockingTest.blocks(self.block_keys_1)
+        blocks_2 = SortedBlockingTest.blocks(self.block_keys_2)
+
+        self.dedupe_pairs = set()
+        for ids in blocks_1.values():
+            self.dedupe_pairs.update(itertools.combinations(sorted(ids), 2))
+
+        self.link_pairs = set()
+        for block_key, ids in blocks_1.items():
+            self.link_pairs.update(itertools.product(ids, blocks_2.get(block_key, ())))
+
+        self.backends = [
+            dedupe.backends.SQLiteBackend(),
+            dedupe.backends.SQLiteBackend(in_memory=True),
+            dedupe.backends.SQLiteBackend(stream_pairs=True),
+            dedupe.backends.SortedArrayBackend(),
+            dedupe.backends.SortedArrayBackend(max_rows=10),
+        ]
+
+    def tearDown(self):
+        for backend in self.backends:
+            backend.close()
+
+    def test_pairs(self):
+        for backend in self.backends:
+            pairs = list(backend.pairs(self.block_keys_1, self.ids_1))
+            assert len(pairs) == len(self.dedupe_pairs)
+            assert set(pairs) == self.dedupe_pairs
+
+    def test_link_pairs(self):
+        for backend in self.backends:
+            pairs = list(
+                backend.link_pairs(
+                    self.block_keys_1, self.ids_1, self.block_keys_2, self.ids_2
+                )
+            )
+            assert len(pairs) == len(self.link_pairs)
+            assert set(pairs) == self.link_pairs
+
+    def test_search(self):
+        removed = {"b00", "b01", "b02"}
+        expected = {pair for pair in self.link_pairs if pair[1] not in removed}
+
+        for backend in self.backends:
+            backend.index(self.block_keys_2, self.ids_2)
+            backend.unindex(removed)
+
+            pairs = list(backend.search(self.block_keys_1, self.ids_1))
+            assert len(pairs) == len(expected)
+            assert set(pairs) == expected
+
+            ids = [record_id for record_id, _ in pairs]
+            assert ids == sorted(ids)
+
+    def test_max_block_size(self):
+        max_size = 4
+        blocks_1 = SortedBlockingTest.blocks(self.block_keys_1)
+        blocks_2 = SortedBlockingTest.blocks(self.block_keys_2)
+
+        dedupe_pairs = set()
+        dedupe_oversized = {}
+        for block_key, ids in blocks_1.items():
+            if len(ids) > max_size:
+                dedupe_oversized[block_key] = (
+                    len(ids),
+                    len(ids) * (len(ids) - 1) // 2,
+                )
+            else:
+                dedupe_pairs.update(itertools.combinations(sorted(ids), 2))
+
+        link_pairs = set()
+        link_oversized = {}
+        for block_key, ids in blocks_1.items():
+            others = blocks_2.get(block_key, set())
+            if others and len(ids) + len(others) > max_size:
+                link_oversized[block_key] = (
+                    len(ids) + len(others),
+                    len(ids) * len(others),
+                )
+            else:
+                link_pairs.update(itertools.product(ids, others))
+
+        assert dedupe_oversized and link_oversized
+
+        for backend in self.backends:
+            if isinstance(backend, dedupe.backends.SortedArrayBackend):
+                key_of = dedupe.sorted_blocking.hash_block_key
+            else:
+
+                def key_of(block_key):
+                    return block_key
+
+            pairs = list(backend.pairs(self.block_keys_1, self.ids_1, max_size))
+            assert len(pairs) == len(dedupe_pairs)
+            assert set(pairs) == dedupe_pairs
+            assert {
+                block.block_key: (block.n_records, block.n_pairs)
+                for block in backend.oversized_blocks
+            } == {key_of(k): sizes for k, sizes in dedupe_oversized.items()}
+            n_pairs = [block.n_pairs for block in backend.oversized_blocks]
+            assert n_pairs == sorted(n_pairs, reverse=True)
+
+            pairs = list(
+                backend.link_pairs(
+                    self.block_keys_1,
+                    self.ids_1,
+                    self.block_keys_2,
+                    self.ids_2,
+                    max_size,
+                )
+            )
+            assert len(pairs) == len(link_pairs)
+            assert set(pairs) == link_pairs
+            assert {
+                block.block_key: (block.n_records, block.n_pairs)
+                for block in backend.oversized_blocks
+            } == {key_of(k): sizes for k, sizes in link_oversized.items()}
+
+    def test_search_max_block_size(self):
+        max_size = 2
+        blocks_1 = SortedBlockingTest.blocks(self.block_keys_1)
+        blocks_2 = SortedBlockingTest.blocks(self.block_keys_2)
+
+        expected = set()
+        oversized = {}
+        for block_key, ids in blocks_1.items():
+            others = blocks_2.get(block_key, set())
+            if len(others) > max_size:
+                oversized[block_key] = (len(others), len(ids) * len(others))
+            else:
+                expected.update(itertools.product(ids, others))
+
+        assert oversized
+
+        for backend in self.backends:
+            if isinstance(backend, dedupe.backends.SortedArrayBackend):
+                key_of = dedupe.sorted_blocking.hash_block_key
+            else:
+
+                def key_of(block_key):
+                    return block_key
+
+            backend.index(self.block_keys_2, self.ids_2)
+            pairs = list(backend.search(self.block_keys_1, self.ids_1, max_size))
+            assert len(pairs) == len(expected)
+            assert set(pairs) == expected
+            assert {
+                block.block_key: (block.n_records, block.n_pairs)
+                for block in backend.oversized_blocks
+            } == {key_of(k): sizes for k, sizes in oversized.items()}
+
+    def test_hashed_block_keys(self):
+        def hashed(block_keys):
+            return [
+                (dedupe.blocking.hash_block_key(0, block_key), record_id)
+                for block_key, record_id in block_keys
+            ]
+
+        for backend in self.backends:
+            pairs = list(backend.pairs(hashed(self.block_keys_1), self.ids_1))
+            assert len(pairs) == len(self.dedupe_pairs)
+            assert set(pairs) == self.dedupe_pairs
+
+            pairs = list(
+                backend.link_pairs(
+                    hashed(self.block_keys_1),
+                    self.ids_1,
+                    hashed(self.block_keys_2),
+                    self.ids_2,
+                )
+            )
+            assert len(pairs) == len(self.link_pairs)
+            assert set(pairs) == self.link_pairs
+
+            backend.index(hashed(self.block_keys_2), self.ids_2)
+            pairs = list(backend.search(hashed(self.block_keys_1), self.ids_1))
+            assert set(pairs) == self.link_pairs
+
+    def test_abstract(self):
+        class PairsOnly(dedupe.backends.BlockingBackend):
+            def pairs(self, block_keys, record_ids, max_block_size=None):
+                return iter(())
+
+        with self.assertRaises(TypeError):
+            PairsOnly()
+
+    def test_oversized_blocks_per_backend(self):
+        backend, other = self.backends[0], self.backends[1]
+        assert backend._oversized is not other._oversized
+
+        list(backend.pairs(self.block_keys_1, self.ids_1, 4))
+
+        assert backend.oversized_blocks
+        assert other.oversized_blocks == []
+
+    def test_sqlite_index_directory(self):
+        backend = dedupe.backends.SQLiteBackend()
+        assert backend._temp_dir is None
+
+        list(backend.pairs(self.block_keys_1, self.ids_1))
+        assert backend._temp_dir is None
+
+        backend.index(self.block_keys_2, self.ids_2)
+        directory = backend._temp_dir.name
+        assert os.path.exists(directory)
+
+        backend.close()
+        assert backend._temp_dir is None
+        assert not os.path.exists(directory)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,15 @@
+import itertools
+import os
+import pickle
+import queue
 import random
+import tempfile
 import unittest
 
 import numpy
 import scipy.special
+import sklearn.linear_model
+import sklearn.model_selection
 
 import dedupe
 
@@ -16,6 +23,10 @@ class MockClassifier:
         return scipy.special.expit(examples * self.weight + self.bias)
 
 
+def failing_featurizer(record_pairs):
+    raise ValueError("bad record")
+
+
 class ScoreDuplicates(unittest.TestCase):
     def setUp(self):
         random.seed(123)
@@ -101,6 +112,252 @@ class ScoreDuplicates(unittest.TestCase):
         numpy.testing.assert_equal(scores["pairs"], expected["pairs"])
         numpy.testing.assert_allclose(scores["score"], expected["score"], 2)
 
+    def test_score_duplicates_threshold(self):
+        scores = dedupe.core.scoreDuplicates(
+            self.records, self.data_model.distances, self.classifier, 2, threshold=0.8
+        )
+
+        expected = self.desired_scored_pairs[[0, 1, 4]]
+
+        numpy.testing.assert_equal(scores["pairs"], expected["pairs"])
+        numpy.testing.assert_allclose(scores["score"], expected["score"], 2)
+
+    def test_score_duplicates_record_stores(self):
+        records = dict(itertools.chain.from_iterable(self.records))
+        store = dedupe.core.RecordStore(records.items())
+        codes = store.codes()
+
+        code_pairs = iter(
+            [
+                (codes[a], codes[b])
+                for a, b in self.desired_scored_pairs["pairs"].tolist()
+            ]
+        )
+
+        try:
+            scores = dedupe.core.scoreDuplicates(
+                code_pairs,
+                self.data_model.distances,
+                self.classifier,
+                2,
+                record_stores=(store, store),
+            )
+        finally:
+            store.close()
+
+        assert scores.dtype["pairs"].base == numpy.int32
+
+        scores = dedupe.core.decode_scores(scores, store.ids, store.ids)
+
+        numpy.testing.assert_equal(scores["pairs"], self.desired_scored_pairs["pairs"])
+        numpy.testing.assert_allclose(
+            scores["score"], self.desired_scored_pairs["score"], 2
+        )
+
+    def test_decode_scores(self):
+        dtype = [("pairs", "i4", 2), ("score", "f4")]
+        scores = numpy.array([((0, 2), 0.5), ((1, 0), 0.25)], dtype=dtype)
+
+        decoded = dedupe.core.decode_scores(scores, ["a", "b", "c"], ["x", "y", "z"])
+
+        assert decoded["pairs"].tolist() == [["a", "z"], ["b", "x"]]
+        numpy.testing.assert_equal(decoded["score"], scores["score"])
+
+        decoded = dedupe.core.decode_scores(scores, [10, 11, 12], [10, 11, 12])
+
+        assert decoded.dtype["pairs"].base == int
+        assert decoded["pairs"].tolist() == [[10, 12], [11, 10]]
+
+    def test_score_duplicates_pool(self):
+        records = list(self.records)
+
+        with dedupe.core.ScoringPool(
+            self.data_model.distances, self.classifier, 2
+        ) as pool:
+            for _ in range(2):
+                scores = dedupe.core.scoreDuplicates(
+                    iter(records), None, None, pool=pool
+                )
+                numpy.testing.assert_equal(
+                    numpy.sort(scores["pairs"], axis=0),
+                    numpy.sort(self.desired_scored_pairs["pairs"], axis=0),
+                )
+
+            assert not pool.closed
+
+        assert pool.closed
+        with self.assertRaises(ValueError):
+            dedupe.core.scoreDuplicates(iter(records), None, None, pool=pool)
+
+    def test_score_duplicates_pool_errors(self):
+        records = list(self.records)
+
+        with dedupe.core.ScoringPool(failing_featurizer, self.classifier, 2) as pool:
+            # the workers survive errors, so the pool can still be used
+            for _ in range(2):
+                with self.assertRaises(ChildProcessError):
+                    dedupe.core.scoreDuplicates(iter(records), None, None, pool=pool)
+            assert not pool.closed
+
+    def test_score_gazette_streams(self):
+        records = list(self.records)
+        consumed = []
+
+        def blocks():
+            for i in range(50):
+                consumed.append(i)
+                yield [records[i % len(records)]]
+
+        with dedupe.core.ScoringPool(
+            self.data_model.distances, self.classifier, 2
+        ) as pool:
+            scored_blocks = dedupe.core.scoreGazette(
+                blocks(),
+                None,
+                None,
+                pool=pool,
+                chunk_sizer=dedupe.core.ChunkSizer(min_size=1, max_size=1),
+            )
+            first = next(scored_blocks)
+            # scores come back before all the blocks are read
+            assert len(consumed) < 50
+
+            scored = [first] + list(scored_blocks)
+            assert len(scored) == 50
+            assert not pool.closed
+
+
+class CompileClassifier(unittest.TestCase):
+    def setUp(self):
+        random.seed(123)
+        self.X = numpy.array(
+            [[random.random() for _ in range(3)] for _ in range(50)], dtype="f4"
+        )
+        self.y = (self.X.sum(axis=1) > 1.5).astype(int)
+
+    def test_logistic_regression(self):
+        classifier = sklearn.linear_model.LogisticRegression().fit(self.X, self.y)
+        scorer = dedupe.core.compile_classifier(classifier)
+
+        assert isinstance(scorer, dedupe.core.LinearScorer)
+        numpy.testing.assert_allclose(
+            scorer.predict_proba(self.X), classifier.predict_proba(self.X), rtol=1e-5
+        )
+
+    def test_grid_search(self):
+        classifier = sklearn.model_selection.GridSearchCV(
+            estimator=sklearn.linear_model.LogisticRegression(),
+            param_grid={"C": [0.1, 1]},
+        ).fit(self.X, self.y)
+        scorer = dedupe.core.compile_classifier(classifier)
+
+        assert isinstance(scorer, dedupe.core.LinearScorer)
+        numpy.testing.assert_allclose(
+            scorer.predict_proba(self.X)[:, -1],
+            classifier.predict_proba(self.X)[:, -1],
+            rtol=1e-5,
+        )
+
+    def test_other_classifiers(self):
+        classifier = MockClassifier()
+        assert dedupe.core.compile_classifier(classifier) is classifier
+
+        unfitted = sklearn.linear_model.LogisticRegression()
+        assert dedupe.core.compile_classifier(unfitted) is unfitted
+
+
+class ChunkSizerTest(unittest.TestCase):
+    def test_target_latency(self):
+        sizer = dedupe.core.ChunkSizer(min_size=10, max_size=10000, initial_size=100)
+
+        # chunks are much faster than the target, so they grow, but
+        # only by a factor of two at a time
+        sizer.observe(100, 0.005)
+        assert sizer.size == 200
+        for _ in range(10):
+            sizer.observe(sizer.size, sizer.size * 0.00005)
+        assert sizer.size == 10000
+
+        # expensive comparisons shrink the chunks
+        for _ in range(10):
+            sizer.observe(sizer.size, sizer.size * 0.01)
+        assert sizer.size == 50
+
+        sizer.observe(0, 1)
+        assert sizer.size == 50
+
+    def test_max_bytes(self):
+        sizer = dedupe.core.ChunkSizer(min_size=10, max_bytes=10000, initial_size=1000)
+        sizer.observe_bytes([(str(i) * 1000, str(i) * 1000) for i in range(10)])
+
+        assert sizer.next_size() == 10
+        assert list(sizer.sizes) == [10]
+
+    def test_fill_queue(self):
+        sizer = dedupe.core.ChunkSizer(min_size=1, initial_size=3)
+        chunks = queue.Queue()
+
+        dedupe.core.fillQueue(chunks, range(8), 2, chunk_sizer=sizer, item_bytes=1)
+
+        assert list(chunks.queue) == [(0, 1, 2), (3, 4, 5), (6, 7), None, None]
+        assert sizer.bytes_per_item == 1
+
+
+class MergeShards(unittest.TestCase):
+    def test_merge_shards(self):
+        dtype = numpy.dtype([("pairs", int, 2), ("score", "f4")])
+        shards = [
+            numpy.array([((1, 2), 0.5), ((1, 3), 0.25)], dtype=dtype),
+            numpy.array([], dtype=dtype),
+            numpy.array([((2, 3), 0.75)], dtype=dtype),
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shard_paths = []
+            for i, shard in enumerate(shards):
+                shard_path = os.path.join(temp_dir, "shard_%d" % i)
+                shard.tofile(shard_path)
+                shard_paths.append(shard_path)
+
+            merged_path = os.path.join(temp_dir, "merged")
+            dedupe.core.merge_shards(shard_paths, merged_path)
+
+            merged = numpy.fromfile(merged_path, dtype=dtype)
+
+        numpy.testing.assert_equal(merged, numpy.concatenate(shards))
+
+
+class RecordStoreTest(unittest.TestCase):
+    def test_lookup(self):
+        records = [("a", {"name": "Bob"}), ("b", {"name": None}), ("c", {})]
+
+        with dedupe.core.RecordStore(records) as store:
+            assert len(store) == 3
+            assert store.codes() == {"a": 0, "b": 1, "c": 2}
+            assert store[1] == {"name": None}
+            assert list(store.items()) == records
+
+            assert store.code_type() == "i4"
+
+            unpickled = pickle.loads(pickle.dumps(store))
+            assert [unpickled[code] for code in range(3)] == [
+                record for _, record in records
+            ]
+            del unpickled
+
+            path = store.path
+
+        assert not os.path.exists(path)
+
+    def test_in_memory(self):
+        records = [("a", {"name": "Bob"}), ("b", {"name": None})]
+
+        with dedupe.core.RecordStore(records, in_memory=True) as store:
+            assert store.path is None
+            assert len(store) == 2
+            assert store.codes() == {"a": 0, "b": 1}
+            assert store[0] is records[0][1]
+
 
 class FieldDistances(unittest.TestCase):
     def test_exact_comparator(self):
@@ -153,6 +410,316 @@ class FieldDistances(unittest.TestCase):
             3,
         )
 
+    def test_comparator_missing(self):
+        deduper = dedupe.Dedupe(
+            [
+                {"field": "name", "type": "Exact", "has missing": True},
+                {"field": "price", "type": "Price"},
+            ]
+        )
+
+        record_pairs = (
+            ({"name": "steven", "price": 10}, {"name": None, "price": 1}),
+            ({"name": "steven", "price": None}, {"name": "steven", "price": 10}),
+            ({"name": None, "price": 10}, {"name": "jane", "price": 10}),
+        )
+
+        numpy.testing.assert_array_almost_equal(
+            deduper.data_model.distances(record_pairs),
+            numpy.array([[0, 1, 0], [1, 0, 1], [0, 0, 0]]),
+            3,
+        )
+
+    def test_batch_comparators(self):
+        deduper = dedupe.Dedupe(
+            [
+                {"field": "name", "type": "Exact"},
+                {"field": "price", "type": "Price"},
+                {"field": "location", "type": "LatLong"},
+                {"field": "type", "type": "Categorical", "categories": ["a", "b"]},
+                {"field": "phone", "type": "Exists"},
+            ]
+        )
+
+        records = (
+            {"name": "a", "price": 5, "location": (42.3, -71.1), "type": "a"},
+            {"name": "b", "price": 0, "location": (40.7, -74.0), "type": "b"},
+            {"name": "a", "price": 50, "location": (42.3, -71.0), "type": "a"},
+        )
+        for record, phone in zip(records, (None, "", "555-1234")):
+            record["phone"] = phone
+
+        record_pairs = list(itertools.product(records, repeat=2))
+
+        for var in deduper.data_model.primary_variables:
+            column_1 = [record_1[var.field] for record_1, _ in record_pairs]
+            column_2 = [record_2[var.field] for _, record_2 in record_pairs]
+
+            numpy.testing.assert_array_almost_equal(
+                numpy.asarray(var.batch_comparator(column_1, column_2)),
+                numpy.array([var.comparator(a, b) for a, b in zip(column_1, column_2)]),
+                5,
+            )
+
+    def test_comparator_cache(self):
+        deduper = dedupe.Dedupe(
+            [
+                {"field": "name", "type": "String", "cache size": 2},
+                {"field": "type", "type": "Categorical", "categories": ["a", "b"]},
+            ]
+        )
+        uncached = dedupe.Dedupe(
+            [
+                {"field": "name", "type": "String"},
+                {"field": "type", "type": "Categorical", "categories": ["a", "b"]},
+            ]
+        )
+
+        records = (
+            {"name": "steven", "type": "a"},
+            {"name": "stephen", "type": "b"},
+            {"name": None, "type": "a"},
+        )
+        record_pairs = list(itertools.product(records, repeat=2))
+
+        for _ in range(2):
+            numpy.testing.assert_array_almost_equal(
+                deduper.data_model.distances(record_pairs),
+                uncached.data_model.distances(record_pairs),
+            )
+
+        (name_cache,) = deduper.data_model.cache_info().values()
+        # four pairs of names are distinct and present in each round,
+        # and only two of them are kept between rounds
+        assert name_cache.misses == 6
+        assert name_cache.hits == 2
+        assert name_cache.currsize == name_cache.maxsize == 2
+
+        unpickled = pickle.loads(pickle.dumps(deduper.data_model))
+        (name_cache,) = unpickled.cache_info().values()
+        assert name_cache == (0, 0, 2, 0)
+
+    def test_no_pairs(self):
+        deduper = dedupe.Dedupe([{"field": "name", "type": "String"}])
+
+        assert deduper.data_model.distances(()).shape == (0, 1)
+
+
+class CascadeTest(unittest.TestCase):
+    def setUp(self):
+        self.data_model = dedupe.datamodel.DataModel(
+            [
+                {"field": "name", "variable name": "name", "type": "Exact"},
+                {
+                    "field": "address",
+                    "variable name": "address",
+                    "type": "String",
+                    "has missing": True,
+                },
+                {"field": "price", "type": "Price", "has missing": True},
+                {"type": "Interaction", "interaction variables": ["name", "address"]},
+            ]
+        )
+
+        rng = random.Random(1)
+        records = [
+            {
+                "name": rng.choice(["bob", "rob", None]),
+                "address": rng.choice(["1 main st", "1 main street", "", None]),
+                "price": rng.choice([1, 10, 12, None]),
+            }
+            for _ in range(12)
+        ]
+        self.record_pairs = list(itertools.product(records, repeat=2))
+
+    def test_upper_bound(self):
+        distances = self.data_model.distances(self.record_pairs)
+
+        rng = numpy.random.default_rng(2)
+        for _ in range(20):
+            coef = rng.normal(scale=3, size=distances.shape[1])
+            intercept = rng.normal()
+            cascade = dedupe.datamodel.Cascade(self.data_model, coef, intercept)
+
+            logits = distances @ coef + intercept
+            assert (cascade.upper_bound(self.record_pairs) >= logits - 1e-6).all()
+
+    def test_could_score_above(self):
+        distances = self.data_model.distances(self.record_pairs)
+
+        # names that match count for a lot more than anything else
+        coef = numpy.array([5.0, -1.0, -0.5, 0.0, 0.1, 0.2, 0.3])
+        intercept = -3.0
+        cascade = dedupe.datamodel.Cascade(self.data_model, coef, intercept)
+
+        scores = scipy.special.expit(distances @ coef + intercept)
+        keep = cascade.could_score_above(self.record_pairs, 0.5)
+
+        assert keep[scores > 0.5].all()
+        assert not keep.all()
+        assert cascade.pruned == len(keep) - keep.sum()
+        assert cascade.pairs == len(keep)
+
+        assert cascade.could_score_above(self.record_pairs, 0).all()
+
+    def test_score_duplicates(self):
+        coef = numpy.array([5.0, -1.0, -0.5, 0.0, 0.1, 0.2, 0.3])
+        intercept = -3.0
+        scorer = dedupe.core.LinearScorer(coef, intercept)
+        cascade = dedupe.datamodel.Cascade(self.data_model, coef, intercept)
+
+        record_pairs = [
+            ((i, record_1), (j, record_2))
+            for i, (record_1, record_2) in enumerate(self.record_pairs)
+            for j in [i + len(self.record_pairs)]
+        ]
+
+        scores = dedupe.core.scoreDuplicates(
+            record_pairs, self.data_model.distances, scorer, 1, threshold=0.5
+        )
+        pruned_scores = dedupe.core.scoreDuplicates(
+            record_pairs,
+            self.data_model.distances,
+            scorer,
+            1,
+            threshold=0.5,
+            cascade=cascade,
+        )
+
+        numpy.testing.assert_array_equal(scores["pairs"], pruned_scores["pairs"])
+        numpy.testing.assert_array_equal(scores["score"], pruned_scores["score"])
+        assert cascade.pruned > 0
+
+
+class FeaturePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.data_model_definition = [
+            {"field": "name", "variable name": "name", "type": "Exact"},
+            {"field": "address", "variable name": "address", "type": "String"},
+            {"field": "price", "type": "Price", "has missing": True},
+            {"field": "city", "variable name": "city", "type": "Exact"},
+            {"type": "Interaction", "interaction variables": ["name", "city"]},
+        ]
+        self.data_model = dedupe.datamodel.DataModel(self.data_model_definition)
+
+        records = (
+            {"name": "bob", "address": "1 main st", "price": 1, "city": "a"},
+            {"name": "rob", "address": "1 main street", "price": None, "city": "a"},
+            {"name": "bob", "address": None, "price": 12, "city": "b"},
+        )
+        self.record_pairs = list(itertools.product(records, repeat=2))
+
+    def test_skipped_variables(self):
+        # columns: name, address, price, city, name * city, price present
+        coef = numpy.array([1.0, 0.0, 0.0, 0.0, 2.0, 0.0])
+        plan = dedupe.datamodel.FeaturePlan(self.data_model, coef)
+        assert [var.name for var in plan.skipped_variables] == [
+            "address",
+            "(price: Price)",
+        ]
+
+        distances = self.data_model.distances(self.record_pairs)
+        planned = plan(self.record_pairs)
+        numpy.testing.assert_array_equal(planned @ coef, distances @ coef)
+
+        coef = numpy.array([1.0, 0.0, 0.0, 0.0, 0.0, 0.5])
+        plan = dedupe.datamodel.FeaturePlan(self.data_model, coef)
+        assert [var.name for var in plan.skipped_variables] == ["address", "city"]
+        numpy.testing.assert_array_equal(
+            plan(self.record_pairs) @ coef,
+            self.data_model.distances(self.record_pairs) @ coef,
+        )
+
+    def test_matcher(self):
+        deduper = dedupe.Dedupe(self.data_model_definition)
+        deduper.classifier = dedupe.core.LinearScorer(
+            numpy.array([1.0, 1e-5, -1.0, 0.0, 2.0, 0.5]), -1.0
+        )
+
+        assert deduper._featurizer == deduper.data_model.distances
+
+        deduper.negligible_weight = 1e-3
+        assert isinstance(deduper._featurizer, dedupe.datamodel.FeaturePlan)
+        assert [var.name for var in deduper._featurizer.skipped_variables] == [
+            "address"
+        ]
+        assert deduper._scorer.coef[1] == 0
+
+    def test_trained_scores(self):
+        rng = random.Random(3)
+        names = ["".join(rng.choices("abcdefgh", k=8)) for _ in range(200)]
+
+        # the city says nothing about a match, and is mostly the same
+        def record(name):
+            city = "springfield" if rng.random() < 0.9 else "shelbyville"
+            return {"name": name, "city": city}
+
+        def typo(name):
+            i = rng.randrange(len(name))
+            return name[:i] + rng.choice("xyz") + name[i + 1 :]
+
+        # matches share a name, with a typo at most, whatever their city
+        pairs, labels = [], []
+        for name in names:
+            pairs.append((record(name), record(typo(name))))
+            labels.append(1)
+            pairs.append((record(name), record(rng.choice(names))))
+            labels.append(0)
+
+        deduper = dedupe.Dedupe(
+            [
+                {"field": "name", "type": "String"},
+                {"field": "city", "type": "String"},
+            ],
+            num_cores=1,
+        )
+        distances = deduper.data_model.distances(pairs)
+        deduper.classifier = sklearn.linear_model.LogisticRegression().fit(
+            distances, labels
+        )
+        coef = deduper.classifier.coef_[0]
+        assert 0 < abs(coef[1]) < abs(coef[0])
+
+        record_pairs = [((i, a), (i + 0.5, b)) for i, (a, b) in enumerate(pairs)]
+        scores = deduper.score(record_pairs)["score"]
+
+        deduper.negligible_weight = abs(coef[1])
+        assert [var.name for var in deduper._featurizer.skipped_variables] == [
+            "(city: String)"
+        ]
+        pruned_scores = deduper.score(record_pairs)["score"]
+
+        # scores only change much for the few pairs of different cities
+        # that are close calls
+        changes = numpy.abs(scores - pruned_scores)
+        assert changes.max() <= abs(coef[1]) * distances[:, 1].max() / 4 + 1e-6
+        assert (changes < 0.01).mean() > 0.99
+
+    def test_refit_classifier(self):
+        deduper = dedupe.Dedupe([{"field": "name", "type": "String"}], num_cores=2)
+        pairs = [
+            ({"name": "bob"}, {"name": "bob"}),
+            ({"name": "bob"}, {"name": "alice"}),
+        ] * 5
+        distances = deduper.data_model.distances(pairs)
+        deduper.classifier = sklearn.linear_model.LogisticRegression()
+        deduper.classifier.fit(distances, [1, 0] * 5)
+
+        record_pairs = [((i, a), (i + 0.5, b)) for i, (a, b) in enumerate(pairs)]
+        scores = deduper.score(record_pairs)["score"]
+        assert scores[0] > scores[1]
+
+        # the same classifier, fit again outside of train()
+        deduper.classifier.fit(distances, [0, 1] * 5)
+        refit_scores = deduper.score(record_pairs)["score"]
+        assert refit_scores[0] < refit_scores[1]
+
+        deduper.classifier.coef_[:] = 0
+        deduper.classifier.intercept_[:] = 0
+        numpy.testing.assert_allclose(deduper.score(record_pairs)["score"], 0.5)
+
+        deduper.close()
+
 
 class Unique(unittest.TestCase):
     def test_unique(self):
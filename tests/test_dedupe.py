@@ -208,6 +208,33 @@ class ClusteringTest(unittest.TestCase):
             (b"1", b"2", b"3", b"4", b"5"),
         )
 
+    def test_incremental(self):
+        clusters = dedupe.clustering.IncrementalClusters(0.5)
+
+        earlier = (self.dupes["pairs"] < 4).all(axis=1)
+        changed = clusters.update(4, self.dupes[earlier])
+        assert sorted(codes for codes, _ in changed) == [(0,), (1, 2, 3)]
+
+        # the new pairs connect to the cluster of 1, 2 and 3, so it is
+        # clustered again
+        changed = clusters.update(12, self.dupes[~earlier])
+        assert sorted(codes for codes, _ in changed) == [
+            (1, 2, 3),
+            (4, 5),
+            (6,),
+            (7,),
+            (8,),
+            (9,),
+            (10, 11),
+        ]
+
+        expected = list(dedupe.clustering.cluster(self.dupes, 0.5))
+        expected += [((code,), (1.0,)) for code in (0, 6, 7, 8, 9)]
+        assert [codes for codes, _ in sorted(clusters.all_clusters())] == [
+            codes for codes, _ in sorted(expected)
+        ]
+        assert self.clusterEquals(sorted(clusters.all_clusters()), sorted(expected))
+
     def test_greedy_matching(self):
         greedyMatch = dedupe.clustering.greedyMatching
 
@@ -5,6 +5,7 @@ import pytest
 
 from dedupe import datamodel, labeler
 from dedupe._typing import RecordDictPair
+from dedupe.predicates import SortedNeighborhoodPredicate
 
 SAMPLE = {
     1: {"name": "Meredith", "age": "40"},
@@ -55,6 +56,26 @@ class ActiveLearningTest(unittest.TestCase):
         with pytest.raises(IndexError):
             active_learner.pop()
 
+    def test_neighborhood_predicates(self):
+        data_model = datamodel.DataModel(
+            [{"field": "name", "type": "String", "neighborhood": True}]
+        )
+        predicates = data_model.predicates
+        neighborhood = {
+            predicate
+            for predicate in predicates
+            if isinstance(predicate, SortedNeighborhoodPredicate)
+        }
+        assert neighborhood
+        assert not any(
+            isinstance(predicate, SortedNeighborhoodPredicate)
+            for predicate in self.data_model.predicates
+        )
+
+        for canopies in (True, False):
+            filtered = labeler._filter_canopy_predicates(predicates, canopies)
+            assert neighborhood <= filtered
+
 
 if __name__ == "__main__":
     unittest.main()
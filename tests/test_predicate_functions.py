@@ -317,3 +317,20 @@ class TestPredicateFunctions(unittest.TestCase):
         assert fn.twoGramFingerprint("1") == frozenset()
         assert fn.commonTwoTokens("foo bar") == {"foo bar"}
         assert fn.commonTwoTokens("foo") == frozenset()
+
+    def test_token_predicates(self):
+        fields = [
+            "donald",
+            "don ald",
+            "1316 N 23rd St",
+            "do\nal d",
+            "go-of y  ",
+            " cip   ciop ",
+            "0001 x 99",
+            "Thompson Thomas",
+            "a",
+            "x y z w",
+        ]
+        for func, token_func in fn.TOKEN_PREDICATES.items():
+            for field in fields:
+                assert token_func(fn.Tokens(field)) == func(field), (func, field)
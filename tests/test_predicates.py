@@ -1,7 +1,9 @@
+import collections
 import unittest
 
 from future.builtins import str
 
+import dedupe
 from dedupe import predicates
 
 
@@ -136,5 +138,61 @@ class TestCompoundPredicate(unittest.TestCase):
         }
 
 
+class TestSortedNeighborhood(unittest.TestCase):
+    def setUp(self):
+        self.names = ["name %02d" % i for i in range(40)]
+        self.fingerprinter = dedupe.blocking.Fingerprinter(
+            [predicates.FieldNeighborhoodPredicate(8, "name")]
+        )
+        self.fingerprinter.index(self.names, "name")
+        (self.predicate,) = self.fingerprinter.predicates
+
+    def test_bounded_blocks(self):
+        blocks = collections.defaultdict(set)
+        for name in self.names:
+            keys = self.predicate({"name": name})
+            assert len(keys) == 2
+            for key in keys:
+                blocks[key].add(name)
+
+        assert max(len(block) for block in blocks.values()) <= 8
+
+        # neighbors at most half a window apart always share a block
+        for i, name in enumerate(self.names[:-4]):
+            assert self.predicate({"name": name}) & self.predicate(
+                {"name": self.names[i + 4]}
+            )
+
+        assert not self.predicate({"name": "name 00"}) & self.predicate(
+            {"name": "name 20"}
+        )
+
+    def test_unindexed(self):
+        assert self.predicate({"name": "name 00"}) == self.predicate(
+            {"name": "Name, 00"}, target=True
+        )
+        assert self.predicate({"name": "name 101"}) & self.predicate(
+            {"name": "name 10"}
+        )
+        assert self.predicate({"name": ""}) == frozenset()
+
+    def test_reversed(self):
+        reverse = predicates.ReversedNeighborhoodPredicate(4, "name")
+        fingerprinter = dedupe.blocking.Fingerprinter([reverse])
+        fingerprinter.index(["Jones", "Smith", "Brown", "Taylor", "Smyth"], "name")
+
+        assert reverse({"name": "Xmith"}) & reverse({"name": "Smith"})
+        assert not reverse({"name": "Xmith"}) & reverse({"name": "Jones"})
+
+    def test_no_index(self):
+        predicate = predicates.TokenNeighborhoodPredicate(4, "name")
+        with self.assertRaises(predicates.NoIndexError):
+            predicate({"name": "bob"})
+
+        self.predicate.freeze([{"name": "name 00"}])
+        assert self.predicate.index is None
+        assert self.predicate({"name": "name 00"})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 
+import numpy
+
 from dedupe.variables.price import PriceType
 
 
@@ -7,3 +9,9 @@ class TestPrice(unittest.TestCase):
     def test_comparator(self):
         assert PriceType.comparator(1, 10) == 1
         assert PriceType.comparator(10, 1) == 1
+
+    def test_batch_comparator(self):
+        numpy.testing.assert_array_almost_equal(
+            PriceType.batch_comparator([1, 10, 0, 5], [10, 1, 10, -5]),
+            numpy.array([1, 1, numpy.nan, numpy.nan]),
+        )
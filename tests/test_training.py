@@ -61,6 +61,24 @@ class TrainingTest(unittest.TestCase):
             )
         )
 
+    def test_neighborhood_learned(self):
+        names = ["Smith", "Jones", "Taylor", "Brown", "Wilson", "Walker", "Wright"]
+        data = {i: {"name": name} for i, name in enumerate(names)}
+        data[len(names)] = {"name": "Xmith"}
+        matches = [({"name": "Xmith"}, {"name": "Smith"})]
+        predicates = [
+            dedupe.predicates.StringPredicate(
+                dedupe.predicates.firstTokenPredicate, "name"
+            ),
+            dedupe.predicates.ReversedNeighborhoodPredicate(4, "name"),
+        ]
+
+        learner = training.DedupeBlockLearner(predicates, data, data)
+        assert learner.learn(matches, 1.0, True) == (predicates[1],)
+
+        learner = training.RecordLinkBlockLearner(predicates, data, data, data)
+        assert learner.learn(matches, 1.0, True) == (predicates[1],)
+
     def test_uncovered_by(self):
         before = {1: frozenset({1, 2, 3}), 2: frozenset({1, 2}), 3: frozenset({3})}
         after = {1: frozenset({1, 2}), 2: frozenset({1, 2})}